@@ -0,0 +1,129 @@
+"""Deterministic weighted A/B assignment.
+
+Running tests are loaded once into ``CompiledTest`` tables of cumulative
+weights and cached. Assigning a visitor hashes ``test_key:visitor_id`` to a
+point in [0, total_weight) and bisects the table, so it needs no database
+access, is sticky for as long as the visitor cookie lives, and costs a hash
+plus a binary search per running test.
+
+Variant config, all keys optional:
+
+    {"key": "b", "weight": 30,
+     "quiz": {"name": "...", "description": "..."},
+     "design": {"primary-color": "#16a34a"}}
+"""
+import bisect
+import hashlib
+import os
+import secrets
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import db_models
+from .cache import TTLCache
+from .models import ABTestStatus
+
+VISITOR_COOKIE_NAME = "quiz_visitor"
+VISITOR_MAX_AGE = 60 * 60 * 24 * 365
+AB_TEST_CACHE_TTL = float(os.getenv("AB_TEST_CACHE_TTL", "60"))
+
+
+@dataclass(frozen=True)
+class CompiledTest:
+    test_key: str
+    quiz_id: int
+    variant_keys: Tuple[str, ...]
+    cumulative_weights: Tuple[float, ...]
+    variants: Mapping[str, Mapping]
+
+    @property
+    def total_weight(self) -> float:
+        return self.cumulative_weights[-1]
+
+    def assign(self, visitor_id: str) -> str:
+        digest = hashlib.blake2b(f"{self.test_key}:{visitor_id}".encode(), digest_size=8).digest()
+        point = int.from_bytes(digest, "big") / 2 ** 64 * self.total_weight
+        return self.variant_keys[bisect.bisect_right(self.cumulative_weights, point)]
+
+
+def compile_test(test: db_models.ABTest) -> Optional[CompiledTest]:
+    keys, cumulative, variants = [], [], {}
+    running_total = 0.0
+    for index, variant in enumerate(test.variants or []):
+        weight = float(variant.get("weight", 0))
+        if weight <= 0:
+            continue
+        key = str(variant.get("key", index))
+        running_total += weight
+        keys.append(key)
+        cumulative.append(running_total)
+        variants[key] = MappingProxyType(dict(variant))
+    if not keys:
+        return None
+    return CompiledTest(
+        test_key=test.test_key,
+        quiz_id=test.quiz_id,
+        variant_keys=tuple(keys),
+        cumulative_weights=tuple(cumulative),
+        variants=MappingProxyType(variants),
+    )
+
+
+# A single entry holding {quiz_id: (CompiledTest, ...)} for every running test
+_cache = TTLCache(maxsize=1, ttl=AB_TEST_CACHE_TTL)
+
+
+async def running_tests(db: AsyncSession, quiz_id: int) -> Tuple[CompiledTest, ...]:
+    by_quiz = _cache.get("running")
+    if by_quiz is None:
+        rows = await db.scalars(
+            select(db_models.ABTest).where(
+                db_models.ABTest.status == ABTestStatus.RUNNING.value,
+                db_models.ABTest.is_active == True,  # noqa: E712
+            ).order_by(db_models.ABTest.id)
+        )
+        grouped: Dict[int, list] = {}
+        for row in rows:
+            compiled = compile_test(row)
+            if compiled is not None:
+                grouped.setdefault(row.quiz_id, []).append(compiled)
+        by_quiz = {key: tuple(tests) for key, tests in grouped.items()}
+        _cache.set("running", by_quiz)
+    return by_quiz.get(quiz_id, ())
+
+
+def invalidate_ab_tests() -> None:
+    _cache.clear()
+
+
+def visitor_id(request: Request) -> Tuple[str, bool]:
+    """The visitor's stable id and whether it was just issued (cookie must be set)."""
+    existing = request.cookies.get(VISITOR_COOKIE_NAME)
+    if existing:
+        return existing, False
+    return secrets.token_urlsafe(16), True
+
+
+def set_visitor_cookie(response: Response, value: str) -> None:
+    response.set_cookie(VISITOR_COOKIE_NAME, value, max_age=VISITOR_MAX_AGE, httponly=True, samesite="lax")
+
+
+def assign_all(tests: Tuple[CompiledTest, ...], visitor: str) -> Dict[str, str]:
+    return {test.test_key: test.assign(visitor) for test in tests}
+
+
+def variant_overrides(tests: Tuple[CompiledTest, ...], assignments: Mapping[str, str]) -> Tuple[dict, dict]:
+    """Merge the quiz and design overrides of every assigned variant, in test order."""
+    quiz_overrides: dict = {}
+    design: dict = {}
+    for test in tests:
+        variant = test.variants.get(assignments.get(test.test_key))
+        if variant:
+            quiz_overrides.update(variant.get("quiz") or {})
+            design.update(variant.get("design") or {})
+    return quiz_overrides, design
@@ -0,0 +1,137 @@
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import db_models
+from .cache import TTLCache
+
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "30"))
+
+# Dashboard numbers are allowed to lag by a few seconds; refreshes within the TTL never hit the DB
+_cache = TTLCache(maxsize=1024, ttl=ANALYTICS_CACHE_TTL)
+
+
+async def _cached(key, compute):
+    value = _cache.get(key)
+    if value is None:
+        value = await compute()
+        _cache.set(key, value)
+    return value
+
+
+async def top_quizzes(db: AsyncSession, limit: int = 5) -> List[Dict[str, Any]]:
+    async def compute():
+        totals = (
+            select(db_models.DailyQuizStats.quiz_id, func.sum(db_models.DailyQuizStats.leads).label("leads"))
+            .group_by(db_models.DailyQuizStats.quiz_id)
+            .subquery()
+        )
+        lead_count = func.coalesce(totals.c.leads, 0).label("lead_count")
+        rows = await db.execute(
+            select(db_models.Quiz.id, db_models.Quiz.name, db_models.Quiz.slug, lead_count)
+            .outerjoin(totals, totals.c.quiz_id == db_models.Quiz.id)
+            .order_by(lead_count.desc(), db_models.Quiz.id)
+            .limit(limit)
+        )
+        return [{"id": r.id, "name": r.name, "slug": r.slug, "lead_count": r.lead_count} for r in rows]
+
+    return await _cached(("top_quizzes", limit), compute)
+
+
+async def leads_per_day(db: AsyncSession, quiz_id: int = None, days: int = 7) -> List[Dict[str, Any]]:
+    """Lead counts for each of the last ``days`` days, oldest first, with empty days filled in."""
+
+    async def compute():
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+        stats = db_models.DailyQuizStats
+        query = (
+            select(stats.day, func.sum(stats.leads).label("leads"))
+            .where(stats.day >= since)
+            .group_by(stats.day)
+        )
+        if quiz_id is not None:
+            query = query.where(stats.quiz_id == quiz_id)
+        counts = {r.day: r.leads for r in await db.execute(query)}
+        return [
+            {"day": (since + timedelta(days=offset)).isoformat(), "leads": counts.get(since + timedelta(days=offset), 0)}
+            for offset in range(days)
+        ]
+
+    return await _cached(("leads_per_day", quiz_id, days), compute)
+
+
+async def funnel(db: AsyncSession, quiz_id: int = None) -> Dict[str, Any]:
+    """Starts, completions and per-question reach, read from the rollup tables.
+
+    Each step counts the distinct sessions that answered the question, so
+    drop-off is the difference between consecutive steps. ``answers`` is the
+    raw answer volume, which also counts sessions answering again.
+    """
+
+    async def compute():
+        stats = db_models.DailyQuizStats
+        totals_query = select(
+            func.coalesce(func.sum(stats.starts), 0).label("starts"),
+            func.coalesce(func.sum(stats.completions), 0).label("completions"),
+        )
+        if quiz_id is not None:
+            totals_query = totals_query.where(stats.quiz_id == quiz_id)
+        totals = (await db.execute(totals_query)).one()
+
+        steps = []
+        if quiz_id is not None:
+            reached = dict((await db.execute(
+                select(db_models.QuestionReach.question_id, db_models.QuestionReach.sessions)
+                .where(db_models.QuestionReach.quiz_id == quiz_id)
+            )).all())
+            answered = dict((await db.execute(
+                select(db_models.AnswerCount.question_id, func.sum(db_models.AnswerCount.count))
+                .where(db_models.AnswerCount.quiz_id == quiz_id)
+                .group_by(db_models.AnswerCount.question_id)
+            )).all())
+            questions = await db.execute(
+                select(db_models.QuizQuestion.id, db_models.QuizQuestion.question_text)
+                .where(db_models.QuizQuestion.quiz_id == quiz_id)
+                .order_by(db_models.QuizQuestion.question_order)
+            )
+            previous = totals.starts
+            for q in questions:
+                count = reached.get(q.id, 0)
+                steps.append({
+                    "question_id": q.id,
+                    "question_text": q.question_text,
+                    "sessions": count,
+                    "answers": answered.get(q.id, 0),
+                    "drop_off": max(previous - count, 0),
+                })
+                previous = count
+
+        return {
+            "starts": totals.starts,
+            "completions": totals.completions,
+            "completion_rate": (totals.completions / totals.starts * 100) if totals.starts else 0,
+            "steps": steps,
+        }
+
+    return await _cached(("funnel", quiz_id), compute)
+
+
+async def answer_distribution(db: AsyncSession, quiz_id: int) -> Dict[int, Dict[str, int]]:
+    async def compute():
+        distribution: Dict[int, Dict[str, int]] = {}
+        rows = await db.execute(
+            select(db_models.AnswerCount.question_id, db_models.AnswerCount.answer_value, db_models.AnswerCount.count)
+            .where(db_models.AnswerCount.quiz_id == quiz_id)
+        )
+        for question_id, value, count in rows:
+            distribution.setdefault(question_id, {})[value] = count
+        return distribution
+
+    return await _cached(("answer_distribution", quiz_id), compute)
+
+
+def clear_cache() -> None:
+    _cache.clear()
@@ -0,0 +1,225 @@
+"""Hidden-field and UTM capture.
+
+Each quiz's ``hidden_field`` settings, plus the standard ``ATTRIBUTION_PARAMS``
+(UTM parameters and ad click ids), are compiled once per settings version
+into an ``Extractor``. The extractor reads values straight from the query
+string, cookies, headers or a constant, without re-interpreting the
+definitions on every request.
+
+The intro page parks what it captured in a short-lived cookie, since it is
+served from the page cache. ``/start`` merges that cookie with its own query
+string and writes the result into the new ``QuizSession.hidden_data``. The
+lead form copies it from the session, so question pages never look at it.
+
+Values are dictionary-encoded. Each distinct (field, value) pair is stored
+once in ``hidden_values``, and sessions and leads keep only a sorted list of
+those ids, so a million leads from one campaign do not repeat its UTM
+strings. Ad click ids (``ATTRIBUTION_INLINE_PARAMS``) are unique per visit
+and would only grow the dictionary, so they follow the ids inline as
+``[field, value]`` pairs. Rows in ``hidden_values`` never change, so the
+id <-> value maps are cached in-process. Looking an id up in the database
+bumps its ``last_seen_at``, and the value -> id map keeps an entry for at most
+``HIDDEN_VALUE_ID_TTL`` seconds. ``app.retention`` deletes rows nothing refers
+to and nobody has looked up for longer than that, then publishes a
+``hidden_values`` invalidation.
+"""
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Set, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from fastapi import Request, Response
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import db_models
+from .cache import TTLCache
+from .quiz_settings import QuizConfig
+
+logger = logging.getLogger(__name__)
+
+ATTRIBUTION_PARAMS = tuple(
+    p.strip() for p in os.getenv(
+        "ATTRIBUTION_PARAMS",
+        "utm_source,utm_medium,utm_campaign,utm_term,utm_content,gclid,gbraid,wbraid,fbclid,ttclid,msclkid,li_fat_id",
+    ).split(",") if p.strip()
+)
+# Stored inline rather than interned: nearly every value is seen once
+ATTRIBUTION_INLINE_PARAMS = frozenset(
+    p.strip() for p in os.getenv(
+        "ATTRIBUTION_INLINE_PARAMS", "gclid,gbraid,wbraid,fbclid,ttclid,msclkid,li_fat_id",
+    ).split(",") if p.strip()
+)
+ATTRIBUTION_COOKIE_NAME = "quiz_attribution"
+ATTRIBUTION_COOKIE_MAX_AGE = int(os.getenv("ATTRIBUTION_COOKIE_MAX_AGE", "1800"))
+# Values are visitor-controlled; anything longer is truncated
+MAX_VALUE_LENGTH = int(os.getenv("ATTRIBUTION_MAX_VALUE_LENGTH", "256"))
+HIDDEN_VALUE_CACHE_SIZE = int(os.getenv("HIDDEN_VALUE_CACHE_SIZE", "100000"))
+
+SOURCE_TYPES = {
+    "url_param": "query",
+    "query": "query",
+    "query_param": "query",
+    "cookie": "cookie",
+    "header": "header",
+    "constant": "constant",
+}
+
+
+@dataclass(frozen=True)
+class Extractor:
+    # (field_name, source key) per source
+    query: Tuple[Tuple[str, str], ...]
+    cookies: Tuple[Tuple[str, str], ...]
+    headers: Tuple[Tuple[str, str], ...]
+    constants: Tuple[Tuple[str, str], ...]
+
+    def extract(self, request: Request, constants: bool = True) -> Dict[str, str]:
+        values = dict(self.constants) if constants else {}
+        for pairs, source in ((self.query, request.query_params), (self.cookies, request.cookies), (self.headers, request.headers)):
+            if not pairs or not source:
+                continue
+            for field_name, key in pairs:
+                value = source.get(key)
+                if value:
+                    values[field_name] = value[:MAX_VALUE_LENGTH]
+        return values
+
+
+def compile_extractor(config: QuizConfig) -> Extractor:
+    sources: Dict[str, Dict[str, str]] = {"query": {p: p for p in ATTRIBUTION_PARAMS}, "cookie": {}, "header": {}, "constant": {}}
+    for field in config.hidden_fields:
+        source = SOURCE_TYPES.get(field.source_type.lower())
+        if source is None:
+            logger.warning("Ignoring hidden field %r of quiz %s: unknown source %r", field.field_name, config.quiz_id, field.source_type)
+            continue
+        # A quiz's own definition replaces the default capture of the same field
+        for pairs in sources.values():
+            pairs.pop(field.field_name, None)
+        if source == "constant":
+            sources[source][field.field_name] = field.constant_value or ""
+        elif source == "header":
+            sources[source][field.field_name] = field.source_key.lower()
+        else:
+            sources[source][field.field_name] = field.source_key
+    return Extractor(
+        query=tuple(sources["query"].items()),
+        cookies=tuple(sources["cookie"].items()),
+        headers=tuple(sources["header"].items()),
+        constants=tuple((k, v) for k, v in sources["constant"].items() if v),
+    )
+
+
+# Keyed by the settings content version, so a new version compiles a new extractor
+_extractors = TTLCache(maxsize=1024, ttl=3600)
+
+
+def extractor_for(config: QuizConfig) -> Extractor:
+    extractor = _extractors.get(config.version)
+    if extractor is None:
+        extractor = compile_extractor(config)
+        _extractors.set(config.version, extractor)
+    return extractor
+
+
+def park(response: Response, values: Dict[str, str]) -> None:
+    """Keep values captured on the cached intro page until ``/start`` stores them in the session."""
+    response.set_cookie(
+        ATTRIBUTION_COOKIE_NAME, urlencode(values), max_age=ATTRIBUTION_COOKIE_MAX_AGE, httponly=True, samesite="lax"
+    )
+
+
+def capture(request: Request, config: QuizConfig) -> Dict[str, str]:
+    """Values parked by the intro page, overridden by anything on this request."""
+    parked = request.cookies.get(ATTRIBUTION_COOKIE_NAME)
+    extractor = extractor_for(config)
+    allowed = {field_name for pairs in (extractor.query, extractor.cookies, extractor.headers) for field_name, _ in pairs}
+    values = {k: v[:MAX_VALUE_LENGTH] for k, v in parse_qsl(parked or "") if k in allowed}
+    values.update(extractor.extract(request))
+    return values
+
+
+HIDDEN_VALUE_ID_TTL = 86400
+
+# Only encode() fills _ids, so every id it returns from cache was seen within HIDDEN_VALUE_ID_TTL
+_ids = TTLCache(maxsize=HIDDEN_VALUE_CACHE_SIZE, ttl=HIDDEN_VALUE_ID_TTL)
+_values = TTLCache(maxsize=HIDDEN_VALUE_CACHE_SIZE, ttl=86400)
+
+
+def _remember(rows: Iterable[Tuple[int, str, str]]) -> None:
+    for value_id, field_name, value in rows:
+        _values.set(value_id, (field_name, value))
+
+
+def forget_interned(_key=None) -> None:
+    """Drop the cached id <-> value maps, e.g. after ``hidden_values`` rows were deleted."""
+    _ids.clear()
+    _values.clear()
+
+
+def interned_ids(encoded: Any) -> Set[int]:
+    """``hidden_values`` ids a stored ``hidden_data`` refers to."""
+    if not isinstance(encoded, list):
+        return set()
+    return {item for item in encoded if isinstance(item, int)}
+
+
+async def encode(db, values: Dict[str, str]) -> List[Any]:
+    """Intern ``values`` in ``hidden_values`` and return their sorted ids, then the inline pairs.
+
+    No query when every interned value is cached.
+    """
+    inline = sorted(
+        [field_name, value] for field_name, value in values.items() if field_name in ATTRIBUTION_INLINE_PARAMS
+    )
+    ids = {pair: _ids.get(pair) for pair in values.items() if pair[0] not in ATTRIBUTION_INLINE_PARAMS}
+    missing = [pair for pair, value_id in ids.items() if value_id is None]
+    if missing:
+        hidden = db_models.HiddenValue
+        dialect_insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+        now = datetime.utcnow()
+        insert = dialect_insert(hidden).values([{"field_name": f, "value": v, "last_seen_at": now} for f, v in missing])
+        # Touching existing rows locks them until this transaction ends, so a concurrent prune skips them
+        await db.execute(
+            insert.on_conflict_do_update(
+                index_elements=["field_name", "value"], set_={"last_seen_at": insert.excluded.last_seen_at}
+            )
+        )
+        rows = (await db.execute(
+            select(hidden.id, hidden.field_name, hidden.value)
+            .where(tuple_(hidden.field_name, hidden.value).in_(missing))
+        )).all()
+        _remember(rows)
+        for value_id, field_name, value in rows:
+            _ids.set((field_name, value), value_id)
+        ids.update({(field_name, value): value_id for value_id, field_name, value in rows})
+    return [*sorted(ids.values()), *inline]
+
+
+async def decode_many(db, encoded: Iterable[Any]) -> List[Dict[str, str]]:
+    """Turn stored ``hidden_data`` values back into ``{field: value}`` dicts, one lookup for all misses."""
+    encoded = list(encoded)
+    wanted = {i for ids in encoded for i in interned_ids(ids)}
+    known = {i: _values.get(i) for i in wanted}
+    missing = [i for i, pair in known.items() if pair is None]
+    if missing:
+        hidden = db_models.HiddenValue
+        rows = (await db.execute(
+            select(hidden.id, hidden.field_name, hidden.value).where(hidden.id.in_(missing))
+        )).all()
+        _remember(rows)
+        known.update({value_id: (field_name, value) for value_id, field_name, value in rows})
+    decoded = []
+    for ids in encoded:
+        if isinstance(ids, list):
+            decoded.append(dict(
+                tuple(item) if isinstance(item, list) else known[item]
+                for item in ids
+                if isinstance(item, list) or known.get(item) is not None
+            ))
+        else:
+            # Rows written before encoding (plain dicts) or without hidden data
+            decoded.append(ids or {})
+    return decoded
@@ -0,0 +1,126 @@
+"""One-time database setup: schema migrations, shared secrets and demo seed data.
+
+    python -m app.bootstrap            # migrate and seed, then exit
+
+Run it as the release / pre-start step of a deploy. Web workers also call
+``ensure_ready`` from their startup hook unless ``BOOTSTRAP_ON_STARTUP=0``;
+a cross-process lock (a Postgres advisory lock, or a lock file next to the
+SQLite database) makes the first worker do the work while the others wait
+and then find nothing left to do. Nothing here runs at import time.
+"""
+import contextlib
+import logging
+import os
+import secrets
+import sys
+import time
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import db_models
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+BOOTSTRAP_ON_STARTUP = os.getenv("BOOTSTRAP_ON_STARTUP", "1") == "1"
+SEED_DEMO_DATA = os.getenv("SEED_DEMO_DATA", "1") == "1"
+# Arbitrary but fixed key shared by every process bootstrapping the same database
+ADVISORY_LOCK_KEY = 720_140_001
+
+
+@contextlib.contextmanager
+def _file_lock(path: str):
+    try:
+        import fcntl
+    except ImportError:  # no flock on Windows; single-process dev servers only
+        yield
+        return
+    with open(path, "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def _bootstrap_transaction(bind=engine):
+    """A transaction held under the cross-process bootstrap lock."""
+    if bind.dialect.name == "postgresql":
+        with bind.begin() as connection:
+            # Released automatically when the transaction ends
+            connection.exec_driver_sql(f"SELECT pg_advisory_xact_lock({ADVISORY_LOCK_KEY})")
+            yield connection
+        return
+    database = bind.url.database
+    lock = _file_lock(f"{database}.bootstrap.lock") if database and database != ":memory:" else contextlib.nullcontext()
+    with lock, bind.begin() as connection:
+        yield connection
+
+
+def seed_data(db: Session) -> int:
+    """Insert the demo quizzes and their questions if there are no quizzes yet.
+
+    Everything is added in the caller's transaction; returns the number of
+    quizzes created.
+    """
+    if db.scalar(select(db_models.Quiz.id).limit(1)) is not None:
+        return 0
+    from .mock_data import create_mock_questions, create_mock_quizzes
+
+    quizzes = [
+        db_models.Quiz(
+            name=q.name,
+            slug=q.slug,
+            description=q.description,
+            is_active=q.is_active,
+            questions=[
+                db_models.QuizQuestion(
+                    question_text=question.question_text,
+                    question_type=question.question_type,
+                    question_order=question.question_order,
+                    answers=question.answers,
+                    is_active=question.is_active,
+                )
+                for question in create_mock_questions(q.slug)
+            ],
+        )
+        for q in create_mock_quizzes()
+    ]
+    db.add_all(quizzes)
+    db.flush()
+    return len(quizzes)
+
+
+def ensure_secrets(db: Session) -> None:
+    """Generate the secrets workers share (``app.sessions`` cookie signing) if not stored yet."""
+    from .sessions import SESSION_SECRET_NAME
+
+    if db.get(db_models.AppSecret, SESSION_SECRET_NAME) is None:
+        db.add(db_models.AppSecret(name=SESSION_SECRET_NAME, value=secrets.token_hex(32)))
+        db.flush()
+
+
+def ensure_ready(bind=engine, seed: bool = SEED_DEMO_DATA) -> dict:
+    """Migrate to head and seed, exactly once across concurrently starting processes."""
+    from . import migrate  # alembic is only needed here, keep it off the import path
+
+    started = time.perf_counter()
+    with _bootstrap_transaction(bind) as connection:
+        migrate.upgrade_connection(connection)
+        seeded = 0
+        with Session(bind=connection) as db:
+            ensure_secrets(db)
+            if seed:
+                seeded = seed_data(db)
+    elapsed = round((time.perf_counter() - started) * 1000, 1)
+    logger.info("Database ready in %s ms (%s quizzes seeded)", elapsed, seeded)
+    return {"seeded_quizzes": seeded, "elapsed_ms": elapsed}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] not in ([], ["--no-seed"]):
+        sys.exit("usage: python -m app.bootstrap [--no-seed]")
+    logging.basicConfig(level=logging.INFO)
+    print(ensure_ready(seed="--no-seed" not in sys.argv))
@@ -0,0 +1,249 @@
+"""Bulk quiz/question import and export (JSON or YAML).
+
+    python -m app.catalog export [--slug SLUG ...] [--format yaml] > catalog.json
+    python -m app.catalog import catalog.json [--dry-run]
+
+The document is ``{"quizzes": [{<Quiz fields>, "questions": [<QuizQuestion
+fields>, ...]}, ...]}``, validated against the Pydantic models in
+``app.models`` before anything is written. Only the fields stored in the
+database are imported.
+
+Each quiz is imported in its own transaction. The quiz is upserted by slug.
+Questions carrying the ``id`` of one of the quiz's existing questions are
+updated in place, so interaction and answer history stays attached. The
+others are inserted with one multi-row INSERT, and existing questions missing
+from the document are deactivated. ``question_order`` is renumbered 1..n in
+document order within the same transaction, so the funnel never sees a
+half-reordered quiz.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import Any, Dict, Iterable, List, Optional
+
+from pydantic import BaseModel, ValidationError, model_validator
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import db_models, models
+
+CATALOG_MEDIA_TYPES = {"json": "application/json", "yaml": "application/yaml"}
+
+QUESTION_FIELDS = ("question_text", "question_type", "question_order", "answers", "is_active")
+
+
+class CatalogQuestion(models.QuizQuestion):
+    quiz_id: Optional[str] = None
+    id: Optional[int] = None
+    is_active: bool = True
+
+
+class CatalogQuiz(models.Quiz):
+    is_active: bool = True
+    questions: List[CatalogQuestion] = []
+
+    @model_validator(mode="after")
+    def unique_orders(self):
+        orders = [q.question_order for q in self.questions]
+        if len(orders) != len(set(orders)):
+            raise ValueError(f"duplicate question_order in quiz {self.slug!r}")
+        return self
+
+
+class Catalog(BaseModel):
+    quizzes: List[CatalogQuiz]
+
+    @model_validator(mode="after")
+    def unique_slugs(self):
+        slugs = [q.slug for q in self.quizzes]
+        if len(slugs) != len(set(slugs)):
+            raise ValueError("duplicate quiz slug")
+        return self
+
+
+def yaml_available() -> bool:
+    try:
+        import yaml  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parse(raw: bytes, fmt: str = "json") -> Catalog:
+    """Decode and validate a catalog; raises ``ValueError``/``ValidationError`` on bad input."""
+    if fmt == "yaml":
+        import yaml
+
+        try:
+            data = yaml.safe_load(raw)
+        except yaml.YAMLError as exc:
+            raise ValueError(f"invalid YAML: {exc}") from exc
+    else:
+        data = json.loads(raw)
+    return Catalog.model_validate(data)
+
+
+def dump(catalog: Dict[str, Any], fmt: str = "json") -> str:
+    if fmt == "yaml":
+        import yaml
+
+        return yaml.safe_dump(catalog, sort_keys=False, allow_unicode=True)
+    return json.dumps(catalog, indent=2, ensure_ascii=False)
+
+
+async def export_catalog(db: AsyncSession, slugs: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Quizzes (all, or the given slugs) with their active questions, in import format."""
+    query = select(db_models.Quiz).order_by(db_models.Quiz.id)
+    if slugs:
+        query = query.where(db_models.Quiz.slug.in_(list(slugs)))
+    quizzes = (await db.scalars(query)).all()
+    questions: Dict[int, list] = {q.id: [] for q in quizzes}
+    if quizzes:
+        for row in await db.scalars(
+            select(db_models.QuizQuestion)
+            .where(db_models.QuizQuestion.quiz_id.in_(list(questions)), db_models.QuizQuestion.is_active.is_not(False))
+            .order_by(db_models.QuizQuestion.quiz_id, db_models.QuizQuestion.question_order)
+        ):
+            questions[row.quiz_id].append({"id": row.id, **{field: getattr(row, field) for field in QUESTION_FIELDS}})
+    return {"quizzes": [
+        {
+            "name": quiz.name,
+            "slug": quiz.slug,
+            "description": quiz.description,
+            "is_active": quiz.is_active,
+            "questions": questions[quiz.id],
+        }
+        for quiz in quizzes
+    ]}
+
+
+async def _import_quiz(db: AsyncSession, quiz: CatalogQuiz, existed: bool) -> Dict[str, Any]:
+    dialect_insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+    values = {"name": quiz.name, "slug": quiz.slug, "description": quiz.description, "is_active": quiz.is_active}
+    upsert = dialect_insert(db_models.Quiz).values(**values)
+    quiz_id = await db.scalar(
+        upsert.on_conflict_do_update(
+            index_elements=["slug"], set_={k: upsert.excluded[k] for k in ("name", "description", "is_active")}
+        ).returning(db_models.Quiz.id)
+    )
+
+    existing = dict((await db.execute(
+        select(db_models.QuizQuestion.id, db_models.QuizQuestion.is_active)
+        .where(db_models.QuizQuestion.quiz_id == quiz_id)
+    )).all())
+    updates, inserts = [], []
+    order = 0
+    for question in sorted(quiz.questions, key=lambda q: q.question_order):
+        # The funnel walks active questions by order and ends at the first gap
+        if question.is_active:
+            order += 1
+        row = {
+            "question_text": question.question_text,
+            "question_type": question.question_type.value,
+            "question_order": order if question.is_active else None,
+            "answers": question.answers,
+            "is_active": question.is_active,
+        }
+        if question.id in existing:
+            updates.append({"id": question.id, **row})
+        else:
+            inserts.append({"quiz_id": quiz_id, **row})
+
+    kept = {row["id"] for row in updates}
+    removed = [
+        # Deactivated rather than deleted: interactions and answer counts reference them
+        {"id": question_id, "is_active": False, "question_order": None}
+        for question_id, is_active in existing.items()
+        if question_id not in kept and is_active is not False
+    ]
+    if removed or updates:
+        # ORM bulk UPDATE by primary key: one executemany for the whole reorder
+        await db.execute(update(db_models.QuizQuestion), removed + updates)
+    if inserts:
+        await db.execute(insert(db_models.QuizQuestion.__table__), inserts)
+    return {
+        "slug": quiz.slug,
+        "created": not existed,
+        "questions_inserted": len(inserts),
+        "questions_updated": len(updates),
+        "questions_deactivated": len(removed),
+    }
+
+
+async def import_catalog(db: AsyncSession, catalog: Catalog, dry_run: bool = False) -> List[Dict[str, Any]]:
+    """Import every quiz of ``catalog``, one transaction per quiz.
+
+    A quiz that fails rolls back alone and is reported with an ``error``;
+    with ``dry_run`` every transaction is rolled back.
+    """
+    slugs = [q.slug for q in catalog.quizzes]
+    existing_slugs = set((await db.scalars(
+        select(db_models.Quiz.slug).where(db_models.Quiz.slug.in_(slugs))
+    )).all()) if slugs else set()
+    await db.rollback()
+
+    results = []
+    for quiz in catalog.quizzes:
+        try:
+            result = await _import_quiz(db, quiz, quiz.slug in existing_slugs)
+        except Exception as exc:
+            await db.rollback()
+            results.append({"slug": quiz.slug, "error": str(exc)})
+            continue
+        if dry_run:
+            await db.rollback()
+        else:
+            await db.commit()
+        results.append(result)
+    return results
+
+
+async def _cli_import(path: str, dry_run: bool) -> List[Dict[str, Any]]:
+    from . import invalidation
+    from .database import AsyncSessionLocal, async_engine
+
+    fmt = "yaml" if path.endswith((".yaml", ".yml")) else "json"
+    with open(path, "rb") as handle:
+        catalog = parse(handle.read(), fmt)
+    async with AsyncSessionLocal() as db:
+        results = await import_catalog(db, catalog, dry_run=dry_run)
+    if not dry_run:
+        for result in results:
+            if "error" not in result:
+                await invalidation.publish("quiz", result["slug"])
+    await async_engine.dispose()
+    return results
+
+
+async def _cli_export(slugs: List[str], fmt: str) -> str:
+    from .database import AsyncSessionLocal, async_engine
+
+    async with AsyncSessionLocal() as db:
+        catalog = await export_catalog(db, slugs)
+    await async_engine.dispose()
+    return dump(catalog, fmt)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m app.catalog", description="Bulk quiz import/export")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument("--slug", action="append", default=[])
+    export_parser.add_argument("--format", choices=sorted(CATALOG_MEDIA_TYPES), default="json")
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(asyncio.run(_cli_export(args.slug, args.format)))
+    else:
+        try:
+            results = asyncio.run(_cli_import(args.path, args.dry_run))
+        except (ValueError, ValidationError) as exc:
+            sys.exit(f"Invalid catalog: {exc}")
+        print(json.dumps(results, indent=2))
+        if any("error" in r for r in results):
+            sys.exit(1)
@@ -1,4 +1,5 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, JSON, DateTime, Float
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, JSON, Date, DateTime, Float
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -29,14 +30,213 @@ class QuizQuestion(Base):
 
     quiz = relationship("Quiz", back_populates="questions")
 
+    __table_args__ = (
+        Index("ix_quiz_questions_quiz_id_order", "quiz_id", "question_order"),
+    )
+
 class Lead(Base):
     __tablename__ = "leads"
 
     id = Column(Integer, primary_key=True, index=True)
     quiz_id = Column(Integer, ForeignKey("quizzes.id"))
+    session_id = Column(String, nullable=True)
     email = Column(String, index=True)
     first_name = Column(String, nullable=True)
     last_name = Column(String, nullable=True)
+    quiz_answers = Column(JSON, nullable=True)
+    quiz_score = Column(Float, nullable=True)
+    quiz_outcome_headline = Column(String, nullable=True)
+    hidden_data = Column(JSON, nullable=True)
     submission_date = Column(DateTime, default=datetime.utcnow)
 
     quiz = relationship("Quiz", back_populates="leads")
+
+    __table_args__ = (
+        Index("ix_leads_quiz_id_email", "quiz_id", "email"),
+        # Keyset pagination of the admin lead browser: (submission_date, id) per quiz and overall
+        Index("ix_leads_quiz_id_submission_date_id", "quiz_id", "submission_date", "id"),
+        Index("ix_leads_submission_date_id", "submission_date", "id"),
+    )
+
+class QuizSession(Base):
+    __tablename__ = "quiz_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String, unique=True, index=True)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), index=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+    form_completed_at = Column(DateTime, nullable=True)
+    # Lets app.sync re-export sessions changed after their first sync
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    quiz_answers = Column(JSON, default=dict)
+    quiz_result = Column(JSON, nullable=True)
+    email = Column(String, nullable=True)
+    first_name = Column(String, nullable=True)
+    last_name = Column(String, nullable=True)
+    company_name = Column(String, nullable=True)
+    phone_number = Column(String, nullable=True)
+    ab_test_assignments = Column(JSON, default=dict)
+    hidden_data = Column(JSON, default=dict)
+    user_agent = Column(String, nullable=True)
+    ip_address = Column(String, nullable=True)
+    referrer = Column(String, nullable=True)
+
+class QuizInteraction(Base):
+    __tablename__ = "quiz_interactions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), index=True)
+    session_id = Column(String, index=True)
+    page_type = Column(String)
+    question_id = Column(Integer, nullable=True)
+    # JSONB on Postgres: plain json has no equality operator, and the rollup
+    # rebuild groups by the answer value.
+    answer_value = Column(
+        JSON(none_as_null=True).with_variant(postgresql.JSONB(none_as_null=True), "postgresql"),
+        nullable=True,
+    )
+    timestamp = Column(DateTime, default=datetime.utcnow)
+
+class DailyQuizStats(Base):
+    __tablename__ = "daily_quiz_stats"
+
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    leads = Column(Integer, default=0, nullable=False)
+    starts = Column(Integer, default=0, nullable=False)
+    completions = Column(Integer, default=0, nullable=False)
+
+class AnswerCount(Base):
+    __tablename__ = "answer_counts"
+
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), primary_key=True)
+    question_id = Column(Integer, primary_key=True)
+    answer_value = Column(String, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
+# Distinct sessions that answered each question; answer_counts counts every answer
+class QuestionReach(Base):
+    __tablename__ = "question_reach"
+
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), primary_key=True)
+    question_id = Column(Integer, primary_key=True)
+    sessions = Column(Integer, default=0, nullable=False)
+
+class SyncState(Base):
+    __tablename__ = "sync_state"
+
+    entity_type = Column(String, primary_key=True)
+    last_synced_id = Column(Integer, default=0, nullable=False)
+    last_synced_date = Column(DateTime, nullable=True)
+    last_synced_updated_at = Column(DateTime, nullable=True)
+    # [first_id, last_id, first seen] ranges below the watermark not committed when passed
+    id_gaps = Column(JSON, nullable=True)
+    status = Column(String, nullable=True)
+    last_run_message = Column(String, nullable=True)
+    last_run_timestamp = Column(DateTime, nullable=True)
+    records_synced = Column(Integer, default=0, nullable=False)
+
+class ABTest(Base):
+    __tablename__ = "ab_tests"
+
+    id = Column(Integer, primary_key=True, index=True)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), index=True)
+    name = Column(String)
+    test_key = Column(String, unique=True, index=True)
+    variants = Column(JSON)
+    status = Column(String, default="draft")
+    is_active = Column(Boolean, default=True)
+
+class ThankYouPage(Base):
+    __tablename__ = "thank_you_pages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), index=True)
+    name = Column(String)
+    headline = Column(String)
+    body_content = Column(String)
+    header_visual = Column(String, nullable=True)
+    cta_section_title = Column(String, nullable=True)
+    cta_section_content_type = Column(String, nullable=True)
+    cta_section_text = Column(String, nullable=True)
+    cta_section_image_url = Column(String, nullable=True)
+    cta_section_video_url = Column(String, nullable=True)
+    cta_buttons = Column(JSON, default=list)
+    case_studies = Column(JSON, default=list)
+    testimonials = Column(JSON, default=list)
+    monetary_value = Column(Float, nullable=True)
+    is_default = Column(Boolean, default=False)
+    is_active = Column(Boolean, default=True)
+
+class ResultRule(Base):
+    __tablename__ = "result_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), index=True)
+    name = Column(String)
+    min_score = Column(Float)
+    max_score = Column(Float)
+    thank_you_page_id = Column(Integer, ForeignKey("thank_you_pages.id"))
+    is_active = Column(Boolean, default=True)
+
+class QuizSetting(Base):
+    __tablename__ = "quiz_settings"
+
+    id = Column(Integer, primary_key=True, index=True)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), index=True)
+    kind = Column(String)
+    config = Column(JSON)
+    is_active = Column(Boolean, default=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class IntegrationOutbox(Base):
+    __tablename__ = "integration_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"))
+    lead_id = Column(Integer, ForeignKey("leads.id"))
+    setting_id = Column(Integer, ForeignKey("quiz_settings.id"))
+    integration = Column(String)
+    payload = Column(JSON)
+    status = Column(String, default="pending")
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    claim_token = Column(String, nullable=True, index=True)
+    claimed_at = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_integration_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+class LeadDedupeKey(Base):
+    __tablename__ = "lead_dedupe_keys"
+
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), primary_key=True)
+    dedupe_key = Column(String, primary_key=True)
+    lead_id = Column(Integer, ForeignKey("leads.id"))
+
+class HiddenValue(Base):
+    # Interned hidden-field/UTM values; sessions and leads store lists of these ids
+    __tablename__ = "hidden_values"
+
+    id = Column(Integer, primary_key=True)
+    field_name = Column(String, nullable=False)
+    value = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Bumped whenever encode() hands the id out from the database; app.retention prunes by it
+    last_seen_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_hidden_values_field_value", "field_name", "value", unique=True),
+    )
+
+class AppSecret(Base):
+    # Secrets every worker must share, generated once by app.bootstrap
+    __tablename__ = "app_secrets"
+
+    name = Column(String, primary_key=True)
+    value = Column(String, nullable=False)
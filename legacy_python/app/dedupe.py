@@ -0,0 +1,212 @@
+"""Duplicate-lead detection driven by GeneralSettings.
+
+When ``enable_duplicate_check`` is on, each lead gets a normalized key built
+from the fields in ``duplicate_check_criteria`` (default: email). The key is
+claimed in ``lead_dedupe_keys`` (primary key ``(quiz_id, dedupe_key)``) in the
+lead's own transaction, so the database rejects duplicates even when two
+worker processes race.
+
+A per-quiz Bloom filter, warmed at startup, sits in front of that table. A
+"definitely new" answer skips the lookup query entirely; the unique key
+still catches leads another worker stored since this filter was warmed.
+Only a "maybe seen" answer costs a primary-key lookup. Each filter is sized
+for ``DEDUPE_BLOOM_HEADROOM`` times the quiz's stored keys and is reloaded,
+larger, once it holds more keys than that.
+
+Rebuild keys after changing the criteria of a quiz with existing leads:
+
+    python -m app.dedupe rebuild <quiz-slug>
+"""
+import hashlib
+import math
+import os
+import sys
+from typing import Dict, Iterable, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import db_models
+from .models import GeneralSettings
+
+DEDUPE_BLOOM_MIN_CAPACITY = int(os.getenv("DEDUPE_BLOOM_MIN_CAPACITY", "1000"))
+DEDUPE_BLOOM_HEADROOM = float(os.getenv("DEDUPE_BLOOM_HEADROOM", "2.0"))
+DEDUPE_BLOOM_ERROR_RATE = float(os.getenv("DEDUPE_BLOOM_ERROR_RATE", "0.01"))
+
+# Lead columns a criterion may name (GeneralSettings.duplicate_check_criteria), with their normalizers
+_NORMALIZERS = {
+    "email": lambda v: v.strip().lower(),
+    "first_name": lambda v: " ".join(v.split()).lower(),
+    "last_name": lambda v: " ".join(v.split()).lower(),
+}
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = DEDUPE_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.count = 0
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        self.count += 1
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+_filters: Dict[int, BloomFilter] = {}
+
+
+def criteria_for(settings: GeneralSettings):
+    if not settings.enable_duplicate_check:
+        return ()
+    criteria = [c for c in (settings.duplicate_check_criteria or ["email"]) if c in _NORMALIZERS]
+    return tuple(sorted(set(criteria)))
+
+
+def dedupe_key(criteria, values: Dict[str, Optional[str]]) -> Optional[str]:
+    """Hash of the normalized criteria fields, or None if any of them is missing."""
+    parts = []
+    for field in criteria:
+        value = values.get(field)
+        if not value:
+            return None
+        parts.append(f"{field}={_NORMALIZERS[field](value)}")
+    if not parts:
+        return None
+    return hashlib.sha1("\x1f".join(parts).encode()).hexdigest()
+
+
+async def _load_filter(db: AsyncSession, quiz_id: int) -> BloomFilter:
+    stored = await db.scalar(
+        select(func.count()).select_from(db_models.LeadDedupeKey).where(db_models.LeadDedupeKey.quiz_id == quiz_id)
+    )
+    bloom = BloomFilter(max(DEDUPE_BLOOM_MIN_CAPACITY, int(stored * DEDUPE_BLOOM_HEADROOM)))
+    keys = await db.stream_scalars(
+        select(db_models.LeadDedupeKey.dedupe_key)
+        .where(db_models.LeadDedupeKey.quiz_id == quiz_id)
+        .execution_options(yield_per=10000)
+    )
+    async for key in keys:
+        bloom.add(key)
+    _filters[quiz_id] = bloom
+    return bloom
+
+
+async def warm(db: AsyncSession) -> None:
+    """Load filters for every quiz whose general settings enable the duplicate check."""
+    from .quiz_settings import validate_config
+
+    rows = await db.scalars(
+        select(db_models.QuizSetting).where(
+            db_models.QuizSetting.kind == "general",
+            db_models.QuizSetting.is_active == True,  # noqa: E712
+        )
+    )
+    for row in rows.all():
+        try:
+            settings = validate_config("general", row.quiz_id, row.config or {})
+        except ValidationError:
+            continue  # quiz_settings.resolve skips the same row, so the check is off for this quiz
+        if criteria_for(settings):
+            await _load_filter(db, row.quiz_id)
+
+
+async def is_duplicate(db: AsyncSession, quiz_id: int, key: str) -> bool:
+    bloom = _filters.get(quiz_id) or await _load_filter(db, quiz_id)
+    if key not in bloom:
+        return False
+    found = await db.scalar(
+        select(db_models.LeadDedupeKey.lead_id).where(
+            db_models.LeadDedupeKey.quiz_id == quiz_id,
+            db_models.LeadDedupeKey.dedupe_key == key,
+        )
+    )
+    return found is not None
+
+
+async def claim(db: AsyncSession, quiz_id: int, key: str, lead_id: int) -> bool:
+    """Insert the key inside the lead's transaction; False means another lead already holds it."""
+    insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+    result = await db.execute(
+        insert(db_models.LeadDedupeKey.__table__)
+        .values(quiz_id=quiz_id, dedupe_key=key, lead_id=lead_id)
+        .on_conflict_do_nothing(index_elements=["quiz_id", "dedupe_key"])
+    )
+    return result.rowcount == 1
+
+
+def remember(quiz_id: int, key: str) -> None:
+    bloom = _filters.get(quiz_id)
+    if bloom is not None:
+        bloom.add(key)
+        if bloom.count > bloom.capacity:
+            # Past its sizing the false-positive rate climbs; the next lookup reloads a larger filter
+            _filters.pop(quiz_id, None)
+
+
+def forget(quiz_id: int = None) -> None:
+    if quiz_id is None:
+        _filters.clear()
+    else:
+        _filters.pop(quiz_id, None)
+
+
+def rebuild(db, quiz_id: int, criteria) -> int:
+    """Recompute every dedupe key of a quiz from its leads (sync Session). Earliest lead wins."""
+    from sqlalchemy import delete
+
+    table = db_models.LeadDedupeKey.__table__
+    db.execute(delete(table).where(table.c.quiz_id == quiz_id))
+    seen: Dict[str, int] = {}
+    lead = db_models.Lead
+    for row in db.execute(
+        select(lead.id, lead.email, lead.first_name, lead.last_name)
+        .where(lead.quiz_id == quiz_id)
+        .order_by(lead.id)
+        .execution_options(yield_per=10000)
+    ):
+        key = dedupe_key(criteria, row._asdict())
+        if key and key not in seen:
+            seen[key] = row.id
+    if seen:
+        db.execute(table.insert(), [{"quiz_id": quiz_id, "dedupe_key": k, "lead_id": v} for k, v in seen.items()])
+    db.commit()
+    return len(seen)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "rebuild":
+        sys.exit("usage: python -m app.dedupe rebuild <quiz-slug>")
+    from .database import SessionLocal
+    from .quiz_settings import validate_config
+
+    with SessionLocal() as session:
+        quiz = session.scalar(select(db_models.Quiz).where(db_models.Quiz.slug == sys.argv[2]))
+        if quiz is None:
+            sys.exit(f"Quiz not found: {sys.argv[2]}")
+        row = session.scalar(
+            select(db_models.QuizSetting)
+            .where(db_models.QuizSetting.quiz_id == quiz.id, db_models.QuizSetting.kind == "general")
+            .order_by(db_models.QuizSetting.id.desc()).limit(1)
+        )
+        criteria = criteria_for(validate_config("general", quiz.id, row.config if row else {}))
+        print(f"Stored {rebuild(session, quiz.id, criteria)} dedupe keys for criteria {list(criteria)}")
+
+    import asyncio
+
+    from . import invalidation
+
+    # Running workers drop their Bloom filter for this quiz and re-warm it from the new keys
+    asyncio.run(invalidation.publish("dedupe", quiz.id))
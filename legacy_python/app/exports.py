@@ -0,0 +1,156 @@
+"""Streaming lead exports.
+
+Rows are pulled through a server-side cursor in ``EXPORT_CHUNK_SIZE`` partitions
+and encoded chunk by chunk, so memory stays flat no matter how many leads a quiz
+has. Results are ordered by ``id``, which lets a nightly job resume with
+``after_id=<last id it saw>`` instead of re-downloading everything.
+``hidden_data`` is decoded from its interned ids back to ``{field: value}``.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import select
+
+from . import attribution, db_models
+from .database import async_engine
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+LEAD_EXPORT_COLUMNS = (
+    "id", "quiz_id", "session_id", "email", "first_name", "last_name",
+    "submission_date", "quiz_answers", "hidden_data",
+)
+_JSON_COLUMNS = ("quiz_answers", "hidden_data")
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def lead_export_query(
+    quiz_id: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after_id: Optional[int] = None,
+):
+    lead = db_models.Lead
+    query = select(*(getattr(lead, c) for c in LEAD_EXPORT_COLUMNS)).where(lead.quiz_id == quiz_id)
+    if since is not None:
+        query = query.where(lead.submission_date >= since)
+    if until is not None:
+        query = query.where(lead.submission_date < until)
+    if after_id is not None:
+        query = query.where(lead.id > after_id)
+    return query.order_by(lead.id)
+
+
+async def _partitions(query) -> AsyncIterator[list]:
+    # The streaming cursor holds its connection; value lookups need a second one
+    async with async_engine.connect() as conn, async_engine.connect() as lookup:
+        result = await conn.stream(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        async for rows in result.partitions():
+            records = [row._asdict() for row in rows]
+            decoded = await attribution.decode_many(lookup, [r["hidden_data"] for r in records])
+            for record, hidden_data in zip(records, decoded):
+                record["hidden_data"] = hidden_data
+            yield records
+
+
+async def _stream_csv(query) -> AsyncIterator[str]:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(LEAD_EXPORT_COLUMNS)
+    async for records in _partitions(query):
+        for record in records:
+            for column in _JSON_COLUMNS:
+                record[column] = json.dumps(record[column]) if record[column] is not None else ""
+            writer.writerow([record[c] for c in LEAD_EXPORT_COLUMNS])
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+    if out.tell():
+        yield out.getvalue()
+
+
+async def _stream_ndjson(query) -> AsyncIterator[str]:
+    async for records in _partitions(query):
+        yield "".join(json.dumps(record, default=str) + "\n" for record in records)
+
+
+class _ChunkSink(io.RawIOBase):
+    """File-like object that hands written bytes back to the generator instead of keeping them."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+async def _stream_parquet(query) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("quiz_id", pa.int64()),
+        ("session_id", pa.string()),
+        ("email", pa.string()),
+        ("first_name", pa.string()),
+        ("last_name", pa.string()),
+        ("submission_date", pa.timestamp("us")),
+        ("quiz_answers", pa.string()),
+        ("hidden_data", pa.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    async for records in _partitions(query):
+        columns = {c: [] for c in LEAD_EXPORT_COLUMNS}
+        for record in records:
+            for column in LEAD_EXPORT_COLUMNS:
+                value = record[column]
+                if column in _JSON_COLUMNS and value is not None:
+                    value = json.dumps(value)
+                columns[column].append(value)
+        # One row group per partition keeps the writer's buffer bounded
+        writer.write_table(pa.table(columns, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def stream_leads(fmt: str, query) -> AsyncIterator:
+    if fmt == "csv":
+        return _stream_csv(query)
+    if fmt == "ndjson":
+        return _stream_ndjson(query)
+    if fmt == "parquet":
+        return _stream_parquet(query)
+    raise ValueError(f"Unsupported export format: {fmt}")
@@ -0,0 +1,339 @@
+"""Outbound lead integrations via a transactional outbox.
+
+``enqueue_lead`` writes one ``integration_outbox`` row per enabled integration
+in the same transaction as the lead, so the lead POST never waits on a third
+party. ``OutboxDispatcher`` claims due rows, groups them by integration and
+delivers them with pooled HTTP clients under per-integration concurrency
+limits, batching where the target API accepts batches (Facebook Conversions
+API, TikTok Events API, and one SMTP connection per email batch). Failures are
+retried with exponential backoff until ``OUTBOX_MAX_ATTEMPTS``. A sender that
+fails part-way through a batch raises ``PartialDelivery``, so the rows it
+already delivered are marked sent and only the rest are retried.
+
+Every endpoint is configurable through the environment so local stub servers
+can stand in for the real services.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import secrets
+import smtplib
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import Any, Dict, List
+
+from sqlalchemy import insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from . import db_models
+from .quiz_settings import enabled_integrations, validate_config
+
+logger = logging.getLogger(__name__)
+
+HUBSPOT_FORMS_URL = os.getenv("HUBSPOT_FORMS_URL", "https://api.hsforms.com/submissions/v3/integration/submit")
+FACEBOOK_GRAPH_URL = os.getenv("FACEBOOK_GRAPH_URL", "https://graph.facebook.com/v18.0")
+FACEBOOK_CAPI_ACCESS_TOKEN = os.getenv("FACEBOOK_CAPI_ACCESS_TOKEN", "")
+TIKTOK_EVENTS_URL = os.getenv("TIKTOK_EVENTS_URL", "https://business-api.tiktok.com/open_api/v1.3/event/track/")
+TIKTOK_EVENTS_ACCESS_TOKEN = os.getenv("TIKTOK_EVENTS_ACCESS_TOKEN", "")
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "25"))
+SMTP_SENDER = os.getenv("SMTP_SENDER", "no-reply@localhost")
+
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+OUTBOX_CLAIM_SIZE = int(os.getenv("OUTBOX_CLAIM_SIZE", "200"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "5"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "3600"))
+# A claim older than this is assumed to belong to a dead worker and is retaken
+OUTBOX_CLAIM_LEASE = float(os.getenv("OUTBOX_CLAIM_LEASE", "300"))
+
+# Max in-flight deliveries per integration, and max events per batched request
+CONCURRENCY_LIMITS = {"hubspot": 8, "email_notification": 2, "facebook_pixel": 4, "tiktok_pixel": 4}
+BATCH_LIMITS = {"hubspot": 1, "email_notification": 50, "facebook_pixel": 1000, "tiktok_pixel": 1000}
+
+
+class PartialDelivery(Exception):
+    """Raised by a sender that delivered the first ``sent`` payloads of a batch and then failed."""
+
+    def __init__(self, sent: int):
+        super().__init__(f"failed after delivering {sent}")
+        self.sent = sent
+
+
+async def enqueue_lead(db: AsyncSession, quiz_id: int, lead: db_models.Lead, extra: Dict[str, Any]) -> int:
+    """Queue deliveries for a lead; call inside the lead's transaction, after it has an id."""
+    targets = await enabled_integrations(db, quiz_id)
+    if not targets:
+        return 0
+    payload = {
+        "lead_id": lead.id,
+        "email": lead.email,
+        "first_name": lead.first_name,
+        "last_name": lead.last_name,
+        "submitted_at": (lead.submission_date or datetime.utcnow()).isoformat(),
+        **extra,
+    }
+    now = datetime.utcnow()
+    await db.execute(insert(db_models.IntegrationOutbox.__table__), [
+        {
+            "quiz_id": quiz_id,
+            "lead_id": lead.id,
+            "setting_id": setting_id,
+            "integration": kind,
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+        }
+        for setting_id, kind, _ in targets
+    ])
+    return len(targets)
+
+
+def _sha256(value: str) -> str:
+    return hashlib.sha256(value.strip().lower().encode()).hexdigest()
+
+
+def _format(template: str, payload: Dict[str, Any]) -> str:
+    return template.format_map(defaultdict(str, {k: v for k, v in payload.items() if v is not None}))
+
+
+class OutboxDispatcher:
+    def __init__(self, engine: AsyncEngine, concurrency_limits: Dict[str, int] = None):
+        self.engine = engine
+        self.client = None
+        self._limits = {
+            kind: asyncio.Semaphore(limit)
+            for kind, limit in (concurrency_limits or CONCURRENCY_LIMITS).items()
+        }
+        self._task = None
+
+    def _open_client(self) -> None:
+        # httpx is imported here so web workers pay for it when dispatching starts, not at import
+        if self.client is None:
+            import httpx
+
+            self.client = httpx.AsyncClient(timeout=10.0, limits=httpx.Limits(max_connections=50, max_keepalive_connections=20))
+
+    async def start(self) -> None:
+        self._open_client()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                delivered = await self.dispatch_once()
+            except Exception:
+                logger.exception("Outbox dispatch pass failed")
+                delivered = 0
+            if not delivered:
+                await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+    async def _claim(self) -> List[db_models.IntegrationOutbox]:
+        outbox = db_models.IntegrationOutbox
+        token = secrets.token_hex(8)
+        now = datetime.utcnow()
+        is_due = or_(
+            (outbox.status == "pending") & (outbox.next_attempt_at <= now),
+            (outbox.status == "sending") & (outbox.claimed_at < now - timedelta(seconds=OUTBOX_CLAIM_LEASE)),
+        )
+        due = (
+            select(outbox.id)
+            .where(is_due)
+            .order_by(outbox.id)
+            .limit(OUTBOX_CLAIM_SIZE)
+            # Postgres: rows another worker is claiming are skipped, not waited on (no-op on SQLite)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        async with AsyncSession(self.engine, expire_on_commit=False) as db:
+            # The UPDATE repeats the whole due predicate: under READ COMMITTED a worker
+            # that waited on a row lock re-checks it against the winner's committed row,
+            # which is "sending" with a fresh claimed_at, and leaves it alone
+            await db.execute(
+                update(outbox)
+                .where(outbox.id.in_(due), is_due)
+                .values(status="sending", claim_token=token, claimed_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            rows = (await db.scalars(select(outbox).where(outbox.claim_token == token))).all()
+            settings = {
+                s.id: s for s in (await db.scalars(
+                    select(db_models.QuizSetting).where(db_models.QuizSetting.id.in_({r.setting_id for r in rows}))
+                )).all()
+            } if rows else {}
+        for row in rows:
+            row.setting = settings.get(row.setting_id)
+        return rows
+
+    async def dispatch_once(self) -> int:
+        self._open_client()
+        rows = await self._claim()
+        if not rows:
+            return 0
+        # One batch per (integration, setting) so each request targets a single pixel/form/mailbox
+        groups: Dict[tuple, list] = defaultdict(list)
+        for row in rows:
+            groups[(row.integration, row.setting_id)].append(row)
+        jobs = []
+        for (kind, _), group in groups.items():
+            size = BATCH_LIMITS.get(kind, 1)
+            for start in range(0, len(group), size):
+                jobs.append(self._deliver(kind, group[start:start + size]))
+        await asyncio.gather(*jobs)
+        return len(rows)
+
+    async def _deliver(self, kind: str, rows: List[db_models.IntegrationOutbox]) -> None:
+        setting_row = rows[0].setting
+        try:
+            if setting_row is None or not setting_row.is_active:
+                raise RuntimeError("integration setting no longer exists or is inactive")
+            setting = validate_config(kind, setting_row.quiz_id, setting_row.config or {})
+            async with self._limits.setdefault(kind, asyncio.Semaphore(1)):
+                await getattr(self, f"_send_{kind}")(setting, [r.payload for r in rows])
+        except PartialDelivery as exc:
+            if exc.sent:
+                await self._mark_sent(rows[:exc.sent])
+            await self._mark_failed(rows[exc.sent:], exc.__cause__ or exc)
+        except Exception as exc:
+            await self._mark_failed(rows, exc)
+        else:
+            await self._mark_sent(rows)
+
+    async def _mark_sent(self, rows) -> None:
+        outbox = db_models.IntegrationOutbox
+        async with self.engine.begin() as conn:
+            await conn.execute(
+                update(outbox)
+                # A claim retaken after its lease expired belongs to the other worker now
+                .where(outbox.id.in_([r.id for r in rows]), outbox.claim_token == rows[0].claim_token)
+                .values(status="sent", sent_at=datetime.utcnow(), claim_token=None, last_error=None)
+            )
+
+    async def _mark_failed(self, rows, exc: Exception) -> None:
+        outbox = db_models.IntegrationOutbox
+        message = f"{type(exc).__name__}: {exc}"[:500]
+        logger.warning("Delivery of %d %s rows failed: %s", len(rows), rows[0].integration, message)
+        async with self.engine.begin() as conn:
+            for row in rows:
+                attempts = row.attempts + 1
+                delay = min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+                await conn.execute(
+                    update(outbox).where(outbox.id == row.id, outbox.claim_token == row.claim_token).values(
+                        status="dead" if attempts >= OUTBOX_MAX_ATTEMPTS else "pending",
+                        attempts=attempts,
+                        next_attempt_at=datetime.utcnow() + timedelta(seconds=delay * random.uniform(0.8, 1.2)),
+                        claim_token=None,
+                        last_error=message,
+                    )
+                )
+
+    async def _send_hubspot(self, setting, payloads) -> None:
+        for payload in payloads:
+            fields = [
+                {"name": hubspot_name, "value": str(payload.get(field) or "")}
+                for field, hubspot_name in ({"email": "email", "first_name": "firstname", "last_name": "lastname"} | setting.property_mappings).items()
+                if payload.get(field) is not None
+            ]
+            response = await self.client.post(
+                f"{HUBSPOT_FORMS_URL}/{setting.portal_id}/{setting.form_guid}",
+                json={"fields": fields, "submittedAt": int(time.time() * 1000)},
+            )
+            response.raise_for_status()
+
+    async def _send_facebook_pixel(self, setting, payloads) -> None:
+        events = [
+            {
+                "event_name": "Lead",
+                "event_time": int(datetime.fromisoformat(p["submitted_at"]).timestamp()),
+                "event_id": f"lead-{p['lead_id']}",
+                "action_source": "website",
+                "user_data": {"em": [_sha256(p["email"])]},
+            }
+            for p in payloads
+        ]
+        response = await self.client.post(
+            f"{FACEBOOK_GRAPH_URL}/{setting.pixel_id}/events",
+            params={"access_token": FACEBOOK_CAPI_ACCESS_TOKEN},
+            json={"data": events},
+        )
+        response.raise_for_status()
+
+    async def _send_tiktok_pixel(self, setting, payloads) -> None:
+        events = [
+            {
+                "event": "SubmitForm",
+                "event_time": int(datetime.fromisoformat(p["submitted_at"]).timestamp()),
+                "event_id": f"lead-{p['lead_id']}",
+                "user": {"email": _sha256(p["email"])},
+            }
+            for p in payloads
+        ]
+        response = await self.client.post(
+            TIKTOK_EVENTS_URL,
+            headers={"Access-Token": TIKTOK_EVENTS_ACCESS_TOKEN},
+            json={"event_source": "web", "event_source_id": setting.pixel_id, "data": events},
+        )
+        response.raise_for_status()
+
+    async def _send_email_notification(self, setting, payloads) -> None:
+        messages = []
+        for payload in payloads:
+            message = EmailMessage()
+            message["From"] = f"{setting.sender_name} <{SMTP_SENDER}>"
+            message["To"] = ", ".join(setting.recipient_emails)
+            message["Subject"] = _format(setting.subject_template, payload)
+            message.set_content(_format(setting.body_template, payload))
+            messages.append(message)
+
+        sent = 0
+
+        def send_all():
+            nonlocal sent
+            with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as smtp:
+                for message in messages:
+                    smtp.send_message(message)
+                    sent += 1
+
+        try:
+            await asyncio.to_thread(send_all)
+        except Exception as exc:
+            if sent < len(messages):
+                raise PartialDelivery(sent) from exc
+            # Every message went out; only closing the connection failed
+            logger.warning("SMTP session ended with an error after %d messages: %s", sent, exc)
+
+
+if __name__ == "__main__":
+    from .database import async_engine
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        dispatcher = OutboxDispatcher(async_engine)
+        await dispatcher.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await dispatcher.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,228 @@
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import secrets
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from . import db_models
+from .database import async_engine
+
+logger = logging.getLogger(__name__)
+
+INTERACTION_BATCH_SIZE = int(os.getenv("INTERACTION_BATCH_SIZE", "500"))
+INTERACTION_FLUSH_INTERVAL = float(os.getenv("INTERACTION_FLUSH_INTERVAL", "1.0"))
+INTERACTION_MAX_PENDING = int(os.getenv("INTERACTION_MAX_PENDING", "100000"))
+INTERACTION_SPOOL_PATH = os.getenv("INTERACTION_SPOOL_PATH", "./interaction_spool.jsonl")
+
+FlushHook = Callable[[AsyncConnection, List[Dict[str, Any]]], Awaitable[None]]
+
+
+class InteractionBuffer:
+    """Write-behind buffer for quiz_interactions.
+
+    Handlers call ``record()``, which only appends to a list. A background task
+    flushes the list as multi-row INSERTs once ``batch_size`` rows are waiting or
+    every ``flush_interval`` seconds. Rows that cannot reach the database (on
+    shutdown, or when the backlog exceeds ``max_pending``) are appended to a
+    JSONL spool file and replayed on the next start. Overflow is spooled in a
+    worker thread, so the event loop never waits on the file lock or the disk.
+
+    Several workers share one spool. Appending and claiming it happen under a
+    short ``flock``. Each claimed file is replayed by whichever process holds
+    the ``flock`` on that file, so it is inserted once even when every worker
+    starts together. A replay that died midway leaves its file unlocked for
+    the next start to pick up.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        batch_size: int = INTERACTION_BATCH_SIZE,
+        flush_interval: float = INTERACTION_FLUSH_INTERVAL,
+        max_pending: int = INTERACTION_MAX_PENDING,
+        spool_path: str = INTERACTION_SPOOL_PATH,
+    ):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.spool_path = spool_path
+        # Extra statements run in the same transaction as each flushed batch
+        self.flush_hooks: List[FlushHook] = []
+        self._pending: List[Dict[str, Any]] = []
+        # Rows taken by a flush whose transaction has not committed yet
+        self._in_flight: List[Dict[str, Any]] = []
+        # Overflow waiting for _drain_overflow to spool it
+        self._overflow: List[Dict[str, Any]] = []
+        self._spool_task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(
+        self,
+        quiz_id: int,
+        session_id: str,
+        page_type: str,
+        question_id: Optional[int] = None,
+        answer_value: Any = None,
+        timestamp: Optional[datetime] = None,
+    ) -> None:
+        self._pending.append({
+            "quiz_id": quiz_id,
+            "session_id": session_id,
+            "page_type": page_type,
+            "question_id": question_id,
+            "answer_value": answer_value,
+            "timestamp": timestamp or datetime.utcnow(),
+        })
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        if len(self._pending) > self.max_pending:
+            # The database is not keeping up; park the oldest rows on disk instead of growing without bound
+            overflow, self._pending = self._pending[:-self.batch_size], self._pending[-self.batch_size:]
+            self._overflow.extend(overflow)
+            if self._spool_task is None or self._spool_task.done():
+                self._spool_task = asyncio.get_running_loop().create_task(self._drain_overflow())
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def pending_for(self, session_id: str) -> List[Dict[str, Any]]:
+        """Rows of a session not yet committed, oldest first (in-flight ones precede newer pending ones)."""
+        return [row for row in (*self._overflow, *self._in_flight, *self._pending) if row["session_id"] == session_id]
+
+    async def start(self) -> None:
+        # Bind the primitives to the running loop; the app may be restarted within one process
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        await self._replay_spool()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._spool_task is not None:
+            await self._spool_task
+            self._spool_task = None
+        if self._overflow:
+            self._spool(self._overflow)
+            self._overflow = []
+        await self.flush()
+        if self._pending:
+            self._spool(self._pending)
+            self._pending = []
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            rows, self._pending = self._pending, []
+            # Still visible to pending_for() until committed, so a lead scored meanwhile sees every answer
+            self._in_flight = rows
+            written = 0
+            try:
+                for start in range(0, len(rows), self.batch_size):
+                    chunk = rows[start:start + self.batch_size]
+                    try:
+                        async with self.engine.begin() as conn:
+                            await conn.execute(insert(db_models.QuizInteraction.__table__).values(chunk))
+                            for hook in self.flush_hooks:
+                                await hook(conn, chunk)
+                    except Exception:
+                        logger.exception("Interaction flush failed; %d rows kept for retry", len(rows) - start)
+                        # Put the unwritten rows back ahead of anything recorded meanwhile
+                        self._pending[:0] = rows[start:]
+                        break
+                    written += len(chunk)
+                    self._in_flight = rows[start + len(chunk):]
+            finally:
+                self._in_flight = []
+            return written
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._pending:
+                await self.flush()
+
+    async def _drain_overflow(self) -> None:
+        while self._overflow:
+            rows, self._overflow = self._overflow, []
+            try:
+                await asyncio.to_thread(self._spool, rows)
+            except Exception:
+                logger.exception("Spooling failed; %d interaction rows kept in memory", len(rows))
+                self._overflow[:0] = rows
+                return
+
+    @contextmanager
+    def _spool_lock(self):
+        with open(self.spool_path + ".lock", "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _spool(self, rows: List[Dict[str, Any]]) -> None:
+        with self._spool_lock(), open(self.spool_path, "a", encoding="utf-8") as fh:
+            for row in rows:
+                fh.write(json.dumps({**row, "timestamp": row["timestamp"].isoformat()}) + "\n")
+        logger.warning("Spooled %d interaction rows to %s", len(rows), self.spool_path)
+
+    async def _replay_spool(self) -> None:
+        with self._spool_lock():
+            if os.path.exists(self.spool_path):
+                os.replace(self.spool_path, f"{self.spool_path}.replaying.{os.getpid()}.{secrets.token_hex(4)}")
+        # Ours, plus any left behind by a replay that died
+        for path in glob.glob(glob.escape(self.spool_path) + ".replaying*"):
+            await self._replay_file(path)
+
+    async def _replay_file(self, path: str) -> None:
+        try:
+            fh = open(path, encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with fh:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # another worker is replaying it
+            try:
+                if os.fstat(fh.fileno()).st_ino != os.stat(path).st_ino:
+                    return
+            except FileNotFoundError:
+                return  # replayed and removed while we waited for the lock
+            for line in fh:
+                if line.strip():
+                    row = json.loads(line)
+                    row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+                    self._pending.append(row)
+            await self.flush()
+            if self._pending:
+                # Still unreachable: hand the rows back to the spool for the next start
+                self._spool(self._pending)
+                self._pending = []
+            # Only now, with everything committed or re-spooled, and still under the lock
+            os.remove(path)
+
+
+interaction_buffer = InteractionBuffer(async_engine)
@@ -0,0 +1,296 @@
+"""Cross-worker cache invalidation bus.
+
+Every worker keeps its own compiled quizzes, rendered pages, settings, A/B
+tests and result rules in memory. Admin writes call ``publish(scope, key)``,
+which drops the entry in the local process straight away and then broadcasts
+a version bump so every other worker drops it too. Backends, picked by
+``INVALIDATION_BUS_URL``:
+
+* ``sqlite:///path/to/bus.db`` (default) - an append-only event table in a
+  small SQLite file polled every ``INVALIDATION_POLL_INTERVAL`` seconds;
+  covers several workers on one host, whatever the main database is. The
+  default file is ``invalidation_bus.db`` next to a SQLite app database, or
+  one per database URL in the system temp directory otherwise.
+* ``redis://host:6379/0`` - pub/sub on any Redis-compatible server (Redis,
+  Valkey, KeyDB, fakeredis' TCP server locally). Needs the ``redis`` package.
+* ``memory://`` - no broadcast, for a single worker.
+
+Missed messages are detected through the global version counter (the event
+id for SQLite, an ``INCR`` key for Redis); a worker that finds a gap after a
+reconnect flushes all of its caches rather than risk serving stale content.
+The cache TTLs still bound staleness if the bus itself is down.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import secrets
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Optional, Union
+
+from sqlalchemy.engine import make_url
+
+from . import ab_testing, attribution, dedupe, page_cache, quiz_settings, scoring
+from .database import SQLALCHEMY_DATABASE_URL
+from .quiz_cache import invalidate_quiz
+
+logger = logging.getLogger(__name__)
+
+
+def _default_bus_url() -> str:
+    url = make_url(SQLALCHEMY_DATABASE_URL)
+    if url.get_backend_name() == "sqlite" and url.database and url.database != ":memory:":
+        directory = os.path.dirname(os.path.abspath(url.database))
+        return f"sqlite:///{os.path.join(directory, 'invalidation_bus.db')}"
+    # Workers of one deployment share it; other deployments on the host get their own file
+    digest = hashlib.sha1(SQLALCHEMY_DATABASE_URL.encode()).hexdigest()[:12]
+    return f"sqlite:///{os.path.join(tempfile.gettempdir(), f'quiz_platform_invalidation_{digest}.db')}"
+
+
+INVALIDATION_BUS_URL = os.getenv("INVALIDATION_BUS_URL") or _default_bus_url()
+INVALIDATION_POLL_INTERVAL = float(os.getenv("INVALIDATION_POLL_INTERVAL", "0.02"))
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "quiz-platform:invalidate")
+# Events older than this many versions are pruned from the SQLite log
+INVALIDATION_LOG_KEEP = int(os.getenv("INVALIDATION_LOG_KEEP", "10000"))
+
+# Identifies this process so it skips its own broadcasts (already applied locally)
+ORIGIN = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+
+Key = Optional[Union[str, int]]
+
+
+def _flush_all(_key: Key = None) -> None:
+    invalidate_quiz(None)
+    ab_testing.invalidate_ab_tests()
+    scoring.invalidate_rules(None)
+    quiz_settings.invalidate_settings(None)
+    attribution.forget_interned()
+
+
+HANDLERS: Dict[str, Callable[[Key], None]] = {
+    "quiz": invalidate_quiz,  # key: slug; also drops that quiz's rendered pages
+    "pages": page_cache.invalidate_pages,  # key: slug
+    "ab_tests": lambda _key: ab_testing.invalidate_ab_tests(),
+    "rules": scoring.invalidate_rules,  # key: quiz id
+    "settings": quiz_settings.invalidate_settings,  # key: quiz id
+    "dedupe": dedupe.forget,  # key: quiz id
+    "hidden_values": attribution.forget_interned,
+    "all": _flush_all,
+}
+
+
+def apply(scope: str, key: Key = None) -> None:
+    handler = HANDLERS.get(scope)
+    if handler is None:
+        logger.warning("Ignoring invalidation for unknown scope %r", scope)
+        return
+    handler(key)
+
+
+class MemoryBus:
+    """Single-process bus: local invalidation only."""
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def send(self, scope: str, key: Key) -> None:
+        pass
+
+
+class SQLiteBus:
+    """Polls an append-only event table shared by the workers on one host."""
+
+    def __init__(self, path: str, poll_interval: float = INVALIDATION_POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._conn = None
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._task = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS invalidation_events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, scope TEXT NOT NULL, key TEXT, "
+            "origin TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        return conn
+
+    def _execute(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._conn = await asyncio.to_thread(self._connect)
+        rows = await asyncio.to_thread(self._execute, "SELECT COALESCE(MAX(id), 0) FROM invalidation_events")
+        self._last_id = rows[0][0]
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def send(self, scope: str, key: Key) -> None:
+        def insert():
+            with self._lock:
+                if self._conn is None:  # publishing from a process that never started the bus
+                    self._conn = self._connect()
+                cursor = self._conn.execute(
+                    "INSERT INTO invalidation_events (scope, key, origin, created_at) VALUES (?, ?, ?, ?)",
+                    (scope, json.dumps(key), ORIGIN, time.time()),
+                )
+                if cursor.lastrowid % 1000 == 0:
+                    self._conn.execute(
+                        "DELETE FROM invalidation_events WHERE id < ?", (cursor.lastrowid - INVALIDATION_LOG_KEEP,)
+                    )
+
+        await asyncio.to_thread(insert)
+
+    async def poll_once(self) -> int:
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT id, scope, key, origin FROM invalidation_events WHERE id > ? ORDER BY id",
+            (self._last_id,),
+        )
+        if rows and rows[0][0] > self._last_id + 1 and self._last_id > 0:
+            # Pruned before we read them (worker stalled for a long time)
+            first_id = (await asyncio.to_thread(self._execute, "SELECT MIN(id) FROM invalidation_events"))[0][0]
+            if first_id is not None and first_id > self._last_id + 1:
+                apply("all")
+        for event_id, scope, key, origin in rows:
+            if origin != ORIGIN:
+                apply(scope, json.loads(key))
+            self._last_id = event_id
+        return len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.poll_once()
+            except Exception:
+                logger.exception("Invalidation poll failed")
+            await asyncio.sleep(self.poll_interval)
+
+
+class RedisBus:
+    """Pub/sub on a Redis-compatible server, with an INCR version counter to detect missed events."""
+
+    def __init__(self, url: str, channel: str = INVALIDATION_CHANNEL):
+        self.url = url
+        self.channel = channel
+        self.version_key = f"{channel}:version"
+        self.client = None
+        self._version = 0
+        self._task = None
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._connect()
+        pubsub = await self._subscribe()
+        self._task = asyncio.create_task(self._run(pubsub))
+
+    def _connect(self) -> None:
+        if self.client is None:
+            import redis.asyncio as redis  # optional dependency, only needed for this backend
+
+            self.client = redis.from_url(self.url)
+
+    async def _subscribe(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self.channel)
+        # Read the counter after subscribing so nothing published in between is lost
+        current = int(await self.client.get(self.version_key) or 0)
+        if self._version and current != self._version:
+            apply("all")  # bumps were published while we were disconnected
+        self._version = current
+        return pubsub
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def send(self, scope: str, key: Key) -> None:
+        self._connect()
+        version = await self.client.incr(self.version_key)
+        await self.client.publish(
+            self.channel, json.dumps({"scope": scope, "key": key, "origin": ORIGIN, "version": version})
+        )
+
+    async def _run(self, pubsub) -> None:
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    event = json.loads(message["data"])
+                    self._version = max(self._version, event.get("version", 0))
+                    if event.get("origin") != ORIGIN:
+                        apply(event["scope"], event.get("key"))
+            except asyncio.CancelledError:
+                await pubsub.aclose()
+                raise
+            except Exception:
+                logger.exception("Invalidation subscription lost; reconnecting")
+                await asyncio.sleep(1)
+                try:
+                    await pubsub.aclose()
+                    pubsub = await self._subscribe()
+                except Exception:
+                    logger.exception("Invalidation resubscribe failed")
+
+
+def bus_from_url(url: str):
+    scheme = url.split(":", 1)[0]
+    if scheme == "memory":
+        return MemoryBus()
+    if scheme == "sqlite":
+        return SQLiteBus(url.split(":///", 1)[1])
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisBus(url)
+    raise ValueError(f"Unsupported invalidation bus URL: {url}")
+
+
+bus = bus_from_url(INVALIDATION_BUS_URL)
+
+
+async def publish(scope: str, key: Key = None) -> None:
+    """Invalidate ``scope``/``key`` here, then broadcast it to the other workers.
+
+    Call after the write has committed. A broadcast failure is logged rather
+    than raised: the write already happened and the TTLs bound the staleness.
+    """
+    apply(scope, key)
+    try:
+        await bus.send(scope, key)
+    except Exception:
+        logger.exception("Failed to broadcast %s invalidation for %r", scope, key)
@@ -0,0 +1,170 @@
+"""Keyset-paginated admin lists of quizzes and leads.
+
+Pages are fetched with ``WHERE (sort key) < (last row's key) ... LIMIT n+1``
+on an index, never with ``OFFSET``, so page 1000 costs the same as page 1.
+The cursor is the last row's key, opaque to the client. Quizzes page by
+``id``. Leads page newest first by ``(submission_date, id)`` through
+``ix_leads_quiz_id_submission_date_id``/``ix_leads_submission_date_id``;
+an email prefix becomes a range on the ``email`` index.
+
+Totals never scan the table. Lead totals come from ``daily_quiz_stats``,
+which is exact at day granularity, and are ``None`` when an email filter
+makes them unknowable. The quiz total is the planner's row estimate on
+Postgres and an exact ``COUNT(*)`` on SQLite, where quizzes number in the
+thousands at most.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import attribution, db_models
+
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(*key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, default=str).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: type) -> list:
+    """The key ``encode_cursor`` was given, checked against ``types`` since clients can send anything."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError as exc:
+        raise InvalidCursor("invalid cursor") from exc
+    if not isinstance(key, list) or len(key) != len(types):
+        raise InvalidCursor("invalid cursor")
+    # bool is an int subclass, but never a valid id
+    if any(isinstance(part, bool) or not isinstance(part, kind) for part, kind in zip(key, types)):
+        raise InvalidCursor("invalid cursor")
+    return key
+
+
+def _prefix_range(prefix: str) -> Tuple[str, str]:
+    # [prefix, prefix with its last character bumped) matches exactly the strings starting with prefix
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+async def quiz_count(db: AsyncSession) -> Tuple[int, bool]:
+    """Number of quizzes and whether it is an estimate."""
+    if db.bind.dialect.name == "postgresql":
+        estimate = await db.scalar(text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'quizzes'::regclass"))
+        if estimate is not None and estimate >= 0:
+            return estimate, True
+    return await db.scalar(select(func.count()).select_from(db_models.Quiz)), False
+
+
+async def _lead_totals(db: AsyncSession, quiz_ids: List[int]) -> Dict[int, int]:
+    if not quiz_ids:
+        return {}
+    stats = db_models.DailyQuizStats
+    rows = await db.execute(
+        select(stats.quiz_id, func.sum(stats.leads)).where(stats.quiz_id.in_(quiz_ids)).group_by(stats.quiz_id)
+    )
+    return {quiz_id: total or 0 for quiz_id, total in rows}
+
+
+async def quiz_page(
+    db: AsyncSession,
+    limit: int = 24,
+    cursor: Optional[str] = None,
+    active: Optional[bool] = None,
+    name_prefix: Optional[str] = None,
+) -> Dict[str, Any]:
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    quiz = db_models.Quiz
+    query = select(quiz.id, quiz.name, quiz.slug, quiz.description, quiz.is_active).order_by(quiz.id).limit(limit + 1)
+    if cursor:
+        (after_id,) = decode_cursor(cursor, int)
+        query = query.where(quiz.id > after_id)
+    if active is not None:
+        query = query.where(quiz.is_active == active)
+    if name_prefix:
+        low, high = _prefix_range(name_prefix)
+        query = query.where(quiz.name >= low, quiz.name < high)
+    rows = (await db.execute(query)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    lead_counts = await _lead_totals(db, [r.id for r in rows])
+    filtered = active is not None or bool(name_prefix)
+    total, total_is_estimate = (None, True) if filtered else await quiz_count(db)
+    return {
+        "items": [{**r._asdict(), "lead_count": lead_counts.get(r.id, 0)} for r in rows],
+        "next_cursor": encode_cursor(rows[-1].id) if has_more else None,
+        "total": total,
+        "total_is_estimate": total_is_estimate,
+    }
+
+
+async def _lead_total(db: AsyncSession, quiz_id: Optional[int], since: Optional[datetime], until: Optional[datetime]) -> int:
+    stats = db_models.DailyQuizStats
+    query = select(func.coalesce(func.sum(stats.leads), 0))
+    if quiz_id is not None:
+        query = query.where(stats.quiz_id == quiz_id)
+    if since is not None:
+        query = query.where(stats.day >= since.date())
+    if until is not None:
+        # ``until`` is exclusive; a bound at midnight excludes that whole day
+        last_day = until.date() if until.time() != datetime.min.time() else until.date() - timedelta(days=1)
+        query = query.where(stats.day <= last_day)
+    return await db.scalar(query)
+
+
+def _day_aligned(value: Optional[datetime]) -> bool:
+    return value is None or value.time() == datetime.min.time()
+
+
+async def lead_page(
+    db: AsyncSession,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    quiz_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    email_prefix: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Leads newest first; ``since`` is inclusive, ``until`` exclusive."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    lead = db_models.Lead
+    query = (
+        select(lead.id, lead.quiz_id, lead.email, lead.first_name, lead.last_name,
+               lead.quiz_score, lead.submission_date, lead.hidden_data)
+        .order_by(lead.submission_date.desc(), lead.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        submitted, after_id = decode_cursor(cursor, str, int)
+        try:
+            submitted = datetime.fromisoformat(submitted)
+        except ValueError as exc:
+            raise InvalidCursor("invalid cursor") from exc
+        query = query.where(tuple_(lead.submission_date, lead.id) < (submitted, after_id))
+    if quiz_id is not None:
+        query = query.where(lead.quiz_id == quiz_id)
+    if since is not None:
+        query = query.where(lead.submission_date >= since)
+    if until is not None:
+        query = query.where(lead.submission_date < until)
+    if email_prefix:
+        low, high = _prefix_range(email_prefix)
+        query = query.where(lead.email >= low, lead.email < high)
+    rows = (await db.execute(query)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    hidden = await attribution.decode_many(db, [r.hidden_data for r in rows])
+    last = rows[-1] if rows else None
+    return {
+        "items": [{**r._asdict(), "hidden_data": h} for r, h in zip(rows, hidden)],
+        "next_cursor": encode_cursor(last.submission_date.isoformat(), last.id) if has_more else None,
+        "total": None if email_prefix else await _lead_total(db, quiz_id, since, until),
+        # Rollups count whole days; partial-day bounds make the total approximate
+        "total_is_estimate": not (_day_aligned(since) and _day_aligned(until)),
+    }
@@ -0,0 +1,46 @@
+"""Schema migrations (Alembic) for the quiz platform.
+
+    python -m app.migrate              # upgrade to head
+    python -m app.migrate current      # show the applied revision
+
+The plain ``alembic`` CLI works too when run from the directory holding
+``alembic.ini``; both use ``DATABASE_URL`` through ``app.database``.
+"""
+import os
+import sys
+
+from alembic import command
+from alembic.config import Config
+
+from .database import engine
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+
+def alembic_config(connection=None) -> Config:
+    config = Config(ALEMBIC_INI)
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def upgrade_connection(connection, revision: str = "head"):
+    """Upgrade inside the caller's transaction on ``connection``."""
+    command.upgrade(alembic_config(connection), revision)
+
+
+def upgrade(revision: str = "head", bind=engine):
+    """Bring the database schema up to ``revision`` in one transaction."""
+    with bind.begin() as connection:
+        upgrade_connection(connection, revision)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:] or ["upgrade"]
+    if args[0] == "upgrade":
+        upgrade(args[1] if len(args) > 1 else "head")
+    elif args == ["current"]:
+        with engine.connect() as connection:
+            command.current(alembic_config(connection), verbose=True)
+    else:
+        sys.exit("usage: python -m app.migrate [upgrade [REVISION] | current]")
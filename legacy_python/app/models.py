@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any
 from datetime import datetime
 from pydantic import BaseModel, Field
 
@@ -26,6 +26,7 @@ class PageType(str, Enum):
     QUIZ = "quiz"
     FORM = "form"
     THANKYOU = "thankyou"
+    AB_EXPOSURE = "ab_exposure"
 
 # Entities
 
@@ -83,7 +84,8 @@ class GeneralSettings(BaseModel):
     show_branding: bool = True
     footer_text: Optional[str] = None
     enable_duplicate_check: bool = False
-    duplicate_check_criteria: Optional[List[str]] = None
+    # Lead fields the funnel collects; app.dedupe keys on them
+    duplicate_check_criteria: Optional[List[Literal["email", "first_name", "last_name"]]] = None
 
 class GoogleTagManagerSetting(BaseModel):
     quiz_id: str
@@ -186,6 +188,13 @@ class QuizSession(BaseModel):
     ip_address: Optional[str] = None
     referrer: Optional[str] = None
 
+class QuizSubmission(BaseModel):
+    # Answer value per question id, as the question page would post them
+    answers: Dict[str, str]
+    email: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+
 class ResultRule(BaseModel):
     quiz_id: str
     name: str
@@ -194,6 +203,14 @@ class ResultRule(BaseModel):
     thank_you_page_id: str
     is_active: bool
 
+class RetentionSettings(BaseModel):
+    quiz_id: str
+    # Days to keep rows before app.retention archives them; None uses the
+    # RETENTION_*_DAYS default, 0 keeps them forever
+    lead_days: Optional[int] = Field(None, ge=0)
+    session_days: Optional[int] = Field(None, ge=0)
+    interaction_days: Optional[int] = Field(None, ge=0)
+
 class ThankYouPage(BaseModel):
     quiz_id: str
     name: str
@@ -0,0 +1,290 @@
+"""Per-request query counting, timing metrics and an opt-in sampling profiler.
+
+``ObservabilityMiddleware`` gives every HTTP request a ``RequestStats`` in a
+context variable. SQLAlchemy cursor events (``instrument_engine``) add each
+statement and its duration to it, and ``TimedTemplate`` adds Jinja render
+time. When the response starts, the middleware emits a ``Server-Timing``
+header (``db``, ``render``, ``app``). When the request ends, it records
+Prometheus histograms per route template, rendered by ``render_metrics``
+for ``/metrics``. Metrics are per process; scrape each worker, or aggregate
+them in the scraper.
+
+Set ``PROFILE_SLOW_REQUEST_MS`` to turn on the sampling profiler. A daemon
+thread samples the event-loop thread's stack every
+``PROFILE_SAMPLE_INTERVAL`` seconds into a short ring buffer. Requests slower
+than the threshold dump the samples taken while they ran as folded stacks
+(``frame;frame;frame count``), ready for flamegraph.pl or speedscope, into
+``PROFILE_OUTPUT_DIR``. A sample only records (code, line) pairs. The
+formatting work happens only for slow requests, so the default 10 ms
+interval is cheap enough to leave on in production.
+"""
+import bisect
+import collections
+import contextvars
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from jinja2 import Template
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "1") == "1"
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0"))  # 0 = profiler off
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.01"))
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "./profiles")
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "render_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+
+
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    return _current.get()
+
+
+def instrument_engine(sync_engine) -> None:
+    """Attribute every statement run on ``sync_engine`` to the current request."""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += time.perf_counter() - started
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _failed(exception_context):
+        # after_cursor_execute does not fire for a failed statement
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+
+class TimedTemplate(Template):
+    """Jinja template that adds its render time to the current request's stats.
+
+    Install with ``templates.env.template_class = TimedTemplate`` before any
+    template is loaded.
+    """
+
+    def render(self, *args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return super().render(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            stats.render_seconds += time.perf_counter() - started
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with one series per label tuple."""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # per-bucket counts (+Inf last), sum, count
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(s[0]), s[1], s[2]) for labels, s in sorted(self._series.items())]
+        for labels, counts, total, count in snapshot:
+            base = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                cumulative += n
+                le = bound if bound == "+Inf" else repr(float(bound))
+                lines.append(f'{self.name}_bucket{{{base},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """Prometheus-style counter with one series per label tuple."""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple, amount: float = 1) -> None:
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._series.items())
+        for labels, value in snapshot:
+            base = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            lines.append(f"{self.name}{{{base}}} {value}")
+        return "\n".join(lines)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by route.", ("method", "route", "status"), LATENCY_BUCKETS
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements issued per request.", ("method", "route"), QUERY_BUCKETS
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time spent in SQL per request.", ("method", "route"), LATENCY_BUCKETS
+)
+REQUEST_RENDER_SECONDS = Histogram(
+    "http_request_render_seconds", "Template render time per request.", ("method", "route"), LATENCY_BUCKETS
+)
+REQUESTS_SHED = Counter(
+    "http_requests_shed_total", "Requests rejected before routing, by limiter rule and reason.", ("rule", "reason")
+)
+METRICS = [REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_DB_SECONDS, REQUEST_RENDER_SECONDS, REQUESTS_SHED]
+
+
+def render_metrics() -> str:
+    return "\n".join(m.render() for m in METRICS) + "\n"
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval into a ring buffer."""
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL, window: float = 60.0):
+        self.interval = interval
+        self.samples = collections.deque(maxlen=max(1, int(window / interval)))
+        self.thread_id = None
+        self._thread = None
+
+    def start(self, thread_id: int) -> None:
+        if self._thread is not None:
+            return
+        self.thread_id = thread_id
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            # Keep the raw (code, line) pairs; formatting waits until a slow request asks for them
+            stack = []
+            while frame is not None:
+                stack.append((frame.f_code, frame.f_lineno))
+                frame = frame.f_back
+            self.samples.append((time.perf_counter(), tuple(stack)))
+
+    def folded_between(self, started: float, ended: float, marker: Optional[str] = None) -> str:
+        """Samples in [started, ended] as folded stacks, preferring those that pass through ``marker``."""
+        stacks = [stack for at, stack in list(self.samples) if started <= at <= ended]
+        if marker:
+            stacks = [s for s in stacks if any(code.co_name == marker for code, _ in s)] or stacks
+        counts = collections.Counter(
+            ";".join(f"{code.co_name} ({os.path.basename(code.co_filename)}:{line})" for code, line in reversed(stack))
+            for stack in stacks
+        )
+        return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+
+
+sampler = StackSampler() if PROFILE_SLOW_REQUEST_MS > 0 else None
+
+
+def _write_profile(route: str, elapsed: float, folded: str) -> None:
+    os.makedirs(PROFILE_OUTPUT_DIR, exist_ok=True)
+    safe_route = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+    path = os.path.join(PROFILE_OUTPUT_DIR, f"{int(time.time() * 1000)}-{safe_route}-{int(elapsed * 1000)}ms.folded")
+    with open(path, "w") as handle:
+        handle.write(folded)
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class ObservabilityMiddleware:
+    """Pure ASGI middleware: Server-Timing header, per-route histograms, slow-request profiles."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if sampler is not None and sampler.thread_id is None:
+            sampler.start(threading.get_ident())
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING_ENABLED:
+                    app_ms = (time.perf_counter() - started) * 1000
+                    timing = (
+                        f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.queries} queries", '
+                        f"render;dur={stats.render_seconds * 1000:.2f}, app;dur={app_ms:.2f}"
+                    )
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - started
+            route = _route_label(scope)
+            method = scope["method"]
+            if METRICS_ENABLED and route != "/metrics":
+                REQUEST_SECONDS.observe((method, route, str(status)), elapsed)
+                REQUEST_QUERIES.observe((method, route), stats.queries)
+                REQUEST_DB_SECONDS.observe((method, route), stats.db_seconds)
+                REQUEST_RENDER_SECONDS.observe((method, route), stats.render_seconds)
+            if sampler is not None and elapsed * 1000 >= PROFILE_SLOW_REQUEST_MS:
+                endpoint = scope.get("endpoint")
+                folded = sampler.folded_between(started, started + elapsed, getattr(endpoint, "__name__", None))
+                if folded:
+                    _write_profile(route, elapsed, folded)
@@ -0,0 +1,95 @@
+import gzip
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Callable, Hashable, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from .cache import TTLCache
+
+PAGE_CACHE_MAXSIZE = int(os.getenv("PAGE_CACHE_MAXSIZE", "4096"))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "3600"))
+# How long browsers/CDN may reuse a page before revalidating with If-None-Match
+PAGE_MAX_AGE = int(os.getenv("PAGE_MAX_AGE", "60"))
+# Bodies at least this large are also kept gzipped, compressed once per render
+PAGE_GZIP_MIN_SIZE = int(os.getenv("PAGE_GZIP_MIN_SIZE", "1024"))
+
+
+@dataclass(frozen=True)
+class RenderedPage:
+    body: bytes
+    etag: str
+    gzipped: Optional[bytes] = None
+
+    @property
+    def gzip_etag(self) -> str:
+        # Each encoding is its own representation, so it gets its own validator
+        return self.etag[:-1] + '-gzip"'
+
+
+_cache = TTLCache(maxsize=PAGE_CACHE_MAXSIZE, ttl=PAGE_CACHE_TTL)
+
+
+def get_page(key: Hashable, render: Callable[[], str]) -> RenderedPage:
+    """Return the rendered page for ``key``, rendering it once on a miss.
+
+    Keys are expected to start with the quiz slug and include the quiz content
+    version, so an edited quiz never matches an old entry.
+    """
+    page = _cache.get(key)
+    if page is None:
+        body = render().encode("utf-8")
+        page = RenderedPage(
+            body=body,
+            etag='"%s"' % hashlib.sha256(body).hexdigest()[:32],
+            gzipped=gzip.compress(body, mtime=0) if len(body) >= PAGE_GZIP_MIN_SIZE else None,
+        )
+        _cache.set(key, page)
+    return page
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() == "gzip":
+            try:
+                return float(params.strip().partition("q=")[2] or 1) > 0
+            except ValueError:
+                return True
+    return False
+
+
+def page_response(
+    request: Request,
+    page: RenderedPage,
+    cache_control: Optional[str] = None,
+    media_type: str = "text/html; charset=utf-8",
+) -> Response:
+    compressed = page.gzipped is not None and _accepts_gzip(request.headers.get("accept-encoding"))
+    headers = {
+        "ETag": page.gzip_etag if compressed else page.etag,
+        "Cache-Control": cache_control or f"public, max-age={PAGE_MAX_AGE}, must-revalidate",
+        "Vary": "Accept-Encoding",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if compressed:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=page.gzipped, headers=headers, media_type=media_type)
+    return Response(content=page.body, headers=headers, media_type=media_type)
+
+
+def invalidate_pages(slug: Optional[str] = None) -> None:
+    if slug is None:
+        _cache.clear()
+    else:
+        _cache.prune(lambda key: key[0] == slug)
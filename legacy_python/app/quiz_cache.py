@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import db_models
+from . import page_cache
+from .cache import TTLCache
+
+QUIZ_CACHE_MAXSIZE = int(os.getenv("QUIZ_CACHE_MAXSIZE", "512"))
+QUIZ_CACHE_TTL = float(os.getenv("QUIZ_CACHE_TTL", "300"))
+
+
+@dataclass(frozen=True)
+class CompiledQuestion:
+    id: int
+    question_text: str
+    question_type: str
+    question_order: int
+    answers: Tuple[Mapping, ...]
+    progress_percentage: float
+
+
+@dataclass(frozen=True)
+class CompiledQuiz:
+    """Read-only snapshot of a quiz and its active questions, safe to share between requests."""
+
+    id: int
+    slug: str
+    name: str
+    description: Optional[str]
+    is_active: bool
+    questions: Tuple[CompiledQuestion, ...]
+    # Content hash; changes whenever anything rendered from this snapshot changes
+    version: str
+    by_order: Mapping[int, CompiledQuestion] = field(repr=False)
+
+    @property
+    def total_questions(self) -> int:
+        return len(self.questions)
+
+    def question_at(self, order: int) -> Optional[CompiledQuestion]:
+        return self.by_order.get(order)
+
+
+_cache = TTLCache(maxsize=QUIZ_CACHE_MAXSIZE, ttl=QUIZ_CACHE_TTL)
+
+
+async def compile_quiz(db: AsyncSession, slug: str) -> Optional[CompiledQuiz]:
+    quiz = await db.scalar(select(db_models.Quiz).where(db_models.Quiz.slug == slug))
+    if not quiz:
+        return None
+
+    rows = (await db.scalars(
+        select(db_models.QuizQuestion).where(
+            db_models.QuizQuestion.quiz_id == quiz.id,
+            db_models.QuizQuestion.is_active == True,  # noqa: E712
+        ).order_by(db_models.QuizQuestion.question_order)
+    )).all()
+
+    total = len(rows)
+    questions = tuple(
+        CompiledQuestion(
+            id=q.id,
+            question_text=q.question_text,
+            question_type=q.question_type,
+            question_order=q.question_order,
+            answers=tuple(MappingProxyType(dict(a)) for a in (q.answers or [])),
+            # Same formula the question page always used: share of questions already answered
+            progress_percentage=((q.question_order - 1) / total) * 100 if total else 0,
+        )
+        for q in rows
+    )
+    fingerprint = json.dumps(
+        [quiz.slug, quiz.name, quiz.description, bool(quiz.is_active),
+         [[q.id, q.question_text, q.question_type, q.question_order, q.answers] for q in rows]],
+        sort_keys=True, default=str,
+    )
+    return CompiledQuiz(
+        id=quiz.id,
+        slug=quiz.slug,
+        name=quiz.name,
+        description=quiz.description,
+        is_active=bool(quiz.is_active),
+        questions=questions,
+        version=hashlib.sha1(fingerprint.encode()).hexdigest()[:16],
+        by_order=MappingProxyType({q.question_order: q for q in questions}),
+    )
+
+
+async def get_compiled_quiz(db: AsyncSession, slug: str) -> Optional[CompiledQuiz]:
+    compiled = _cache.get(slug)
+    if compiled is None:
+        compiled = await compile_quiz(db, slug)
+        # Unknown slugs are not cached so a newly created quiz is visible immediately
+        if compiled is not None:
+            _cache.set(slug, compiled)
+    return compiled
+
+
+def invalidate_quiz(slug: Optional[str] = None) -> None:
+    if slug is None:
+        _cache.clear()
+    else:
+        _cache.pop(slug)
+    page_cache.invalidate_pages(slug)
@@ -0,0 +1,172 @@
+"""Per-quiz settings stored as validated JSON rows in ``quiz_settings``.
+
+Each row has a ``kind`` naming the Pydantic model in ``app/models.py`` that
+validates its ``config``. A quiz may have several rows of the same kind
+(e.g. two email notifications).
+
+``resolve`` loads every active row of a quiz with one query and validates it
+once into a ``QuizConfig`` of frozen models, cached per quiz until an admin
+write invalidates it. Funnel pages read all their settings from that
+snapshot, so adding a settings kind does not add a query to any page.
+"""
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ConfigDict, ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import db_models, models
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_CACHE_TTL = float(os.getenv("SETTINGS_CACHE_TTL", "60"))
+
+SETTINGS_MODELS: Dict[str, Type[BaseModel]] = {
+    "general": models.GeneralSettings,
+    "design": models.DesignSettings,
+    "intro_page": models.IntroPageSettings,
+    "contact_form": models.ContactFormSettings,
+    "hidden_field": models.HiddenField,
+    "retention": models.RetentionSettings,
+    "google_tag_manager": models.GoogleTagManagerSetting,
+    "hubspot": models.HubSpotSetting,
+    "email_notification": models.EmailNotificationSetting,
+    "facebook_pixel": models.FacebookPixelSetting,
+    "tiktok_pixel": models.TikTokPixelSetting,
+}
+
+INTEGRATION_KINDS = ("hubspot", "email_notification", "facebook_pixel", "tiktok_pixel")
+# Client-side tags rendered into the funnel pages
+TRACKING_KINDS = ("google_tag_manager", "facebook_pixel", "tiktok_pixel")
+
+
+def _frozen(model: Type[BaseModel]) -> Type[BaseModel]:
+    return type(model.__name__, (model,), {
+        "__module__": __name__,
+        "model_config": ConfigDict(**model.model_config, frozen=True),
+    })
+
+
+# Same validation, but instances cannot be mutated once shared through the cache
+FROZEN_MODELS: Dict[str, Type[BaseModel]] = {kind: _frozen(model) for kind, model in SETTINGS_MODELS.items()}
+
+
+def validate_config(kind: str, quiz_id: int, config: dict, frozen: bool = False) -> BaseModel:
+    """Validate a settings payload; ``quiz_id`` always comes from the owning quiz, not the payload."""
+    model = (FROZEN_MODELS if frozen else SETTINGS_MODELS)[kind]
+    return model.model_validate({**config, "quiz_id": str(quiz_id)})
+
+
+@dataclass(frozen=True)
+class QuizConfig:
+    """Read-only snapshot of every active setting of a quiz, safe to share between requests."""
+
+    quiz_id: int
+    # Content hash of the active rows; changes whenever any setting changes
+    version: str
+    general: models.GeneralSettings
+    design: Optional[models.DesignSettings]
+    intro_page: Optional[models.IntroPageSettings]
+    contact_form: Optional[models.ContactFormSettings]
+    hidden_fields: Tuple[models.HiddenField, ...]
+    tracking: Tuple[BaseModel, ...]
+    # (setting_id, kind, settings) for every enabled integration
+    integrations: Tuple[Tuple[int, str, BaseModel], ...]
+
+
+async def load_config(db: AsyncSession, quiz_id: int) -> QuizConfig:
+    rows = (await db.execute(
+        select(db_models.QuizSetting.id, db_models.QuizSetting.kind, db_models.QuizSetting.config).where(
+            db_models.QuizSetting.quiz_id == quiz_id,
+            db_models.QuizSetting.is_active == True,  # noqa: E712
+        ).order_by(db_models.QuizSetting.id)
+    )).all()
+
+    single: Dict[str, BaseModel] = {}
+    multiple: Dict[str, List[Tuple[int, BaseModel]]] = {}
+    for setting_id, kind, config in rows:
+        if kind not in SETTINGS_MODELS:
+            continue
+        try:
+            setting = validate_config(kind, quiz_id, config or {}, frozen=True)
+        except ValidationError:
+            # One stale row must not take every page of the quiz down with it
+            logger.warning("Skipping invalid %s setting %s of quiz %s", kind, setting_id, quiz_id, exc_info=True)
+            continue
+        # Single-valued kinds: the newest active row wins
+        single[kind] = setting
+        multiple.setdefault(kind, []).append((setting_id, setting))
+
+    def enabled(kinds):
+        return tuple(
+            (setting_id, kind, setting)
+            for kind in kinds for setting_id, setting in multiple.get(kind, ())
+            if getattr(setting, "is_enabled", True)
+        )
+
+    fingerprint = json.dumps([[r.id, r.kind, r.config] for r in rows], sort_keys=True, default=str)
+    return QuizConfig(
+        quiz_id=quiz_id,
+        version=hashlib.sha1(fingerprint.encode()).hexdigest()[:16],
+        general=single.get("general") or validate_config("general", quiz_id, {}, frozen=True),
+        design=single.get("design"),
+        intro_page=single.get("intro_page"),
+        contact_form=single.get("contact_form"),
+        hidden_fields=tuple(setting for _, setting in multiple.get("hidden_field", ())),
+        tracking=tuple(setting for _, _, setting in enabled(TRACKING_KINDS)),
+        integrations=tuple(sorted(enabled(INTEGRATION_KINDS))),
+    )
+
+
+_TRACKING_KIND_OF = {FROZEN_MODELS[kind]: kind for kind in TRACKING_KINDS}
+
+
+def public_settings(config: QuizConfig) -> Dict[str, Any]:
+    """What a client needs to render the funnel itself; hidden-field definitions and integrations stay server-side."""
+    def dump(setting: Optional[BaseModel]) -> Optional[dict]:
+        return setting.model_dump(mode="json", exclude={"quiz_id"}) if setting is not None else None
+
+    tracking: Dict[str, List[dict]] = {}
+    for setting in config.tracking:
+        tracking.setdefault(_TRACKING_KIND_OF[type(setting)], []).append(dump(setting))
+    return {
+        "version": config.version,
+        "general": dump(config.general),
+        "intro_page": dump(config.intro_page),
+        "contact_form": dump(config.contact_form),
+        "tracking": tracking,
+    }
+
+
+_config_cache = TTLCache(maxsize=1024, ttl=SETTINGS_CACHE_TTL)
+
+
+async def resolve(db: AsyncSession, quiz_id: int) -> QuizConfig:
+    config = _config_cache.get(quiz_id)
+    if config is None:
+        config = await load_config(db, quiz_id)
+        _config_cache.set(quiz_id, config)
+    return config
+
+
+async def enabled_integrations(db: AsyncSession, quiz_id: int) -> Tuple[Tuple[int, str, BaseModel], ...]:
+    """(setting_id, kind, validated settings) for every enabled integration of a quiz."""
+    return (await resolve(db, quiz_id)).integrations
+
+
+async def general_settings(db: AsyncSession, quiz_id: int) -> models.GeneralSettings:
+    """The quiz's active GeneralSettings, or the model defaults when none are stored."""
+    return (await resolve(db, quiz_id)).general
+
+
+def invalidate_settings(quiz_id: int = None) -> None:
+    if quiz_id is None:
+        _config_cache.clear()
+    else:
+        _config_cache.pop(quiz_id)
@@ -0,0 +1,220 @@
+"""Token-bucket rate limiting for the public write endpoints.
+
+``RateLimitMiddleware`` runs before routing, so a shed request never opens
+a database session, parses a form or touches the interaction buffer. Each
+``Rule`` matches ``"METHOD /path"``. Its bucket holds up to ``burst`` tokens
+and refills at ``rate`` tokens per second. The bucket is keyed by the
+visitor's signed session cookie for answers, and by client IP for
+everything else; a coarser per-IP ``writes`` rule caps all of them together,
+so minting fresh sessions does not buy a bot more throughput. Rejections get
+``429`` with ``Retry-After``. POSTs without a User-Agent are shed as bots. Every
+rejection is counted in ``http_requests_shed_total`` on ``/metrics``.
+
+Buckets live in process memory by default (``RATE_LIMIT_URL=memory://``),
+which limits each worker separately. ``redis://host:6379/0`` shares them
+between workers through an atomic Lua script; if Redis is unreachable,
+requests are let through rather than rejected.
+"""
+import logging
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Pattern, Tuple
+
+from starlette.requests import cookie_parser
+
+from . import observability
+from .sessions import SESSION_COOKIE_NAME, decode_token
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL", "memory://")
+# Only behind a proxy that appends the real client address to X-Forwarded-For
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "0") == "1"
+RATE_LIMIT_SHED_EMPTY_USER_AGENT = os.getenv("RATE_LIMIT_SHED_EMPTY_USER_AGENT", "1") == "1"
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    request: Pattern  # matched against "METHOD /path"
+    rate: float  # tokens added per second
+    burst: int
+    by_session: bool = False
+
+
+def _rule(name: str, request: str, rate: str, burst: str, by_session: bool = False) -> Rule:
+    prefix = f"RATE_LIMIT_{name.upper()}"
+    return Rule(
+        name=name,
+        request=re.compile(request),
+        rate=float(os.getenv(f"{prefix}_RATE", rate)),
+        burst=int(os.getenv(f"{prefix}_BURST", burst)),
+        by_session=by_session,
+    )
+
+
+RULES: Tuple[Rule, ...] = (
+    # Starting a quiz inserts a session row; generous enough for an office behind one NAT address
+    _rule("start", r"^GET /quiz/[^/]+/start$", "2", "30"),
+    _rule("answer", r"^POST /quiz/[^/]+/question/\d+$", "2", "20", by_session=True),
+    _rule("lead", r"^POST /quiz/[^/]+/lead-form$", "0.2", "5"),
+    # A whole funnel in one request: a session, its answers and a lead
+    _rule("submit", r"^POST /api/quiz/[^/]+/submit$", "0.2", "5"),
+    _rule("writes", r"^(?:GET /quiz/[^/]+/start|POST /quiz/[^/]+/(?:question/\d+|lead-form)|POST /api/quiz/[^/]+/submit)$", "10", "100"),
+)
+
+
+def match_rules(method: str, path: str, rules: Tuple[Rule, ...] = RULES) -> Tuple[Rule, ...]:
+    request = f"{method} {path}"
+    return tuple(rule for rule in rules if rule.request.match(request))
+
+
+class MemoryLimiter:
+    """Per-process buckets in a bounded LRU; the least recently seen keys are dropped first."""
+
+    def __init__(self, max_buckets: int = RATE_LIMIT_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        """Take one token; returns 0 when allowed, else the seconds until a token is available."""
+        # Runs on the event loop only, so no lock is needed
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def close(self) -> None:
+        pass
+
+
+# KEYS[1] bucket; ARGV rate, burst, now. Returns the wait as a string (Lua numbers become integers)
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisLimiter:
+    """Buckets shared by every worker, updated atomically by one EVALSHA per request."""
+
+    def __init__(self, url: str, prefix: str = "quiz-platform:ratelimit:"):
+        self.url = url
+        self.prefix = prefix
+        self.client = None
+        self._script = None
+
+    def _connect(self) -> None:
+        if self.client is None:
+            import redis.asyncio as redis  # optional dependency, only needed for this backend
+
+            self.client = redis.from_url(self.url)
+            self._script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        self._connect()
+        try:
+            wait = await self._script(keys=[self.prefix + key], args=[rate, burst, time.time()])
+        except Exception:
+            logger.exception("Rate limiter store unavailable; allowing request")
+            return 0.0
+        return float(wait)
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+def limiter_from_url(url: str):
+    scheme = url.split(":", 1)[0]
+    if scheme == "memory":
+        return MemoryLimiter()
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisLimiter(url)
+    raise ValueError(f"Unsupported rate limit URL: {url}")
+
+
+limiter = limiter_from_url(RATE_LIMIT_URL)
+
+
+def client_ip(scope, headers: dict) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = headers.get(b"x-forwarded-for")
+        if forwarded:
+            return forwarded.decode("latin-1").rsplit(",", 1)[-1].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def bucket_key(rule: Rule, scope, headers: dict) -> str:
+    if rule.by_session:
+        cookie = headers.get(b"cookie")
+        token = decode_token(cookie_parser(cookie.decode("latin-1")).get(SESSION_COOKIE_NAME)) if cookie else None
+        if token is not None:
+            return f"{rule.name}:s:{token.session_id}"
+    return f"{rule.name}:ip:{client_ip(scope, headers)}"
+
+
+async def _reject(send, status: int, body: bytes, retry_after: Optional[float] = None) -> None:
+    headers = [(b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(body)).encode())]
+    if retry_after is not None:
+        headers.append((b"retry-after", str(max(1, math.ceil(retry_after))).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware that sheds over-limit requests before routing."""
+
+    def __init__(self, app, limiter=None, rules: Tuple[Rule, ...] = RULES):
+        self.app = app
+        self.limiter = limiter
+        self.rules = rules
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+        rules = match_rules(scope["method"], scope["path"], self.rules)
+        if not rules:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        if RATE_LIMIT_SHED_EMPTY_USER_AGENT and scope["method"] == "POST" and not headers.get(b"user-agent"):
+            observability.REQUESTS_SHED.inc((rules[0].name, "bot"))
+            return await _reject(send, 403, b"Forbidden")
+        for rule in rules:
+            wait = await (self.limiter or limiter).acquire(bucket_key(rule, scope, headers), rule.rate, rule.burst)
+            if wait > 0:
+                observability.REQUESTS_SHED.inc((rule.name, "rate"))
+                return await _reject(send, 429, b"Too many requests", retry_after=wait)
+        return await self.app(scope, receive, send)
@@ -0,0 +1,324 @@
+"""Retention: archive old leads, sessions and interactions, then reclaim space.
+
+A quiz may store a ``retention`` setting (``RetentionSettings``) giving the
+days to keep each kind of row. Unset fields fall back to
+``RETENTION_LEAD_DAYS`` (default 0, keep forever), ``RETENTION_SESSION_DAYS``
+and ``RETENTION_INTERACTION_DAYS``.
+
+A run walks each quiz's rows in ``id`` order, ``RETENTION_BATCH_SIZE`` at a
+time. The write path assigns ids in time order, so the walk stops at the
+first row inside the retention window and never reads the hot end of a
+table. A late-flushed straggler is archived by a later run. Each batch is
+written to ``<RETENTION_ARCHIVE_DIR>/<table>/quiz_<id>/<first>-<last>.ndjson.gz``
+with ``hidden_data`` decoded, fsynced, and only then deleted in a short
+transaction of its own. A crash in between leaves a file whose rows are all
+still in the table. Before writing a batch, any file overlapping its id range
+whose first row still exists is removed. Each row therefore ends up in one
+file, even when the next run cuts its batches differently. Rows
+``app.sync`` has not exported yet are left alone, as are leads whose
+integration deliveries are still pending.
+
+Once sessions or leads were archived, ``hidden_values`` rows that no
+remaining session or lead refers to are deleted. That takes one pass over
+``hidden_data`` of both tables. Rows the warehouse sync has not exported are
+kept, as are rows ``attribution.encode`` handed out within
+``HIDDEN_VALUE_ID_TTL`` plus a day: a worker may still have the id cached, or
+a session using it may not have committed yet. The ``DELETE`` checks
+``last_seen_at`` again, so a row encoded during the run survives. Workers are
+then told through ``app.invalidation`` to drop their cached ids.
+
+The rollups are not touched, so dashboards keep counting archived rows;
+``python -m app.rollups rebuild`` only sees the raw tables and would drop
+those counts.
+
+Tables that lost rows are analyzed afterwards (``VACUUM (ANALYZE)`` on
+Postgres). SQLite reuses freed pages without vacuuming. With
+``auto_vacuum=INCREMENTAL`` they are released ``RETENTION_VACUUM_PAGES`` at a
+time. ``--vacuum`` runs a full ``VACUUM``, which locks the database while it
+runs, once more than ``RETENTION_VACUUM_FREE_RATIO`` of the file is free.
+
+    python -m app.retention --once --dry-run
+    python -m app.retention --interval 86400
+"""
+import argparse
+import asyncio
+import gzip
+import itertools
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import delete, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from . import attribution, db_models, invalidation, quiz_settings
+from .database import async_engine
+from .sync import SYNC_ENTITIES
+
+logger = logging.getLogger(__name__)
+
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "./archive")
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+RETENTION_LEAD_DAYS = int(os.getenv("RETENTION_LEAD_DAYS", "0"))
+RETENTION_SESSION_DAYS = int(os.getenv("RETENTION_SESSION_DAYS", "180"))
+RETENTION_INTERACTION_DAYS = int(os.getenv("RETENTION_INTERACTION_DAYS", "90"))
+# Rows SQLite's ANALYZE samples per index, so it stays cheap on large tables
+RETENTION_ANALYZE_LIMIT = int(os.getenv("RETENTION_ANALYZE_LIMIT", "2000"))
+RETENTION_VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "1000"))
+RETENTION_VACUUM_FREE_RATIO = float(os.getenv("RETENTION_VACUUM_FREE_RATIO", "0.25"))
+
+
+@dataclass(frozen=True)
+class Target:
+    name: str  # app.sync entity, also the archive directory
+    setting: str  # RetentionSettings field
+    default_days: int
+
+    @property
+    def table(self):
+        return SYNC_ENTITIES[self.name][0].__table__
+
+    @property
+    def date_column(self) -> str:
+        return SYNC_ENTITIES[self.name][1]
+
+
+TARGETS = (
+    Target("interactions", "interaction_days", RETENTION_INTERACTION_DAYS),
+    Target("sessions", "session_days", RETENTION_SESSION_DAYS),
+    Target("leads", "lead_days", RETENTION_LEAD_DAYS),
+)
+
+
+async def load_policies(conn: AsyncConnection) -> Dict[int, Dict[str, int]]:
+    """Days to keep per target setting, for every quiz."""
+    defaults = {target.setting: target.default_days for target in TARGETS}
+    policies = {quiz_id: dict(defaults) for quiz_id in await conn.scalars(select(db_models.Quiz.id))}
+    setting = db_models.QuizSetting
+    rows = await conn.execute(
+        select(setting.id, setting.quiz_id, setting.config)
+        .where(setting.kind == "retention", setting.is_active == True)  # noqa: E712
+        .order_by(setting.id)
+    )
+    for setting_id, quiz_id, config in rows:
+        if quiz_id not in policies:
+            continue
+        try:
+            retention = quiz_settings.validate_config("retention", quiz_id, config or {})
+        except ValidationError:
+            logger.warning("Ignoring invalid retention setting %s of quiz %s", setting_id, quiz_id, exc_info=True)
+            continue
+        policies[quiz_id].update(
+            {field: days for field, days in retention.model_dump(include=set(defaults)).items() if days is not None}
+        )
+    return policies
+
+
+def _overlapping_archives(directory: str, first_id: int, last_id: int) -> Dict[int, str]:
+    """{first id: path} of the archive files in ``directory`` sharing ids with ``[first_id, last_id]``."""
+    found = {}
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return found
+    for name in names:
+        first, _, rest = name.partition("-")
+        last = rest.partition(".")[0]
+        if not (name.endswith(".ndjson.gz") and first.isdigit() and last.isdigit()):
+            continue
+        if int(first) <= last_id and int(last) >= first_id:
+            found[int(first)] = os.path.join(directory, name)
+    return found
+
+
+async def _remove_unfinished(conn: AsyncConnection, table, directory: str, rows: List[dict]) -> None:
+    """Drop files a crashed run wrote for rows it never deleted, before ``rows`` are archived again."""
+    overlapping = await asyncio.to_thread(_overlapping_archives, directory, rows[0]["id"], rows[-1]["id"])
+    if not overlapping:
+        return
+    # A file's rows are deleted together, so its first row still being here means none were
+    unfinished = set(await conn.scalars(select(table.c.id).where(table.c.id.in_(list(overlapping)))))
+    for first_id in unfinished:
+        logger.warning("Removing %s, left by an interrupted run; its rows are archived again", overlapping[first_id])
+        await asyncio.to_thread(os.remove, overlapping[first_id])
+
+
+def write_archive(directory: str, rows: List[dict]) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{rows[0]['id']:012d}-{rows[-1]['id']:012d}.ndjson.gz")
+    partial = path + ".partial"
+    with open(partial, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as out:
+            out.write("".join(json.dumps(row, default=str) + "\n" for row in rows).encode())
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(partial, path)
+    return path
+
+
+async def _undelivered(conn: AsyncConnection, lead_ids: List[int]) -> set:
+    outbox = db_models.IntegrationOutbox
+    return set(await conn.scalars(
+        select(outbox.lead_id).where(outbox.lead_id.in_(lead_ids), outbox.status.in_(("pending", "sending")))
+    ))
+
+
+async def _delete(conn: AsyncConnection, target: Target, ids: List[int]) -> None:
+    if target.name == "leads":
+        # Archived leads can be submitted again; delivered outbox rows go with them
+        await conn.execute(delete(db_models.LeadDedupeKey).where(db_models.LeadDedupeKey.lead_id.in_(ids)))
+        await conn.execute(delete(db_models.IntegrationOutbox).where(db_models.IntegrationOutbox.lead_id.in_(ids)))
+    await conn.execute(delete(target.table).where(target.table.c.id.in_(ids)))
+
+
+async def archive_quiz(
+    conn: AsyncConnection,
+    target: Target,
+    quiz_id: int,
+    cutoff: datetime,
+    watermark: Optional[int] = None,
+    dry_run: bool = False,
+) -> int:
+    """Archive and delete one quiz's rows older than ``cutoff``, one batch per transaction."""
+    table, date_column = target.table, target.date_column
+    directory = os.path.join(RETENTION_ARCHIVE_DIR, target.name, f"quiz_{quiz_id}")
+    archived = 0
+    after = 0
+    while True:
+        query = (
+            select(table).where(table.c.quiz_id == quiz_id, table.c.id > after)
+            .order_by(table.c.id).limit(RETENTION_BATCH_SIZE)
+        )
+        if watermark is not None:
+            query = query.where(table.c.id <= watermark)
+        rows = [dict(row._mapping) for row in await conn.execute(query)]
+        expired = list(itertools.takewhile(lambda r: r[date_column] is not None and r[date_column] < cutoff, rows))
+        batch = expired
+        if expired and target.name == "leads":
+            held = await _undelivered(conn, [r["id"] for r in expired])
+            batch = [r for r in expired if r["id"] not in held]
+        if batch and not dry_run:
+            if "hidden_data" in table.c:
+                decoded = await attribution.decode_many(conn, [r["hidden_data"] for r in batch])
+                for row, hidden_data in zip(batch, decoded):
+                    row["hidden_data"] = hidden_data
+            await _remove_unfinished(conn, table, directory, batch)
+            await asyncio.to_thread(write_archive, directory, batch)
+            await _delete(conn, target, [r["id"] for r in batch])
+        await conn.commit()
+        archived += len(batch)
+        if len(expired) < len(rows) or len(rows) < RETENTION_BATCH_SIZE:
+            return archived
+        after = rows[-1]["id"]
+
+
+async def prune_hidden_values(conn: AsyncConnection, now: datetime) -> int:
+    """Delete ``hidden_values`` rows no stored session or lead refers to; returns how many went."""
+    referenced = set()
+    for model in (db_models.QuizSession, db_models.Lead):
+        result = await conn.stream(select(model.hidden_data).execution_options(yield_per=10000))
+        async for (hidden_data,) in result:
+            referenced.update(attribution.interned_ids(hidden_data))
+    hidden = db_models.HiddenValue
+    # Cached ids were seen within the TTL; the extra day covers sessions whose transaction is still open
+    unseen_since = now - timedelta(seconds=attribution.HIDDEN_VALUE_ID_TTL, days=1)
+    query = select(hidden.id).where(hidden.last_seen_at < unseen_since)
+    watermark = await conn.scalar(
+        select(db_models.SyncState.last_synced_id).where(db_models.SyncState.entity_type == "hidden_values")
+    )
+    if watermark is not None:
+        query = query.where(hidden.id <= watermark)
+    unreferenced = [value_id for value_id in await conn.scalars(query) if value_id not in referenced]
+    await conn.commit()
+    deleted = 0
+    for start in range(0, len(unreferenced), RETENTION_BATCH_SIZE):
+        result = await conn.execute(
+            delete(hidden).where(
+                hidden.id.in_(unreferenced[start:start + RETENTION_BATCH_SIZE]), hidden.last_seen_at < unseen_since
+            )
+        )
+        await conn.commit()
+        deleted += result.rowcount
+    return deleted
+
+
+async def run_once(dry_run: bool = False, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Archive every expired row; returns the rows archived (or due, when ``dry_run``) per target.
+
+    ``hidden_values`` counts the dictionary rows deleted once nothing referred to them.
+    """
+    now = now or datetime.utcnow()
+    totals = {target.name: 0 for target in TARGETS}
+    totals["hidden_values"] = 0
+    async with async_engine.connect() as conn:
+        policies = await load_policies(conn)
+        for target in TARGETS:
+            # Only rows the warehouse sync has exported, when it is in use
+            watermark = await conn.scalar(
+                select(db_models.SyncState.last_synced_id).where(db_models.SyncState.entity_type == target.name)
+            )
+            await conn.commit()
+            for quiz_id, policy in sorted(policies.items()):
+                days = policy[target.setting]
+                if days:
+                    totals[target.name] += await archive_quiz(
+                        conn, target, quiz_id, now - timedelta(days=days), watermark, dry_run
+                    )
+        if not dry_run and (totals["sessions"] or totals["leads"]):
+            totals["hidden_values"] = await prune_hidden_values(conn, now)
+    if totals["hidden_values"]:
+        await invalidation.publish("hidden_values")
+    return totals
+
+
+async def maintain(tables: Iterable[str], full_vacuum: bool = False) -> None:
+    """Refresh planner statistics of ``tables`` and give freed pages back where that is cheap."""
+    async with async_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        if conn.dialect.name == "postgresql":
+            for table in tables:
+                await conn.execute(text(f"VACUUM (ANALYZE) {table}"))
+            return
+        await conn.execute(text(f"PRAGMA analysis_limit={RETENTION_ANALYZE_LIMIT}"))
+        for table in tables:
+            await conn.execute(text(f"ANALYZE {table}"))
+        if await conn.scalar(text("PRAGMA auto_vacuum")) == 2:
+            # Each step holds the write lock only briefly
+            while await conn.scalar(text("PRAGMA freelist_count")):
+                (await conn.execute(text(f"PRAGMA incremental_vacuum({RETENTION_VACUUM_PAGES})"))).all()
+        elif full_vacuum:
+            free = await conn.scalar(text("PRAGMA freelist_count"))
+            pages = await conn.scalar(text("PRAGMA page_count"))
+            if pages and free / pages > RETENTION_VACUUM_FREE_RATIO:
+                logger.info("Vacuuming: %d of %d pages free", free, pages)
+                await conn.execute(text("VACUUM"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive quiz data past its retention period and reclaim space.")
+    parser.add_argument("--once", action="store_true", help="run a single pass and exit")
+    parser.add_argument("--interval", type=float, default=86400, help="seconds between passes")
+    parser.add_argument("--dry-run", action="store_true", help="count expired rows without archiving them")
+    parser.add_argument("--vacuum", action="store_true", help="allow a full SQLite VACUUM when enough pages are free")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def main():
+        while True:
+            totals = await run_once(dry_run=args.dry_run)
+            logger.info("Retention pass%s: %s", " (dry run)" if args.dry_run else "", totals)
+            if not args.dry_run:
+                tables = [target.table.name for target in TARGETS if totals[target.name]]
+                if totals["hidden_values"]:
+                    tables.append(db_models.HiddenValue.__tablename__)
+                await maintain(tables, full_vacuum=args.vacuum)
+            if args.once:
+                break
+            await asyncio.sleep(args.interval)
+        await async_engine.dispose()
+
+    asyncio.run(main())
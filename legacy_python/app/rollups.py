@@ -0,0 +1,184 @@
+"""Incrementally maintained counters for dashboards and analytics.
+
+``daily_quiz_stats`` holds leads, starts and completions per (quiz_id, day),
+``answer_counts`` holds the answer distribution per question and
+``question_reach`` the distinct sessions that answered each question. All are
+bumped in the same transaction as the rows they summarise, so reads scale with
+quizzes x days rather than with the size of ``leads``/``quiz_interactions``.
+
+Rebuild from the raw tables (e.g. after the first deploy) with:
+
+    python -m app.rollups rebuild
+
+A rebuild only sees rows still in the raw tables, so it drops the counts of
+anything ``app.retention`` has archived.
+"""
+import json
+import sys
+from collections import Counter
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import db_models
+from .models import PageType
+
+daily_stats = db_models.DailyQuizStats.__table__
+answer_counts = db_models.AnswerCount.__table__
+question_reach = db_models.QuestionReach.__table__
+interactions = db_models.QuizInteraction.__table__
+
+
+def _increment_stmt(dialect_name: str, table, keys: Iterable[str], counters: Iterable[str]):
+    insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    stmt = insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={c: table.c[c] + getattr(stmt.excluded, c) for c in counters},
+    )
+
+
+def answer_key(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value, sort_keys=True)
+
+
+async def record_lead(db, quiz_id: int, day: date = None) -> None:
+    """Count a lead; call inside the transaction that inserts it."""
+    stmt = _increment_stmt(db.bind.dialect.name, daily_stats, ("quiz_id", "day"), ("leads",))
+    await db.execute(stmt, [{
+        "quiz_id": quiz_id, "day": day or datetime.utcnow().date(),
+        "leads": 1, "starts": 0, "completions": 0,
+    }])
+
+
+async def _first_answers(conn, rows: List[Dict[str, Any]]) -> Counter:
+    """(quiz_id, question_id) -> sessions whose first answer to it is in ``rows``.
+
+    Runs after ``rows`` are inserted: a session reaches a question here when
+    every stored answer it gave to that question is part of this batch.
+    """
+    in_batch = Counter(
+        (row["quiz_id"], row["session_id"], row["question_id"])
+        for row in rows
+        if row["page_type"] == PageType.QUIZ.value and row["question_id"] is not None
+    )
+    reached: Counter = Counter()
+    if not in_batch:
+        return reached
+    stored = await conn.execute(
+        select(interactions.c.quiz_id, interactions.c.session_id, interactions.c.question_id, func.count())
+        .where(
+            interactions.c.session_id.in_({session_id for _, session_id, _ in in_batch}),
+            interactions.c.page_type == PageType.QUIZ.value,
+            interactions.c.question_id.is_not(None),
+        )
+        .group_by(interactions.c.quiz_id, interactions.c.session_id, interactions.c.question_id)
+    )
+    for quiz_id, session_id, question_id, n in stored:
+        if n == in_batch.get((quiz_id, session_id, question_id)):
+            reached[(quiz_id, question_id)] += 1
+    return reached
+
+
+async def apply_interactions(conn, rows: List[Dict[str, Any]]) -> None:
+    """InteractionBuffer flush hook: fold a batch of interactions into the rollups."""
+    daily: Counter = Counter()
+    answers: Counter = Counter()
+    for row in rows:
+        day = row["timestamp"].date()
+        if row["page_type"] == PageType.HOME.value:
+            daily[(row["quiz_id"], day, "starts")] += 1
+        elif row["page_type"] == PageType.FORM.value:
+            daily[(row["quiz_id"], day, "completions")] += 1
+        elif row["page_type"] == PageType.QUIZ.value and row["question_id"] is not None:
+            answers[(row["quiz_id"], row["question_id"], answer_key(row["answer_value"]))] += 1
+
+    dialect_name = conn.dialect.name
+    if daily:
+        per_day: Dict[tuple, Dict[str, int]] = {}
+        for (quiz_id, day, counter), n in daily.items():
+            entry = per_day.setdefault((quiz_id, day), {"quiz_id": quiz_id, "day": day, "leads": 0, "starts": 0, "completions": 0})
+            entry[counter] += n
+        stmt = _increment_stmt(dialect_name, daily_stats, ("quiz_id", "day"), ("starts", "completions"))
+        await conn.execute(stmt, list(per_day.values()))
+    if answers:
+        stmt = _increment_stmt(dialect_name, answer_counts, ("quiz_id", "question_id", "answer_value"), ("count",))
+        await conn.execute(stmt, [
+            {"quiz_id": quiz_id, "question_id": question_id, "answer_value": value, "count": n}
+            for (quiz_id, question_id, value), n in answers.items()
+        ])
+        reached = await _first_answers(conn, rows)
+        if reached:
+            stmt = _increment_stmt(dialect_name, question_reach, ("quiz_id", "question_id"), ("sessions",))
+            await conn.execute(stmt, [
+                {"quiz_id": quiz_id, "question_id": question_id, "sessions": n}
+                for (quiz_id, question_id), n in reached.items()
+            ])
+
+
+def rebuild(db) -> Dict[str, int]:
+    """Recompute the rollup tables from the raw rows in one transaction (sync Session)."""
+    per_day: Dict[tuple, Dict[str, Any]] = {}
+
+    def bump(quiz_id, day, counter, n):
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        entry = per_day.setdefault((quiz_id, day), {"quiz_id": quiz_id, "day": day, "leads": 0, "starts": 0, "completions": 0})
+        entry[counter] += n
+
+    lead_day = func.date(db_models.Lead.submission_date)
+    for quiz_id, day, n in db.execute(
+        select(db_models.Lead.quiz_id, lead_day, func.count()).group_by(db_models.Lead.quiz_id, lead_day)
+    ):
+        bump(quiz_id, day, "leads", n)
+
+    interaction = db_models.QuizInteraction
+    interaction_day = func.date(interaction.timestamp)
+    for quiz_id, day, page_type, n in db.execute(
+        select(interaction.quiz_id, interaction_day, interaction.page_type, func.count())
+        .where(interaction.page_type.in_([PageType.HOME.value, PageType.FORM.value]))
+        .group_by(interaction.quiz_id, interaction_day, interaction.page_type)
+    ):
+        bump(quiz_id, day, "starts" if page_type == PageType.HOME.value else "completions", n)
+
+    answers: Counter = Counter()
+    for quiz_id, question_id, value, n in db.execute(
+        select(interaction.quiz_id, interaction.question_id, interaction.answer_value, func.count())
+        .where(interaction.page_type == PageType.QUIZ.value, interaction.question_id.is_not(None))
+        .group_by(interaction.quiz_id, interaction.question_id, interaction.answer_value)
+    ):
+        answers[(quiz_id, question_id, answer_key(value))] += n
+
+    reached = db.execute(
+        select(interaction.quiz_id, interaction.question_id, func.count(interaction.session_id.distinct()))
+        .where(interaction.page_type == PageType.QUIZ.value, interaction.question_id.is_not(None))
+        .group_by(interaction.quiz_id, interaction.question_id)
+    ).all()
+
+    db.execute(delete(daily_stats))
+    db.execute(delete(answer_counts))
+    db.execute(delete(question_reach))
+    if per_day:
+        db.execute(daily_stats.insert(), list(per_day.values()))
+    if answers:
+        db.execute(answer_counts.insert(), [
+            {"quiz_id": quiz_id, "question_id": question_id, "answer_value": value, "count": n}
+            for (quiz_id, question_id, value), n in answers.items()
+        ])
+    if reached:
+        db.execute(question_reach.insert(), [
+            {"quiz_id": quiz_id, "question_id": question_id, "sessions": n} for quiz_id, question_id, n in reached
+        ])
+    db.commit()
+    return {"daily_rows": len(per_day), "answer_rows": len(answers), "reach_rows": len(reached)}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python -m app.rollups rebuild")
+    from .database import SessionLocal
+
+    with SessionLocal() as session:
+        print(rebuild(session))
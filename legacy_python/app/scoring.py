@@ -0,0 +1,304 @@
+"""Quiz scoring and result-rule resolution.
+
+Answer options may carry a numeric ``score``; a session's score is the sum of
+the scores of the options it picked. Active ``ResultRule`` ranges
+(inclusive ``[min_score, max_score]``) are cut into disjoint segments sorted
+by start, so a score resolves to its rule with one bisect. The admin API
+rejects overlapping ranges; where older rows still overlap, the rule with the
+lower ``min_score`` (then the lower id) wins. Scores matching no rule fall
+back to the quiz's default thank-you page.
+
+When rules or answer scores change, rescore stored sessions and leads with:
+
+    python -m app.scoring rescore <quiz-slug>
+"""
+import bisect
+import math
+import sys
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import db_models
+from .cache import TTLCache
+from .quiz_cache import CompiledQuiz
+
+
+@dataclass(frozen=True)
+class ResultPage:
+    id: int
+    name: str
+    headline: str
+    body_content: str
+    cta_section_title: Optional[str]
+    cta_section_text: Optional[str]
+    cta_buttons: Tuple[Mapping, ...]
+    monetary_value: Optional[float]
+
+
+@dataclass(frozen=True)
+class RuleIndex:
+    starts: Tuple[float, ...]
+    ends: Tuple[float, ...]
+    rule_ids: Tuple[int, ...]
+    pages: Tuple[Optional[ResultPage], ...]
+    default_page: Optional[ResultPage]
+
+    def resolve(self, score: float) -> Tuple[Optional[int], Optional[ResultPage]]:
+        index = bisect.bisect_right(self.starts, score) - 1
+        if index >= 0 and score <= self.ends[index]:
+            return self.rule_ids[index], self.pages[index]
+        return None, self.default_page
+
+
+def _answer_score(answer: Mapping) -> float:
+    try:
+        return float(answer.get("score", 0) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def score_table(quiz: CompiledQuiz) -> Mapping[str, Mapping[Any, float]]:
+    """{question_id: {answer_value: score}}, in the string-keyed form answers are stored in."""
+    return MappingProxyType({
+        str(q.id): MappingProxyType({a.get("value"): _answer_score(a) for a in q.answers})
+        for q in quiz.questions
+    })
+
+
+def score_answers(table: Mapping[str, Mapping[Any, float]], answers: Mapping[str, Any]) -> float:
+    total = 0.0
+    for question_id, value in answers.items():
+        weights = table.get(question_id)
+        if weights:
+            total += weights.get(value, 0.0)
+    return total
+
+
+def _to_page(page: db_models.ThankYouPage) -> ResultPage:
+    return ResultPage(
+        id=page.id,
+        name=page.name,
+        headline=page.headline,
+        body_content=page.body_content,
+        cta_section_title=page.cta_section_title,
+        cta_section_text=page.cta_section_text,
+        cta_buttons=tuple(MappingProxyType(dict(b)) for b in (page.cta_buttons or [])),
+        monetary_value=page.monetary_value,
+    )
+
+
+def build_rule_index(rules, pages) -> RuleIndex:
+    pages_by_id = {p.id: _to_page(p) for p in pages if p.is_active}
+    default_page = next((pages_by_id[p.id] for p in pages if p.is_active and p.is_default), None)
+    ordered = sorted((r for r in rules if r.is_active), key=lambda r: (r.min_score, r.id))
+    starts, ends, rule_ids, segment_pages = [], [], [], []
+    covered = -math.inf
+    for rule in ordered:
+        # Every earlier rule starts at or before this one, so together they cover [min_score, covered]
+        start = rule.min_score if rule.min_score > covered else math.nextafter(covered, math.inf)
+        if start > rule.max_score:
+            continue
+        starts.append(start)
+        ends.append(rule.max_score)
+        rule_ids.append(rule.id)
+        segment_pages.append(pages_by_id.get(rule.thank_you_page_id))
+        covered = max(covered, rule.max_score)
+    return RuleIndex(
+        starts=tuple(starts),
+        ends=tuple(ends),
+        rule_ids=tuple(rule_ids),
+        pages=tuple(segment_pages),
+        default_page=default_page,
+    )
+
+
+def overlaps(rules, min_score: float, max_score: float) -> bool:
+    """Whether ``[min_score, max_score]`` shares a score with any active rule."""
+    return any(r.is_active and r.min_score <= max_score and min_score <= r.max_score for r in rules)
+
+
+_score_tables = TTLCache(maxsize=512, ttl=3600)
+_rule_indexes = TTLCache(maxsize=512, ttl=300)
+
+
+def get_score_table(quiz: CompiledQuiz) -> Mapping[str, Mapping[Any, float]]:
+    key = (quiz.id, quiz.version)
+    table = _score_tables.get(key)
+    if table is None:
+        table = score_table(quiz)
+        _score_tables.set(key, table)
+    return table
+
+
+async def get_rule_index(db: AsyncSession, quiz_id: int) -> RuleIndex:
+    index = _rule_indexes.get(quiz_id)
+    if index is None:
+        rules = (await db.scalars(select(db_models.ResultRule).where(db_models.ResultRule.quiz_id == quiz_id))).all()
+        pages = (await db.scalars(select(db_models.ThankYouPage).where(db_models.ThankYouPage.quiz_id == quiz_id))).all()
+        index = build_rule_index(rules, pages)
+        _rule_indexes.set(quiz_id, index)
+    return index
+
+
+def invalidate_rules(quiz_id: Optional[int] = None) -> None:
+    if quiz_id is None:
+        _rule_indexes.clear()
+    else:
+        _rule_indexes.pop(quiz_id)
+
+
+async def evaluate(db: AsyncSession, quiz: CompiledQuiz, answers: Mapping[str, Any]) -> Dict[str, Any]:
+    """Score a set of answers and resolve it to a rule; the result is stored as the session's quiz_result."""
+    score = score_answers(get_score_table(quiz), answers)
+    rule_id, page = (await get_rule_index(db, quiz.id)).resolve(score)
+    return {
+        "score": score,
+        "rule_id": rule_id,
+        "thank_you_page_id": page.id if page else None,
+        "headline": page.headline if page else None,
+    }
+
+
+def rescore_sessions(db, quiz: CompiledQuiz, chunk_size: int = 50000) -> Dict[str, int]:
+    """Recompute stored results of a quiz after its rules or answer scores changed (sync Session).
+
+    Completed sessions (every session with a lead has completed the lead form)
+    get a new ``quiz_result``, and their leads' ``quiz_score`` and
+    ``quiz_outcome_headline`` are updated in the same transaction. Leads whose
+    session is gone are rescored from their own ``quiz_answers``. Sessions that
+    never finished are left without a result.
+
+    Answers are encoded into per-question integer codes so both the score sum and
+    the rule lookup (``searchsorted`` over the rule starts) run as NumPy array
+    operations over a whole chunk of sessions.
+    """
+    import numpy as np
+    from sqlalchemy import bindparam, exists, update
+
+    table = score_table(quiz)
+    index = build_rule_index(
+        db.scalars(select(db_models.ResultRule).where(db_models.ResultRule.quiz_id == quiz.id)).all(),
+        db.scalars(select(db_models.ThankYouPage).where(db_models.ThankYouPage.quiz_id == quiz.id)).all(),
+    )
+    # Per question: answer value -> code, and code -> score (code 0 means unanswered/unknown)
+    columns = []
+    for question_id, weights in table.items():
+        values = list(weights)
+        codes = {value: i + 1 for i, value in enumerate(values)}
+        columns.append((question_id, codes, np.array([0.0] + [weights[v] for v in values])))
+    starts = np.array(index.starts, dtype=float)
+    ends = np.array(index.ends, dtype=float)
+    default_page = index.default_page
+
+    def evaluate_chunk(answers):
+        scores = np.zeros(len(answers))
+        for question_id, codes, weights in columns:
+            encoded = np.fromiter((codes.get(a.get(question_id), 0) for a in answers), dtype=np.int64, count=len(answers))
+            scores += weights[encoded]
+
+        if len(starts):
+            positions = np.searchsorted(starts, scores, side="right") - 1
+            clipped = np.clip(positions, 0, None)
+            matched = (positions >= 0) & (scores <= ends[clipped])
+        else:
+            clipped = np.zeros(len(answers), dtype=np.int64)
+            matched = np.zeros(len(answers), dtype=bool)
+
+        results = []
+        for score, hit, position in zip(scores.tolist(), matched.tolist(), clipped.tolist()):
+            page = index.pages[position] if hit else default_page
+            results.append({
+                "score": score,
+                "rule_id": index.rule_ids[position] if hit else None,
+                "thank_you_page_id": page.id if page else None,
+                "headline": page.headline if page else None,
+            })
+        return results
+
+    sessions = db_models.QuizSession.__table__
+    leads = db_models.Lead.__table__
+    session_stmt = (
+        update(sessions)
+        .where(sessions.c.id == bindparam("_id"))
+        .values(quiz_result=bindparam("quiz_result"))
+    )
+    lead_values = {"quiz_score": bindparam("_score"), "quiz_outcome_headline": bindparam("_headline")}
+    leads_of_session_stmt = (
+        update(leads)
+        .where(leads.c.quiz_id == quiz.id, leads.c.session_id == bindparam("_session_id"))
+        .values(**lead_values)
+    )
+    lead_stmt = update(leads).where(leads.c.id == bindparam("_id")).values(**lead_values)
+    has_session = exists().where(sessions.c.session_id == leads.c.session_id)
+
+    totals = {"sessions": 0, "leads": 0}
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(sessions.c.id, sessions.c.session_id, sessions.c.quiz_answers)
+            .where(
+                sessions.c.quiz_id == quiz.id,
+                sessions.c.id > last_id,
+                sessions.c.completed_at.is_not(None),
+            )
+            .order_by(sessions.c.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        results = evaluate_chunk([r.quiz_answers or {} for r in rows])
+        db.execute(session_stmt, [{"_id": r.id, "quiz_result": result} for r, result in zip(rows, results)])
+        updated = db.execute(leads_of_session_stmt, [
+            {"_session_id": r.session_id, "_score": result["score"], "_headline": result["headline"]}
+            for r, result in zip(rows, results)
+        ])
+        db.commit()
+        totals["sessions"] += len(rows)
+        totals["leads"] += updated.rowcount
+        last_id = rows[-1].id
+
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(leads.c.id, leads.c.quiz_answers)
+            .where(leads.c.quiz_id == quiz.id, leads.c.id > last_id, ~has_session)
+            .order_by(leads.c.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        results = evaluate_chunk([r.quiz_answers or {} for r in rows])
+        db.execute(lead_stmt, [
+            {"_id": r.id, "_score": result["score"], "_headline": result["headline"]}
+            for r, result in zip(rows, results)
+        ])
+        db.commit()
+        totals["leads"] += len(rows)
+        last_id = rows[-1].id
+    return totals
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "rescore":
+        sys.exit("usage: python -m app.scoring rescore <quiz-slug>")
+    import asyncio
+
+    from .database import AsyncSessionLocal, SessionLocal
+    from .quiz_cache import compile_quiz
+
+    async def _compile(slug):
+        async with AsyncSessionLocal() as session:
+            return await compile_quiz(session, slug)
+
+    compiled = asyncio.run(_compile(sys.argv[2]))
+    if compiled is None:
+        sys.exit(f"Quiz not found: {sys.argv[2]}")
+    started = time.perf_counter()
+    with SessionLocal() as session:
+        totals = rescore_sessions(session, compiled)
+    print(f"Rescored {totals['sessions']} sessions and {totals['leads']} leads in {time.perf_counter() - started:.2f}s")
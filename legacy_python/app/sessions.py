@@ -0,0 +1,151 @@
+import hashlib
+import hmac
+import os
+import secrets
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import JSON, cast, func, literal, select, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import db_models
+from .interaction_log import interaction_buffer
+from .models import PageType
+
+SESSION_COOKIE_NAME = "quiz_session"
+SESSION_MAX_AGE = int(os.getenv("SESSION_MAX_AGE", str(60 * 60 * 24 * 30)))
+SESSION_COOKIE_SECURE = os.getenv("SESSION_COOKIE_SECURE", "0") in ("1", "true", "True")
+# Cookies signed by one worker must verify on every other one and across
+# restarts. Without SESSION_SECRET, the secret app.bootstrap stored in
+# app_secrets is loaded at startup.
+SESSION_SECRET = os.getenv("SESSION_SECRET")
+SESSION_SECRET_NAME = "session"
+
+
+@dataclass(frozen=True)
+class SessionToken:
+    session_id: str
+    quiz_id: int
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+async def load_session_secret(db: AsyncSession) -> None:
+    """Use the shared secret from ``app_secrets`` unless ``SESSION_SECRET`` is set; fail if neither exists."""
+    global SESSION_SECRET
+    if os.getenv("SESSION_SECRET"):
+        return
+    SESSION_SECRET = await db.scalar(
+        select(db_models.AppSecret.value).where(db_models.AppSecret.name == SESSION_SECRET_NAME)
+    )
+    if not SESSION_SECRET:
+        raise RuntimeError("SESSION_SECRET is not set and no shared secret is stored; run `python -m app.bootstrap`")
+
+
+def _sign(payload: str) -> str:
+    return hmac.new(SESSION_SECRET.encode(), payload.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def encode_token(token: SessionToken) -> str:
+    payload = f"{token.session_id}:{token.quiz_id}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def decode_token(value: Optional[str]) -> Optional[SessionToken]:
+    if not value or "." not in value:
+        return None
+    payload, signature = value.rsplit(".", 1)
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    session_id, _, quiz_id = payload.partition(":")
+    if not session_id or not quiz_id.isdigit():
+        return None
+    return SessionToken(session_id=session_id, quiz_id=int(quiz_id))
+
+
+def read_session(request: Request, quiz_id: int) -> Optional[SessionToken]:
+    """Return the visitor's session for this quiz, if the cookie is valid and belongs to it."""
+    token = decode_token(request.cookies.get(SESSION_COOKIE_NAME))
+    if token is None or token.quiz_id != quiz_id:
+        return None
+    return token
+
+
+def set_session_cookie(response: Response, token: SessionToken) -> None:
+    response.set_cookie(
+        SESSION_COOKIE_NAME,
+        encode_token(token),
+        max_age=SESSION_MAX_AGE,
+        httponly=True,
+        samesite="lax",
+        secure=SESSION_COOKIE_SECURE,
+    )
+
+
+async def start_session(
+    db: AsyncSession,
+    quiz_id: int,
+    request: Request,
+    ab_test_assignments: Optional[Dict[str, str]] = None,
+    hidden_data: Optional[List[Any]] = None,
+) -> SessionToken:
+    token = SessionToken(session_id=new_session_id(), quiz_id=quiz_id)
+    db.add(db_models.QuizSession(
+        session_id=token.session_id,
+        quiz_id=quiz_id,
+        ab_test_assignments=ab_test_assignments or {},
+        hidden_data=hidden_data or [],
+        user_agent=request.headers.get("user-agent"),
+        ip_address=request.client.host if request.client else None,
+        referrer=request.headers.get("referer"),
+    ))
+    await db.commit()
+    return token
+
+
+async def record_answer(db: AsyncSession, session_id: str, question_id: int, value: str) -> None:
+    """Store one answer on the session row right away.
+
+    The interaction row goes through the write-behind buffer of whichever
+    worker served the request. The lead form may be served by another
+    worker, and it reads the answers from here.
+    """
+    sessions = db_models.QuizSession.__table__
+    if db.bind.dialect.name == "postgresql":
+        merged = cast(
+            func.coalesce(cast(sessions.c.quiz_answers, postgresql.JSONB), literal("{}", postgresql.JSONB))
+            .op("||")(func.jsonb_build_object(str(question_id), value)),
+            JSON,
+        )
+    else:
+        merged = func.json_set(func.coalesce(sessions.c.quiz_answers, "{}"), f'$."{question_id}"', value)
+    await db.execute(update(sessions).where(sessions.c.session_id == session_id).values(quiz_answers=merged))
+    await db.commit()
+
+
+async def collect_answers(db: AsyncSession, session_id: str) -> Dict[str, Any]:
+    """Latest answer per question id for a session.
+
+    Answers stored on the session row by ``record_answer`` win. Interactions,
+    including this worker's unflushed ones, cover sessions that started
+    before answers were stored there.
+    """
+    interaction = db_models.QuizInteraction
+    rows = await db.execute(
+        select(interaction.question_id, interaction.answer_value)
+        .where(interaction.session_id == session_id, interaction.page_type == PageType.QUIZ.value)
+        .order_by(interaction.id)
+    )
+    answers = {str(question_id): value for question_id, value in rows if question_id is not None}
+    for row in interaction_buffer.pending_for(session_id):
+        if row["page_type"] == PageType.QUIZ.value and row["question_id"] is not None:
+            answers[str(row["question_id"])] = row["answer_value"]
+    stored = await db.scalar(
+        select(db_models.QuizSession.quiz_answers).where(db_models.QuizSession.session_id == session_id)
+    )
+    answers.update(stored or {})
+    return answers
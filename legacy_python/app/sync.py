@@ -0,0 +1,306 @@
+"""Incremental export of leads, sessions and interactions to a warehouse.
+
+Each entity keeps an id watermark in ``sync_state``. A run reads rows in
+keyset-paginated batches (short read-only transactions, no table scans),
+hands each batch to a sink and advances the watermark after the sink accepts
+it. Ids are assigned before their transaction commits, so a row can appear
+below the watermark after a run has passed it. Ids a batch skipped are kept
+as ranges in ``sync_state.id_gaps``; each run looks those ranges up again
+and exports whatever has committed since. A range still empty after
+``SYNC_GAP_TIMEOUT_SECONDS`` belongs to a rolled-back or deleted row and is
+dropped. Delivery is at-least-once, so sinks upsert by ``id``.
+
+Sessions change after they are created (lead form, rescoring). Their
+``updated_at`` is tracked too: a run re-exports already synced sessions
+changed since the previous run started, less ``SYNC_UPDATE_LAG_SECONDS`` for
+transactions still open then and clock skew between hosts. Only new rows
+count towards ``records_synced``.
+
+    SYNC_SINK=file:///var/exports python -m app.sync --once
+    SYNC_SINK=bigquery://my-project/quiz_analytics python -m app.sync --interval 300
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Protocol, Tuple
+
+from sqlalchemy import or_, select, tuple_
+from sqlalchemy.orm import Session
+
+from . import db_models
+from .models import BigQuerySyncState, SyncStatus
+
+logger = logging.getLogger(__name__)
+
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "5000"))
+SYNC_GAP_TIMEOUT_SECONDS = int(os.getenv("SYNC_GAP_TIMEOUT_SECONDS", "3600"))
+# Oldest gaps are given up first once there are more than this
+SYNC_MAX_GAPS = int(os.getenv("SYNC_MAX_GAPS", "1000"))
+SYNC_UPDATE_LAG_SECONDS = int(os.getenv("SYNC_UPDATE_LAG_SECONDS", "300"))
+
+# entity_type -> (model, column used for last_synced_date)
+SYNC_ENTITIES = {
+    "leads": (db_models.Lead, "submission_date"),
+    "sessions": (db_models.QuizSession, "started_at"),
+    "interactions": (db_models.QuizInteraction, "timestamp"),
+    # Dictionary for the interned ids in leads/sessions hidden_data
+    "hidden_values": (db_models.HiddenValue, "created_at"),
+}
+
+# entity_type -> column bumped whenever a synced row changes
+SYNC_UPDATE_COLUMNS = {
+    "sessions": "updated_at",
+}
+
+
+class Sink(Protocol):
+    def write(self, entity_type: str, rows: List[Dict[str, Any]]) -> None: ...
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class FileSink:
+    """Appends NDJSON files per entity and day; meant for local runs and tests.
+
+    Re-exported rows are appended again, so readers keep the last line per ``id``.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, entity_type: str, rows: List[Dict[str, Any]]) -> None:
+        path = os.path.join(self.directory, f"{entity_type}-{date.today().isoformat()}.ndjson")
+        with open(path, "a", encoding="utf-8") as fh:
+            for row in rows:
+                fh.write(json.dumps(row, default=_json_default) + "\n")
+
+
+class SQLiteSink:
+    """Upserts rows as JSON payloads into a separate SQLite file, one table per entity."""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+
+    def write(self, entity_type: str, rows: List[Dict[str, Any]]) -> None:
+        with self.conn:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {entity_type} (id INTEGER PRIMARY KEY, payload TEXT NOT NULL)")
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO {entity_type} (id, payload) VALUES (?, ?)",
+                [(row["id"], json.dumps(row, default=_json_default)) for row in rows],
+            )
+
+
+class BigQuerySink:
+    """Streams rows into ``<dataset>.<entity_type>`` tables. Requires google-cloud-bigquery."""
+
+    def __init__(self, project: str, dataset: str):
+        from google.cloud import bigquery
+
+        self.client = bigquery.Client(project=project)
+        self.dataset = dataset
+
+    def write(self, entity_type: str, rows: List[Dict[str, Any]]) -> None:
+        table = f"{self.client.project}.{self.dataset}.{entity_type}"
+        payload = json.loads(json.dumps(rows, default=_json_default))
+        # row_ids make BigQuery's best-effort dedup drop rows replayed after a failed run
+        errors = self.client.insert_rows_json(table, payload, row_ids=[str(row["id"]) for row in rows])
+        if errors:
+            raise RuntimeError(f"BigQuery rejected {len(errors)} rows for {entity_type}: {errors[:3]}")
+
+
+def sink_from_url(url: str) -> Sink:
+    scheme, _, rest = url.partition("://")
+    if scheme == "file":
+        return FileSink(rest)
+    if scheme == "sqlite":
+        return SQLiteSink(rest)
+    if scheme == "bigquery":
+        project, _, dataset = rest.partition("/")
+        return BigQuerySink(project, dataset)
+    raise ValueError(f"Unsupported sync sink: {url}")
+
+
+def _load_state(db: Session, entity_type: str) -> db_models.SyncState:
+    state = db.get(db_models.SyncState, entity_type)
+    if state is None:
+        state = db_models.SyncState(entity_type=entity_type, last_synced_id=0, records_synced=0)
+        db.add(state)
+        db.commit()
+    return state
+
+
+def _gaps_in(after: int, ids: Iterable[int]) -> List[Tuple[int, int]]:
+    """Inclusive id ranges between ``after`` and the last of the sorted ``ids`` that ``ids`` skip."""
+    gaps = []
+    previous = after
+    for value in ids:
+        if value > previous + 1:
+            gaps.append((previous + 1, value - 1))
+        previous = value
+    return gaps
+
+
+def _fill_gaps(db: Session, sink: Sink, entity_type: str, table, gaps: List[list]) -> Tuple[List[list], int]:
+    """Export rows committed inside ``gaps`` since they were recorded.
+
+    Returns the ranges still empty and the number of rows exported.
+    """
+    remaining, filled = [], 0
+    for start in range(0, len(gaps), 100):
+        chunk = gaps[start:start + 100]
+        rows = [
+            dict(row._mapping)
+            for row in db.execute(
+                select(table)
+                .where(or_(*(table.c.id.between(first, last) for first, last, _ in chunk)))
+                .order_by(table.c.id)
+            )
+        ]
+        db.rollback()
+        if rows:
+            sink.write(entity_type, rows)
+            filled += len(rows)
+        found = [row["id"] for row in rows]
+        for first, last, seen_at in chunk:
+            inside = [value for value in found if first <= value <= last]
+            remaining.extend([low, high, seen_at] for low, high in _gaps_in(first - 1, [*inside, last + 1]))
+    return remaining, filled
+
+
+def _changed_rows(db: Session, table, column, since: datetime, up_to_id: int, batch_size: int):
+    """Rows up to ``up_to_id`` whose ``column`` is at or after ``since``, in batches."""
+    after = None
+    while True:
+        query = (
+            select(table)
+            .where(table.c[column] >= since, table.c.id <= up_to_id)
+            .order_by(table.c[column], table.c.id)
+            .limit(batch_size)
+        )
+        if after is not None:
+            query = query.where(tuple_(table.c[column], table.c.id) > after)
+        rows = [dict(row._mapping) for row in db.execute(query)]
+        db.rollback()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        after = (rows[-1][column], rows[-1]["id"])
+
+
+def sync_entity(db: Session, sink: Sink, entity_type: str, batch_size: int = SYNC_BATCH_SIZE, max_batches: Optional[int] = None) -> int:
+    """Export new and changed rows of one entity; returns the rows handed to the sink, re-exports included."""
+    model, date_column = SYNC_ENTITIES[entity_type]
+    update_column = SYNC_UPDATE_COLUMNS.get(entity_type)
+    table = model.__table__
+    state = _load_state(db, entity_type)
+    state.status = SyncStatus.RUNNING.value
+    state.last_run_timestamp = started = datetime.utcnow()
+    db.commit()
+
+    previous_id = state.last_synced_id
+    synced = 0
+    batches = 0
+    try:
+        gaps, filled = _fill_gaps(db, sink, entity_type, table, state.id_gaps or [])
+        expired = (started - timedelta(seconds=SYNC_GAP_TIMEOUT_SECONDS)).isoformat()
+        state.id_gaps = [gap for gap in gaps if gap[2] >= expired]
+        state.records_synced += filled
+        db.commit()
+        synced += filled
+
+        after = previous_id
+        while max_batches is None or batches < max_batches:
+            rows = [
+                dict(row._mapping)
+                for row in db.execute(
+                    select(table).where(table.c.id > after).order_by(table.c.id).limit(batch_size)
+                )
+            ]
+            # End the read transaction before calling out to the sink
+            db.rollback()
+            if not rows:
+                break
+            sink.write(entity_type, rows)
+
+            skipped = [[first, last, started.isoformat()] for first, last in _gaps_in(after, (r["id"] for r in rows))]
+            if skipped:
+                state.id_gaps = [*state.id_gaps, *skipped][-SYNC_MAX_GAPS:]
+            after = state.last_synced_id = rows[-1]["id"]
+            state.last_synced_date = rows[-1][date_column] or state.last_synced_date
+            state.records_synced += len(rows)
+            db.commit()
+            synced += len(rows)
+            batches += 1
+            if len(rows) < batch_size:
+                break
+
+        if update_column and (max_batches is None or batches < max_batches):
+            if state.last_synced_updated_at is not None:
+                since = state.last_synced_updated_at - timedelta(seconds=SYNC_UPDATE_LAG_SECONDS)
+                # Rows above previous_id went out with their current state in the id pass above
+                for rows in _changed_rows(db, table, update_column, since, previous_id, batch_size):
+                    sink.write(entity_type, rows)
+                    synced += len(rows)
+            state.last_synced_updated_at = started
+            db.commit()
+    except Exception as exc:
+        db.rollback()
+        state.status = SyncStatus.FAILED.value
+        state.last_run_message = f"{type(exc).__name__}: {exc}"[:500]
+        db.commit()
+        logger.exception("Sync of %s failed after %d rows", entity_type, synced)
+        return synced
+
+    state.status = SyncStatus.SUCCESS.value
+    state.last_run_message = f"Synced {synced} rows"
+    db.commit()
+    return synced
+
+
+def run_once(db: Session, sink: Sink, batch_size: int = SYNC_BATCH_SIZE) -> Dict[str, int]:
+    return {entity_type: sync_entity(db, sink, entity_type, batch_size) for entity_type in SYNC_ENTITIES}
+
+
+def sync_states(db: Session) -> List[BigQuerySyncState]:
+    return [
+        BigQuerySyncState(
+            entity_type=state.entity_type,
+            last_synced_date=state.last_synced_date or datetime.min,
+            status=state.status or SyncStatus.SUCCESS.value,
+            last_run_message=state.last_run_message,
+            last_run_timestamp=state.last_run_timestamp or datetime.min,
+            records_synced=state.records_synced,
+        )
+        for state in db.scalars(select(db_models.SyncState).order_by(db_models.SyncState.entity_type))
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally sync quiz data to a warehouse sink.")
+    parser.add_argument("--sink", default=os.getenv("SYNC_SINK", "file://./sync_output"))
+    parser.add_argument("--batch-size", type=int, default=SYNC_BATCH_SIZE)
+    parser.add_argument("--once", action="store_true", help="run a single pass and exit")
+    parser.add_argument("--interval", type=float, default=300, help="seconds between passes")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from .database import SessionLocal
+
+    sink = sink_from_url(args.sink)
+    while True:
+        with SessionLocal() as session:
+            logger.info("Sync pass: %s", run_once(session, sink, args.batch_size))
+        if args.once:
+            break
+        time.sleep(args.interval)
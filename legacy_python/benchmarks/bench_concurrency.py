@@ -0,0 +1,79 @@
+"""Concurrent funnel load against the app running in-process.
+
+Mixes question page views with lead-form submits and reports latency
+percentiles, so event-loop blocking in the handlers shows up as p99 growth.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/bench_concurrency.py --clients 50 --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Every simulated client shares one address; the limiter would shed most of the load
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def client_loop(client, slug, count, write_every, latencies, errors):
+    for i in range(count):
+        started = time.perf_counter()
+        if write_every and i % write_every == 0:
+            response = await client.post(f"/quiz/{slug}/lead-form", data={"email": f"bench{i}@example.com"})
+        else:
+            response = await client.get(f"/quiz/{slug}/question/{i % 2 + 1}")
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            errors.append(response.status_code)
+
+
+async def run(args):
+    transport = httpx.ASGITransport(app=main.app)
+    latencies = []
+    errors = []
+    per_client = max(1, args.requests // args.clients)
+    await main.app.router.startup()  # ASGITransport does not send lifespan events
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.get(f"/quiz/{args.slug}")  # warm caches
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                client_loop(client, args.slug, per_client, args.write_every, latencies, errors)
+                for _ in range(args.clients)
+            ))
+            elapsed = time.perf_counter() - started
+    finally:
+        await main.app.router.shutdown()
+    return {
+        "clients": args.clients,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--slug", default="marketing-strategy")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--write-every", type=int, default=10, help="every Nth request is a lead submit (0 = reads only)")
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
@@ -0,0 +1,378 @@
+"""Reproducible load test for the quiz funnel and the admin dashboards.
+
+Builds a throwaway database seeded with ``--quizzes`` x ``--questions`` and
+``--leads`` historical leads, then runs ``--users`` virtual users against the
+app for ``--duration`` seconds. Each user either walks a whole funnel (intro ->
+start -> every question, answering it -> lead form -> submit -> results) or,
+with probability ``--admin-ratio``, loads the admin dashboard and analytics.
+With ``--api-ratio``, that share of funnels goes through the JSON API
+instead: one quiz fetch and one submit.
+
+The app runs in-process over ASGI (default) or under uvicorn
+(``--server uvicorn --workers N``). Either way a thin ASGI wrapper counts the
+SQL statements and DB time of every request through SQLAlchemy engine events
+and reports them in response headers, so the results include queries per
+request per route.
+
+    python benchmarks/bench_funnel.py --leads 1000000 --users 50 --duration 30 > run.json
+    python benchmarks/bench_funnel.py --baseline run.json      # exit 1 on regression
+
+Output is JSON: seeding timings, overall and per-route throughput, error
+counts, p50/p95/p99 latency and mean queries/DB time per request.
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+_request_stats = contextvars.ContextVar("bench_request_stats", default=None)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# --- instrumented app -------------------------------------------------------
+
+def install_query_counter(sync_engine):
+    from sqlalchemy import event
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("bench_query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["bench_query_started"].pop()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats["queries"] += 1
+            stats["db_ms"] += (time.perf_counter() - started) * 1000
+
+
+def instrumented_app():
+    """``main.app`` wrapped so each response carries its query count and DB time."""
+    import main
+    from app.database import async_engine
+
+    install_query_counter(async_engine.sync_engine)
+    app = main.app
+
+    async def wrapped(scope, receive, send):
+        if scope["type"] != "http":
+            return await app(scope, receive, send)
+        stats = {"queries": 0, "db_ms": 0.0}
+        token = _request_stats.set(stats)
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [
+                    *message.get("headers", []),
+                    (b"x-bench-queries", str(stats["queries"]).encode()),
+                    (b"x-bench-db-ms", f"{stats['db_ms']:.3f}".encode()),
+                ]}
+            await send(message)
+
+        try:
+            await app(scope, receive, send_with_stats)
+        finally:
+            _request_stats.reset(token)
+
+    return wrapped
+
+
+# --- seeding ------------------------------------------------------------------
+
+def seed(args):
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import insert, select
+
+    from app import bootstrap, db_models, rollups
+    from app.database import SessionLocal, engine
+
+    timings = {}
+    started = time.perf_counter()
+    bootstrap.ensure_ready(seed=False)
+    timings["migrate_s"] = round(time.perf_counter() - started, 2)
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(insert(db_models.Quiz), [
+            {"slug": f"bench-{i}", "name": f"Benchmark Quiz {i}", "description": "Seeded by bench_funnel",
+             "is_active": True, "created_at": now}
+            for i in range(args.quizzes)
+        ])
+        quiz_ids = list(conn.scalars(select(db_models.Quiz.id).order_by(db_models.Quiz.id)))
+        conn.execute(insert(db_models.QuizQuestion), [
+            {
+                "quiz_id": quiz_id,
+                "question_text": f"Question {order}?",
+                "question_type": "multiple_choice",
+                "question_order": order,
+                "answers": [
+                    {"value": f"a{n}", "label": f"Answer {n}", "score": n} for n in range(args.answers)
+                ],
+                "is_active": True,
+            }
+            for quiz_id in quiz_ids
+            for order in range(1, args.questions + 1)
+        ])
+        remaining = args.leads
+        while remaining > 0:
+            chunk = min(remaining, 50_000)
+            conn.execute(insert(db_models.Lead), [
+                {
+                    "quiz_id": rng.choice(quiz_ids),
+                    "email": f"seed{remaining - n}@example.com",
+                    "first_name": "Seed",
+                    "submission_date": now - timedelta(seconds=rng.randrange(90 * 86400)),
+                }
+                for n in range(chunk)
+            ])
+            remaining -= chunk
+    timings["insert_s"] = round(time.perf_counter() - started, 2)
+
+    started = time.perf_counter()
+    with SessionLocal() as session:
+        rollups.rebuild(session)
+    timings["rollups_s"] = round(time.perf_counter() - started, 2)
+    return timings
+
+
+# --- traffic ------------------------------------------------------------------
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def add(self, route, response, elapsed_ms):
+        self.samples[route].append((
+            elapsed_ms,
+            response.status_code,
+            int(response.headers.get("x-bench-queries", 0)),
+            float(response.headers.get("x-bench-db-ms", 0)),
+        ))
+
+
+async def timed(client, recorder, route, method, url, **kwargs):
+    started = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    recorder.add(route, response, (time.perf_counter() - started) * 1000)
+    return response
+
+
+async def funnel_visit(client, recorder, rng, slug, questions, answers):
+    await timed(client, recorder, "quiz_intro", "GET", f"/quiz/{slug}")
+    await timed(client, recorder, "start_quiz", "GET", f"/quiz/{slug}/start")
+    for order in range(1, questions + 1):
+        await timed(client, recorder, "show_question", "GET", f"/quiz/{slug}/question/{order}")
+        await timed(client, recorder, "submit_answer", "POST", f"/quiz/{slug}/question/{order}",
+                    data={"answer": f"a{rng.randrange(answers)}"})
+    await timed(client, recorder, "show_lead_form", "GET", f"/quiz/{slug}/lead-form")
+    await timed(client, recorder, "submit_lead_form", "POST", f"/quiz/{slug}/lead-form",
+                data={"email": f"user{rng.getrandbits(48)}@example.com", "first_name": "Bench"})
+    await timed(client, recorder, "show_results", "GET", f"/quiz/{slug}/results")
+
+
+async def api_visit(client, recorder, rng, slug, answers):
+    response = await timed(client, recorder, "api_get_quiz", "GET", f"/api/quiz/{slug}")
+    questions = response.json()["quiz"]["questions"]
+    await timed(client, recorder, "api_submit_quiz", "POST", f"/api/quiz/{slug}/submit", json={
+        "answers": {str(q["id"]): f"a{rng.randrange(answers)}" for q in questions},
+        "email": f"user{rng.getrandbits(48)}@example.com",
+        "first_name": "Bench",
+    })
+
+
+async def admin_visit(client, recorder):
+    await timed(client, recorder, "admin_dashboard", "GET", "/admin/dashboard")
+    await timed(client, recorder, "analytics_dashboard", "GET", "/admin/analytics")
+
+
+async def virtual_user(make_client, recorder, args, user_id, deadline):
+    rng = random.Random(args.seed * 1000 + user_id)
+    while time.perf_counter() < deadline:
+        # A fresh client per visit: new cookies, like a new visitor
+        async with make_client() as client:
+            if rng.random() < args.admin_ratio:
+                await admin_visit(client, recorder)
+            elif rng.random() < args.api_ratio:
+                await api_visit(client, recorder, rng, f"bench-{rng.randrange(args.quizzes)}", args.answers)
+            else:
+                slug = f"bench-{rng.randrange(args.quizzes)}"
+                await funnel_visit(client, recorder, rng, slug, args.questions, args.answers)
+
+
+async def drive(make_client, args):
+    recorder = Recorder()
+    async with make_client() as client:  # warm caches and connections
+        await funnel_visit(client, Recorder(), random.Random(0), "bench-0", args.questions, args.answers)
+        await api_visit(client, Recorder(), random.Random(0), "bench-0", args.answers)
+        await admin_visit(client, Recorder())
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        virtual_user(make_client, recorder, args, user_id, started + args.duration)
+        for user_id in range(args.users)
+    ))
+    return recorder, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    latencies = [s[0] for s in samples]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for s in samples if s[1] >= 400),
+        "throughput_rps": round(len(samples) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "queries_per_request": round(sum(s[2] for s in samples) / len(samples), 2) if samples else 0.0,
+        "db_ms_per_request": round(sum(s[3] for s in samples) / len(samples), 3) if samples else 0.0,
+    }
+
+
+async def run_in_process(args):
+    import httpx
+
+    app = instrumented_app()
+    transport = httpx.ASGITransport(app=app)
+    import main
+
+    await main.app.router.startup()  # ASGITransport does not send lifespan events
+    try:
+        return await drive(lambda: httpx.AsyncClient(transport=transport, base_url="http://bench"), args)
+    finally:
+        await main.app.router.shutdown()
+
+
+async def run_against_uvicorn(args, env):
+    import httpx
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", str(port), "--workers", str(args.workers)],
+        cwd=ROOT, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(300):
+            try:
+                async with httpx.AsyncClient(base_url=base_url) as client:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+        else:
+            raise RuntimeError("uvicorn did not come up")
+        limits = httpx.Limits(max_connections=args.users * 2)
+        return await drive(lambda: httpx.AsyncClient(base_url=base_url, limits=limits), args)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def compare(result, baseline, tolerance):
+    """Routes whose p95 grew by more than ``tolerance`` or that issue more queries than before."""
+    regressions = []
+    for route, current in result["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if not before:
+            continue
+        if current["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {before['p95_ms']} -> {current['p95_ms']} ms")
+        if current["queries_per_request"] > before["queries_per_request"] + 0.05:
+            regressions.append(
+                f"{route}: queries/request {before['queries_per_request']} -> {current['queries_per_request']}"
+            )
+    return regressions
+
+
+def main(args):
+    tmp = tempfile.mkdtemp(prefix="bench_funnel_")
+    env = {
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+        "INTERACTION_SPOOL_PATH": os.path.join(tmp, "interactions.spool"),
+        "INVALIDATION_BUS_URL": f"sqlite:///{os.path.join(tmp, 'bus.db')}",
+        "OUTBOX_DISPATCH_IN_PROCESS": "0",
+        "BOOTSTRAP_ON_STARTUP": "0",
+        "SEED_DEMO_DATA": "0",
+        # Every virtual user shares one client address
+        "RATE_LIMIT_ENABLED": "0",
+    }
+    os.environ.update(env)  # before any app import: engines are configured at import
+    os.chdir(ROOT)
+
+    seed_timings = seed(args)
+    if args.server == "uvicorn":
+        recorder, elapsed = asyncio.run(run_against_uvicorn(args, {**os.environ, **env}))
+    else:
+        recorder, elapsed = asyncio.run(run_in_process(args))
+
+    everything = [s for samples in recorder.samples.values() for s in samples]
+    result = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("baseline", "serve", "database_url")},
+        "seed": seed_timings,
+        "elapsed_s": round(elapsed, 2),
+        "total": summarize(everything, elapsed),
+        "routes": {route: summarize(samples, elapsed) for route, samples in sorted(recorder.samples.items())},
+    }
+    if args.baseline:
+        with open(args.baseline) as handle:
+            result["regressions"] = compare(result, json.load(handle), args.tolerance)
+    return result
+
+
+def serve(port, workers):
+    import uvicorn
+
+    uvicorn.run(
+        "bench_funnel:instrumented_app", factory=True, app_dir=BENCH_DIR,
+        host="127.0.0.1", port=port, workers=workers, log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quizzes", type=int, default=5)
+    parser.add_argument("--questions", type=int, default=5, help="questions per quiz")
+    parser.add_argument("--answers", type=int, default=4, help="answers per question")
+    parser.add_argument("--leads", type=int, default=100_000, help="historical leads to seed")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of measured traffic")
+    parser.add_argument("--admin-ratio", type=float, default=0.05, help="share of visits that are admin reads")
+    parser.add_argument("--api-ratio", type=float, default=0.0, help="share of funnels run through the JSON API")
+    parser.add_argument("--server", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--database-url", help="run against this (empty) database instead of a temp SQLite file")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for data and traffic")
+    parser.add_argument("--baseline", help="previous JSON result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p95 growth vs the baseline")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.workers)
+        sys.exit(0)
+    result = main(args)
+    print(json.dumps(result, indent=2))
+    sys.exit(1 if result.get("regressions") else 0)
@@ -0,0 +1,99 @@
+"""Propagation delay of cache invalidations between worker processes.
+
+Starts ``--workers`` subscriber processes on the configured bus, publishes
+``--events`` bumps from this process and reports how long each bump took to
+be applied in every subscriber.
+
+    python benchmarks/bench_invalidation.py                       # SQLite polling bus
+    python benchmarks/bench_invalidation.py --bus redis://localhost:6379/0
+
+Without a Redis server, fakeredis' TCP server works as a local stand-in:
+``python -c "from fakeredis import TcpFakeServer; TcpFakeServer(('127.0.0.1', 6390)).serve_forever()"``
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SUBSCRIBER = """
+import asyncio, sys, time
+from app import invalidation
+
+def received(sent_at):
+    print((time.time() - float(sent_at)) * 1000, flush=True)
+
+invalidation.HANDLERS["bench"] = received
+
+async def main():
+    await invalidation.bus.start()
+    print("ready", flush=True)
+    await asyncio.sleep(float(sys.argv[1]))
+    await invalidation.bus.stop()
+
+asyncio.run(main())
+"""
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def publish_events(count, interval):
+    from app import invalidation
+
+    invalidation.HANDLERS["bench"] = lambda _key: None
+    for _ in range(count):
+        await invalidation.publish("bench", repr(time.time()))
+        await asyncio.sleep(interval)
+    await invalidation.bus.stop()
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        bus_url = args.bus or f"sqlite:///{os.path.join(tmp, 'bus.db')}"
+        env = {**os.environ, "INVALIDATION_BUS_URL": bus_url}
+        os.environ["INVALIDATION_BUS_URL"] = bus_url
+        duration = args.events * args.interval + 5
+        subscribers = [
+            subprocess.Popen([sys.executable, "-c", SUBSCRIBER, str(duration)], cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True)
+            for _ in range(args.workers)
+        ]
+        for proc in subscribers:
+            assert proc.stdout.readline().strip() == "ready"
+        asyncio.run(publish_events(args.events, args.interval))
+        latencies = []
+        for proc in subscribers:
+            for _ in range(args.events):
+                latencies.append(float(proc.stdout.readline()))
+            proc.terminate()
+            proc.wait()
+    return {
+        "bus": bus_url.split(":", 1)[0],
+        "workers": args.workers,
+        "events": args.events,
+        "applied": len(latencies),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bus", help="INVALIDATION_BUS_URL to test (default: a temporary SQLite bus)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between published bumps")
+    print(json.dumps(main(parser.parse_args()), indent=2))
@@ -0,0 +1,121 @@
+"""Legitimate funnel throughput while bots flood the write endpoints.
+
+Runs the app in-process against a fresh SQLite database, twice: with the
+rate limiter off, then on. Each funnel comes from a new client address
+and walks start -> answers -> lead form. Meanwhile ``--bots`` clients
+from ``--bot-addresses`` addresses post lead forms and answers at a fixed
+offered rate. The report shows completed funnels per second, user latency
+and how many bot requests reached the handlers.
+
+    python benchmarks/bench_rate_limit.py --users 20 --bots 40 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+TMP = tempfile.mkdtemp(prefix="bench_rate_limit_")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(TMP, 'bench.db')}",
+    "INTERACTION_SPOOL_PATH": os.path.join(TMP, "interactions.spool"),
+    "INVALIDATION_BUS_URL": "memory://",
+    "OUTBOX_DISPATCH_IN_PROCESS": "0",
+})
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+from app import rate_limit  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def client_for(address):
+    transport = httpx.ASGITransport(app=main.app, client=(address, 40000))
+    return httpx.AsyncClient(transport=transport, base_url="http://bench", headers={"user-agent": "bench"})
+
+
+async def user_loop(index, slug, questions, deadline, latencies, stats):
+    n = 0
+    while time.perf_counter() < deadline:
+        # Every funnel is a different visitor: new address, no cookies
+        async with client_for(f"10.{1 + index % 200}.{n // 250 % 250}.{n % 250}") as client:
+            started = time.perf_counter()
+            response = await client.get(f"/quiz/{slug}/start")
+            ok = response.status_code == 303
+            for order in range(1, questions + 1):
+                if not ok:
+                    break
+                response = await client.post(f"/quiz/{slug}/question/{order}", data={"answer": "leads"})
+                ok = response.status_code == 303
+            if ok:
+                response = await client.post(f"/quiz/{slug}/lead-form", data={"email": f"user{index}-{n}@example.com"})
+                ok = response.status_code == 303
+            latencies.append((time.perf_counter() - started) * 1000)
+            stats["completed" if ok else "failed"] += 1
+            n += 1
+
+
+async def bot_loop(index, slug, addresses, rps, deadline, stats):
+    async with client_for(f"10.9.0.{index % addresses}") as client:
+        n = 0
+        while time.perf_counter() < deadline:
+            next_at = time.perf_counter() + 1 / rps
+            if n % 2:
+                response = await client.post(f"/quiz/{slug}/lead-form", data={"email": f"spam{index}-{n}@example.com"})
+            else:
+                response = await client.post(f"/quiz/{slug}/question/1", data={"answer": "spam"})
+            stats["bot_accepted" if response.status_code < 400 else "bot_shed"] += 1
+            n += 1
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+
+async def run_case(args, limited):
+    rate_limit.RATE_LIMIT_ENABLED = limited
+    rate_limit.limiter = rate_limit.MemoryLimiter()
+    latencies = []
+    stats = {"completed": 0, "failed": 0, "bot_accepted": 0, "bot_shed": 0}
+    deadline = time.perf_counter() + args.seconds
+    await asyncio.gather(
+        *(user_loop(i, args.slug, args.questions, deadline, latencies, stats) for i in range(args.users)),
+        *(bot_loop(i, args.slug, args.bot_addresses, args.bot_rps, deadline, stats) for i in range(args.bots)),
+    )
+    return {
+        "rate_limit": limited,
+        "funnels_per_sec": round(stats["completed"] / args.seconds, 1),
+        "funnel_p50_ms": round(percentile(latencies, 50), 1),
+        "funnel_p95_ms": round(percentile(latencies, 95), 1),
+        **stats,
+    }
+
+
+async def run(args):
+    await main.app.router.startup()  # ASGITransport does not send lifespan events
+    try:
+        return [await run_case(args, limited) for limited in (False, True)]
+    finally:
+        await main.app.router.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slug", default="marketing-strategy")
+    parser.add_argument("--questions", type=int, default=2, help="answers posted per funnel")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--bots", type=int, default=40)
+    parser.add_argument("--bot-addresses", type=int, default=4)
+    parser.add_argument("--bot-rps", type=float, default=25, help="requests per second offered by each bot")
+    parser.add_argument("--seconds", type=float, default=10)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
@@ -0,0 +1,87 @@
+"""Worker cold-start time, with a budget to gate deploys on.
+
+Each sample is a fresh interpreter that imports ``main``, runs the startup
+hooks and serves one funnel page, so it measures what a new uvicorn worker
+pays before it can take traffic. The database is bootstrapped once up front
+(as the release step would), so the samples measure a worker joining an
+already prepared database.
+
+    python benchmarks/bench_startup.py --runs 5 --budget-ms 1500
+
+Exits non-zero when the median time to first response exceeds the budget.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def first_response():
+    import httpx
+    await main.app.router.startup()
+    ready = time.perf_counter()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        status = (await client.get("/quiz/marketing-strategy")).status_code
+    served = time.perf_counter()
+    await main.app.router.shutdown()
+    return ready, served, status
+
+ready, served, status = asyncio.run(first_response())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+    "first_response_ms": (served - started) * 1000,
+    "status": status,
+}))
+"""
+
+
+def sample(env):
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=env, capture_output=True, text=True)
+    if output.returncode:
+        sys.exit(output.stderr)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(tmp, 'startup.db')}",
+            "INTERACTION_SPOOL_PATH": os.path.join(tmp, "interactions.spool"),
+            "OUTBOX_DISPATCH_IN_PROCESS": "0",
+        }
+        subprocess.run([sys.executable, "-m", "app.bootstrap"], cwd=ROOT, env=env, check=True, capture_output=True)
+        samples = [sample(env) for _ in range(args.runs)]
+    result = {
+        "runs": args.runs,
+        "budget_ms": args.budget_ms,
+        "status": sorted({s["status"] for s in samples}),
+    }
+    for key in ("import_ms", "startup_ms", "first_response_ms"):
+        values = [s[key] for s in samples]
+        result[f"{key}_median"] = round(statistics.median(values), 1)
+        result[f"{key}_max"] = round(max(values), 1)
+    result["within_budget"] = result["first_response_ms_median"] <= args.budget_ms
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "1500")))
+    parser.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    result = main(parser.parse_args())
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["within_budget"] else 1)
@@ -1,57 +1,68 @@
-from fastapi import FastAPI, Request, Depends, Form
+import asyncio
+import json
+import os
+from fastapi import FastAPI, Request, Depends, Form, Body, Query
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse
-from sqlalchemy.orm import Session
-from app import models, db_models
-from app.database import SessionLocal, engine, get_db
-
-# Create Tables
-db_models.Base.metadata.create_all(bind=engine)
-
-# Seed Data
-def seed_data():
-    db = SessionLocal()
-    if db.query(db_models.Quiz).count() == 0:
-        from app.mock_data import create_mock_quizzes, create_mock_questions
-        
-        # Seed Quizzes
-        mock_quizzes = create_mock_quizzes()
-        for q in mock_quizzes:
-            db_quiz = db_models.Quiz(
-                name=q.name,
-                slug=q.slug,
-                description=q.description,
-                is_active=q.is_active
-            )
-            db.add(db_quiz)
-            db.commit()
-            db.refresh(db_quiz)
-            
-            # Seed Questions
-            mock_questions = create_mock_questions(q.slug)
-            for question in mock_questions:
-                db_question = db_models.QuizQuestion(
-                    quiz_id=db_quiz.id,
-                    question_text=question.question_text,
-                    question_type=question.question_type,
-                    question_order=question.question_order,
-                    answers=question.answers,
-                    is_active=question.is_active
-                )
-                db.add(db_question)
-            db.commit()
-    db.close()
-
-seed_data()
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from dataclasses import replace
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from pydantic import ValidationError
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import ab_testing, analytics, attribution, bootstrap, catalog, dedupe, integrations, invalidation, listing, models, observability, db_models, page_cache, quiz_settings, rate_limit, rollups, scoring
+from app.database import AsyncSessionLocal, async_engine, get_async_db
+from app.quiz_cache import get_compiled_quiz
+from app.interaction_log import interaction_buffer
+from app.sessions import collect_answers, load_session_secret, read_session, record_answer, set_session_cookie, start_session
 
 app = FastAPI(title="Quiz Platform")
 
+# Query counts, DB/render time per request: Server-Timing header and /metrics
+app.add_middleware(observability.ObservabilityMiddleware)
+# Outermost: shed requests cost no routing, DB session or metrics bookkeeping beyond one counter
+app.add_middleware(rate_limit.RateLimitMiddleware)
+observability.instrument_engine(async_engine.sync_engine)
+
+# Set OUTBOX_DISPATCH_IN_PROCESS=0 when running `python -m app.integrations` as a separate worker
+outbox_dispatcher = (
+    integrations.OutboxDispatcher(async_engine)
+    if os.getenv("OUTBOX_DISPATCH_IN_PROCESS", "1") == "1" else None
+)
+
+@app.on_event("startup")
+async def start_background_writers():
+    # Migrations and seeding run here (or via `python -m app.bootstrap`), never at import
+    if bootstrap.BOOTSTRAP_ON_STARTUP:
+        await asyncio.to_thread(bootstrap.ensure_ready)
+    async with AsyncSessionLocal() as db:
+        await load_session_secret(db)
+    # The buffer outlives the app: a second startup in this process must not count twice
+    if rollups.apply_interactions not in interaction_buffer.flush_hooks:
+        interaction_buffer.flush_hooks.append(rollups.apply_interactions)
+    await interaction_buffer.start()
+    async with AsyncSessionLocal() as db:
+        await dedupe.warm(db)
+    if outbox_dispatcher is not None:
+        await outbox_dispatcher.start()
+    await invalidation.bus.start()
+
+@app.on_event("shutdown")
+async def dispose_engines():
+    await invalidation.bus.stop()
+    if outbox_dispatcher is not None:
+        await outbox_dispatcher.stop()
+    await interaction_buffer.stop()
+    await rate_limit.limiter.close()
+    await async_engine.dispose()
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Templates
 templates = Jinja2Templates(directory="templates")
+templates.env.template_class = observability.TimedTemplate
 
 # Mock Data Removed
 
@@ -64,36 +75,293 @@ from fastapi.responses import RedirectResponse
 from app.models import Quiz
 
 @app.get("/admin/dashboard", response_class=HTMLResponse)
-async def admin_dashboard(request: Request, db: Session = Depends(get_db)):
-    quizzes = db.query(db_models.Quiz).all()
-    total_quizzes = len(quizzes)
-    total_leads = db.query(db_models.Lead).count()
+async def admin_dashboard(request: Request, db: AsyncSession = Depends(get_async_db)):
+    page = await listing.quiz_page(db)
+    total_leads = await db.scalar(select(func.coalesce(func.sum(db_models.DailyQuizStats.leads), 0)))
     return templates.TemplateResponse("admin/dashboard.html", {
         "request": request, 
-        "quizzes": quizzes, 
-        "total_quizzes": total_quizzes,
+        "quizzes": page["items"], 
+        "next_cursor": page["next_cursor"],
+        "total_quizzes": page["total"],
         "total_leads": total_leads,
         "title": "Admin Dashboard"
     })
 
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    # Empty form fields arrive as ""; date-only values mean midnight
+    return datetime.fromisoformat(value) if value else None
+
+@app.get("/admin/quizzes")
+async def list_quizzes(
+    request: Request,
+    format: str = "html",
+    cursor: Optional[str] = None,
+    limit: int = 24,
+    active: Optional[bool] = None,
+    name: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        page = await listing.quiz_page(db, limit=limit, cursor=cursor, active=active, name_prefix=name or None)
+    except listing.InvalidCursor as exc:
+        return JSONResponse({"detail": str(exc)}, status_code=400)
+    if format == "json":
+        return page
+    total_leads = await db.scalar(select(func.coalesce(func.sum(db_models.DailyQuizStats.leads), 0)))
+    return templates.TemplateResponse("admin/dashboard.html", {
+        "request": request,
+        "quizzes": page["items"],
+        "next_cursor": page["next_cursor"],
+        "total_quizzes": page["total"],
+        "total_leads": total_leads,
+        "title": "Quizzes"
+    })
+
+@app.get("/admin/leads")
+async def list_leads(
+    request: Request,
+    format: str = "html",
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    quiz: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    email: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    quiz_id = None
+    if quiz:
+        quiz_id = await db.scalar(select(db_models.Quiz.id).where(db_models.Quiz.slug == quiz))
+        if quiz_id is None:
+            return JSONResponse({"detail": "Quiz not found"}, status_code=404)
+    try:
+        page = await listing.lead_page(
+            db, limit=limit, cursor=cursor, quiz_id=quiz_id,
+            since=_parse_datetime(since), until=_parse_datetime(until), email_prefix=email or None,
+        )
+    except ValueError as exc:  # bad cursor or date
+        return JSONResponse({"detail": str(exc)}, status_code=400)
+    if format == "json":
+        return page
+    filters = {k: v for k, v in {"quiz": quiz, "since": since, "until": until, "email": email}.items() if v}
+    return templates.TemplateResponse("admin/leads.html", {
+        "request": request,
+        "page": page,
+        "filters": filters,
+        "quizzes": (await db.execute(select(db_models.Quiz.slug, db_models.Quiz.name).order_by(db_models.Quiz.name))).all(),
+        "title": "Leads"
+    })
+
 @app.get("/admin/analytics", response_class=HTMLResponse)
-async def analytics_dashboard(request: Request, db: Session = Depends(get_db)):
-    # Calculate top quizzes by lead count
-    quizzes = db.query(db_models.Quiz).all()
-    quiz_stats = []
-    for quiz in quizzes:
-        lead_count = db.query(db_models.Lead).filter(db_models.Lead.quiz_id == quiz.id).count()
-        quiz_stats.append({"name": quiz.name, "lead_count": lead_count})
-    
-    # Sort by lead count desc
-    quiz_stats.sort(key=lambda x: x["lead_count"], reverse=True)
-    
+async def analytics_dashboard(request: Request, db: AsyncSession = Depends(get_async_db)):
     return templates.TemplateResponse("admin/analytics.html", {
         "request": request, 
-        "top_quizzes": quiz_stats[:5],
+        "top_quizzes": await analytics.top_quizzes(db, limit=5),
+        "lead_growth": await analytics.leads_per_day(db, days=5),
+        "funnel": await analytics.funnel(db),
         "title": "Analytics"
     })
 
+@app.get("/admin/quizzes/{slug}/analytics", response_class=HTMLResponse)
+async def quiz_analytics(request: Request, slug: str, db: AsyncSession = Depends(get_async_db)):
+    quiz = await get_compiled_quiz(db, slug)
+    if not quiz:
+        return HTMLResponse("Quiz not found", status_code=404)
+    return templates.TemplateResponse("admin/quiz_analytics.html", {
+        "request": request,
+        "quiz": quiz,
+        "lead_growth": await analytics.leads_per_day(db, quiz_id=quiz.id, days=14),
+        "funnel": await analytics.funnel(db, quiz_id=quiz.id),
+        "title": f"Analytics - {quiz.name}"
+    })
+
+@app.get("/admin/quizzes/{slug}/leads/export")
+async def export_leads(
+    slug: str,
+    format: str = "csv",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    from app import exports
+
+    quiz = await get_compiled_quiz(db, slug)
+    if not quiz:
+        return HTMLResponse("Quiz not found", status_code=404)
+    if format not in exports.EXPORT_MEDIA_TYPES:
+        return HTMLResponse(f"Unsupported export format: {format}", status_code=400)
+    if format == "parquet" and not exports.parquet_available():
+        return HTMLResponse("Parquet export requires pyarrow", status_code=501)
+    
+    query = exports.lead_export_query(quiz.id, since=since, until=until, after_id=after_id)
+    return StreamingResponse(
+        exports.stream_leads(format, query),
+        media_type=exports.EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{slug}-leads.{format}"'},
+    )
+
+@app.get("/admin/sync/status")
+async def sync_status(db: AsyncSession = Depends(get_async_db)):
+    from app import sync
+
+    return await db.run_sync(sync.sync_states)
+
+class ABTestPayload(models.ABQuizTest):
+    quiz_slug: str
+
+@app.get("/admin/ab-tests")
+async def list_ab_tests(db: AsyncSession = Depends(get_async_db)):
+    tests = (await db.scalars(select(db_models.ABTest).order_by(db_models.ABTest.id))).all()
+    return [
+        {"test_key": t.test_key, "quiz_id": t.quiz_id, "name": t.name, "variants": t.variants, "status": t.status, "is_active": t.is_active}
+        for t in tests
+    ]
+
+@app.post("/admin/ab-tests")
+async def save_ab_test(payload: ABTestPayload, db: AsyncSession = Depends(get_async_db)):
+    quiz = await db.scalar(select(db_models.Quiz).where(db_models.Quiz.slug == payload.quiz_slug))
+    if not quiz:
+        return JSONResponse({"detail": "Quiz not found"}, status_code=404)
+    
+    test = await db.scalar(select(db_models.ABTest).where(db_models.ABTest.test_key == payload.test_key))
+    if test is None:
+        test = db_models.ABTest(test_key=payload.test_key)
+        db.add(test)
+    test.quiz_id = quiz.id
+    test.name = payload.name
+    test.variants = payload.variants
+    test.status = payload.status.value
+    test.is_active = payload.is_active
+    await db.commit()
+    
+    await invalidation.publish("ab_tests")
+    await invalidation.publish("pages", quiz.slug)
+    return {"test_key": test.test_key, "status": test.status}
+
+class ThankYouPagePayload(models.ThankYouPage):
+    quiz_id: Optional[str] = None
+
+class ResultRulePayload(models.ResultRule):
+    quiz_id: Optional[str] = None
+
+@app.post("/admin/quizzes/{slug}/thank-you-pages")
+async def create_thank_you_page(slug: str, payload: ThankYouPagePayload, db: AsyncSession = Depends(get_async_db)):
+    quiz = await db.scalar(select(db_models.Quiz).where(db_models.Quiz.slug == slug))
+    if not quiz:
+        return JSONResponse({"detail": "Quiz not found"}, status_code=404)
+    page = db_models.ThankYouPage(quiz_id=quiz.id, **payload.model_dump(exclude={"quiz_id"}))
+    db.add(page)
+    await db.commit()
+    await invalidation.publish("rules", quiz.id)
+    return {"id": page.id}
+
+@app.post("/admin/quizzes/{slug}/result-rules")
+async def create_result_rule(slug: str, payload: ResultRulePayload, db: AsyncSession = Depends(get_async_db)):
+    quiz = await db.scalar(select(db_models.Quiz).where(db_models.Quiz.slug == slug))
+    if not quiz:
+        return JSONResponse({"detail": "Quiz not found"}, status_code=404)
+    if payload.min_score > payload.max_score:
+        return JSONResponse({"detail": "min_score must not exceed max_score"}, status_code=400)
+    try:
+        page_id = int(payload.thank_you_page_id)
+    except ValueError:
+        return JSONResponse({"detail": "thank_you_page_id must be an integer"}, status_code=400)
+    page = await db.scalar(select(db_models.ThankYouPage.id).where(
+        db_models.ThankYouPage.id == page_id, db_models.ThankYouPage.quiz_id == quiz.id
+    ))
+    if page is None:
+        return JSONResponse({"detail": "Thank-you page not found"}, status_code=404)
+    if payload.is_active:
+        rules = (await db.scalars(select(db_models.ResultRule).where(db_models.ResultRule.quiz_id == quiz.id))).all()
+        if scoring.overlaps(rules, payload.min_score, payload.max_score):
+            return JSONResponse({"detail": "Score range overlaps an active rule"}, status_code=400)
+    rule = db_models.ResultRule(
+        quiz_id=quiz.id,
+        name=payload.name,
+        min_score=payload.min_score,
+        max_score=payload.max_score,
+        thank_you_page_id=page_id,
+        is_active=payload.is_active,
+    )
+    db.add(rule)
+    await db.commit()
+    await invalidation.publish("rules", quiz.id)
+    # Stored sessions keep their old result until `python -m app.scoring rescore <slug>` runs
+    return {"id": rule.id}
+
+@app.get("/admin/quizzes/{slug}/settings/{kind}")
+async def list_quiz_settings(slug: str, kind: str, db: AsyncSession = Depends(get_async_db)):
+    quiz = await db.scalar(select(db_models.Quiz).where(db_models.Quiz.slug == slug))
+    if not quiz or kind not in quiz_settings.SETTINGS_MODELS:
+        return JSONResponse({"detail": "Not found"}, status_code=404)
+    rows = (await db.scalars(
+        select(db_models.QuizSetting).where(db_models.QuizSetting.quiz_id == quiz.id, db_models.QuizSetting.kind == kind)
+    )).all()
+    return [{"id": r.id, "is_active": r.is_active, "config": r.config} for r in rows]
+
+@app.post("/admin/quizzes/{slug}/settings/{kind}")
+async def save_quiz_setting(
+    slug: str,
+    kind: str,
+    config: Dict[str, Any] = Body(...),
+    setting_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    quiz = await db.scalar(select(db_models.Quiz).where(db_models.Quiz.slug == slug))
+    if not quiz or kind not in quiz_settings.SETTINGS_MODELS:
+        return JSONResponse({"detail": "Not found"}, status_code=404)
+    try:
+        validated = quiz_settings.validate_config(kind, quiz.id, config)
+    except ValidationError as exc:
+        return JSONResponse({"detail": exc.errors(include_url=False)}, status_code=422)
+    
+    row = await db.get(db_models.QuizSetting, setting_id) if setting_id else None
+    if row is None or row.quiz_id != quiz.id:
+        row = db_models.QuizSetting(quiz_id=quiz.id, kind=kind)
+        db.add(row)
+    row.config = validated.model_dump(mode="json", exclude={"quiz_id"})
+    row.is_active = getattr(validated, "is_active", True)
+    await db.commit()
+    await invalidation.publish("settings", quiz.id)
+    if kind == "general":
+        # Criteria may have changed; reload the filter on next use
+        await invalidation.publish("dedupe", quiz.id)
+    return {"id": row.id}
+
+@app.get("/admin/quizzes/export")
+async def export_quizzes(
+    format: str = "json",
+    slug: Optional[List[str]] = Query(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if format not in catalog.CATALOG_MEDIA_TYPES:
+        return JSONResponse({"detail": f"Unsupported export format: {format}"}, status_code=400)
+    if format == "yaml" and not catalog.yaml_available():
+        return JSONResponse({"detail": "YAML export requires PyYAML"}, status_code=501)
+    document = await catalog.export_catalog(db, slug)
+    return PlainTextResponse(catalog.dump(document, format), media_type=catalog.CATALOG_MEDIA_TYPES[format])
+
+@app.post("/admin/quizzes/import")
+async def import_quizzes(request: Request, dry_run: bool = False, db: AsyncSession = Depends(get_async_db)):
+    fmt = "yaml" if "yaml" in request.headers.get("content-type", "") else "json"
+    if fmt == "yaml" and not catalog.yaml_available():
+        return JSONResponse({"detail": "YAML import requires PyYAML"}, status_code=501)
+    try:
+        document = catalog.parse(await request.body(), fmt)
+    except ValidationError as exc:
+        return JSONResponse({"detail": exc.errors(include_url=False)}, status_code=422)
+    except ValueError as exc:
+        return JSONResponse({"detail": str(exc)}, status_code=400)
+    
+    results = await catalog.import_catalog(db, document, dry_run=dry_run)
+    if not dry_run:
+        for result in results:
+            if "error" not in result:
+                await invalidation.publish("quiz", result["slug"])
+    status_code = 207 if any("error" in r for r in results) else 200
+    return JSONResponse({"dry_run": dry_run, "results": results}, status_code=status_code)
+
 @app.get("/admin/quizzes/new", response_class=HTMLResponse)
 async def new_quiz(request: Request):
     return templates.TemplateResponse("admin/quiz_editor.html", {"request": request, "quiz": None, "title": "New Quiz"})
@@ -104,17 +372,17 @@ async def create_quiz(
     slug: str = Form(...), 
     description: str = Form(None), 
     is_active: bool = Form(False),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     new_quiz = db_models.Quiz(name=name, slug=slug, description=description, is_active=is_active)
     db.add(new_quiz)
-    db.commit()
-    db.refresh(new_quiz)
+    await db.commit()
+    await invalidation.publish("quiz", slug)
     return RedirectResponse(url="/admin/dashboard", status_code=303)
 
 @app.get("/admin/quizzes/{slug}/edit", response_class=HTMLResponse)
-async def edit_quiz(request: Request, slug: str, db: Session = Depends(get_db)):
-    quiz = db.query(db_models.Quiz).filter(db_models.Quiz.slug == slug).first()
+async def edit_quiz(request: Request, slug: str, db: AsyncSession = Depends(get_async_db)):
+    quiz = await db.scalar(select(db_models.Quiz).where(db_models.Quiz.slug == slug))
     if not quiz:
         return HTMLResponse("Quiz not found", status_code=404)
     return templates.TemplateResponse("admin/quiz_editor.html", {"request": request, "quiz": quiz, "title": "Edit Quiz"})
@@ -125,31 +393,34 @@ async def update_quiz(
     name: str = Form(...), 
     description: str = Form(None), 
     is_active: bool = Form(False),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    quiz = db.query(db_models.Quiz).filter(db_models.Quiz.slug == slug).first()
+    quiz = await db.scalar(select(db_models.Quiz).where(db_models.Quiz.slug == slug))
     if quiz:
         quiz.name = name
         quiz.description = description
         quiz.is_active = is_active
-        db.commit()
+        await db.commit()
+        await invalidation.publish("quiz", slug)
     return RedirectResponse(url="/admin/dashboard", status_code=303)
 
 from app.models import QuizQuestion, QuestionType
 
 @app.get("/admin/quizzes/{slug}/questions", response_class=HTMLResponse)
-async def list_questions(request: Request, slug: str, db: Session = Depends(get_db)):
-    quiz = db.query(db_models.Quiz).filter(db_models.Quiz.slug == slug).first()
+async def list_questions(request: Request, slug: str, db: AsyncSession = Depends(get_async_db)):
+    quiz = await db.scalar(select(db_models.Quiz).where(db_models.Quiz.slug == slug))
     if not quiz:
         return HTMLResponse("Quiz not found", status_code=404)
     
-    quiz_questions = db.query(db_models.QuizQuestion).filter(db_models.QuizQuestion.quiz_id == quiz.id).order_by(db_models.QuizQuestion.question_order).all()
+    quiz_questions = (await db.scalars(
+        select(db_models.QuizQuestion).where(db_models.QuizQuestion.quiz_id == quiz.id).order_by(db_models.QuizQuestion.question_order)
+    )).all()
     
     return templates.TemplateResponse("admin/question_list.html", {"request": request, "quiz": quiz, "questions": quiz_questions, "title": f"Questions - {quiz.name}"})
 
 @app.get("/admin/quizzes/{slug}/questions/new", response_class=HTMLResponse)
-async def new_question(request: Request, slug: str, db: Session = Depends(get_db)):
-    quiz = db.query(db_models.Quiz).filter(db_models.Quiz.slug == slug).first()
+async def new_question(request: Request, slug: str, db: AsyncSession = Depends(get_async_db)):
+    quiz = await db.scalar(select(db_models.Quiz).where(db_models.Quiz.slug == slug))
     if not quiz:
         return HTMLResponse("Quiz not found", status_code=404)
     return templates.TemplateResponse("admin/question_editor.html", {"request": request, "quiz": quiz, "question": None, "title": "New Question"})
@@ -161,9 +432,9 @@ async def create_question(
     question_type: str = Form(...), 
     question_order: int = Form(...),
     answers: str = Form(""),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    quiz = db.query(db_models.Quiz).filter(db_models.Quiz.slug == slug).first()
+    quiz = await db.scalar(select(db_models.Quiz).where(db_models.Quiz.slug == slug))
     if not quiz:
         return HTMLResponse("Quiz not found", status_code=404)
     
@@ -185,94 +456,385 @@ async def create_question(
     )
     
     db.add(new_q)
-    db.commit()
+    await db.commit()
+    await invalidation.publish("quiz", slug)
     
     return RedirectResponse(url=f"/admin/quizzes/{slug}/questions", status_code=303)
 
+async def render_funnel_page(request: Request, db: AsyncSession, quiz, page_key, template_name: str, build_context):
+    """Render a cacheable funnel page, applying the quiz settings and the visitor's A/B variants."""
+    config = await quiz_settings.resolve(db, quiz.id)
+    base_design = dict(config.design.design_config) if config.design else {}
+    tests = await ab_testing.running_tests(db, quiz.id)
+    if not tests:
+        page = page_cache.get_page(
+            (quiz.slug, quiz.version, config.version, page_key),
+            lambda: templates.get_template(template_name).render(
+                {**build_context(quiz, config), "settings": config, "design": base_design}
+            ),
+        )
+        return page_cache.page_response(request, page)
+    
+    visitor, new_visitor = ab_testing.visitor_id(request)
+    assignments = ab_testing.assign_all(tests, visitor)
+    quiz_overrides, design = ab_testing.variant_overrides(tests, assignments)
+    view = replace(quiz, **{k: v for k, v in quiz_overrides.items() if k in ("name", "description")})
+    page = page_cache.get_page(
+        (quiz.slug, quiz.version, config.version, page_key, tuple(sorted(assignments.items()))),
+        lambda: templates.get_template(template_name).render(
+            {**build_context(view, config), "settings": config, "design": {**base_design, **design}}
+        ),
+    )
+    # The body now depends on the visitor cookie, so shared caches must not store it
+    response = page_cache.page_response(
+        request, page, cache_control=f"private, max-age={page_cache.PAGE_MAX_AGE}, must-revalidate"
+    )
+    if new_visitor:
+        ab_testing.set_visitor_cookie(response, visitor)
+    return response
+
 @app.get("/quiz/{slug}", response_class=HTMLResponse)
-async def quiz_intro(request: Request, slug: str, db: Session = Depends(get_db)):
-    quiz = db.query(db_models.Quiz).filter(db_models.Quiz.slug == slug).first()
+async def quiz_intro(request: Request, slug: str, db: AsyncSession = Depends(get_async_db)):
+    quiz = await get_compiled_quiz(db, slug)
     if not quiz:
         return HTMLResponse("Quiz not found", status_code=404)
-    return templates.TemplateResponse("quiz/intro.html", {"request": request, "quiz": quiz, "title": quiz.name, "show_footer": True, "footer_text": "Powered by Quiz Platform"})
+    response = await render_funnel_page(
+        request, db, quiz, "intro", "quiz/intro.html",
+        lambda view, config: {
+            "quiz": view,
+            "title": view.name,
+            "intro": config.intro_page,
+            "show_footer": config.general.show_branding or bool(config.general.footer_text),
+            "footer_text": config.general.footer_text or "Powered by Quiz Platform",
+        },
+    )
+    if request.query_params or request.cookies:
+        captured = attribution.extractor_for(await quiz_settings.resolve(db, quiz.id)).extract(request, constants=False)
+        if captured:
+            # The page body is shared; the captured values ride along in a cookie until /start
+            attribution.park(response, captured)
+            response.headers["Cache-Control"] = f"private, max-age={page_cache.PAGE_MAX_AGE}, must-revalidate"
+    return response
 
 @app.get("/quiz/{slug}/start")
-async def start_quiz(slug: str):
-    # In a real app, we would create a session here
-    return RedirectResponse(url=f"/quiz/{slug}/question/1", status_code=303)
+async def start_quiz(request: Request, slug: str, db: AsyncSession = Depends(get_async_db)):
+    quiz = await get_compiled_quiz(db, slug)
+    if not quiz:
+        return HTMLResponse("Quiz not found", status_code=404)
+    
+    tests = await ab_testing.running_tests(db, quiz.id)
+    visitor, new_visitor = ab_testing.visitor_id(request)
+    assignments = ab_testing.assign_all(tests, visitor)
+    
+    # Every start is a fresh attempt, even if the visitor already has a session cookie
+    config = await quiz_settings.resolve(db, quiz.id)
+    hidden_data = await attribution.encode(db, attribution.capture(request, config))
+    token = await start_session(db, quiz.id, request, ab_test_assignments=assignments, hidden_data=hidden_data)
+    interaction_buffer.record(quiz.id, token.session_id, models.PageType.HOME.value)
+    for test_key, variant in assignments.items():
+        interaction_buffer.record(
+            quiz.id, token.session_id, models.PageType.AB_EXPOSURE.value,
+            answer_value={"test_key": test_key, "variant": variant},
+        )
+    
+    response = RedirectResponse(url=f"/quiz/{slug}/question/1", status_code=303)
+    set_session_cookie(response, token)
+    if attribution.ATTRIBUTION_COOKIE_NAME in request.cookies:
+        response.delete_cookie(attribution.ATTRIBUTION_COOKIE_NAME)
+    if tests and new_visitor:
+        ab_testing.set_visitor_cookie(response, visitor)
+    return response
 
 @app.get("/quiz/{slug}/question/{order}", response_class=HTMLResponse)
-async def show_question(request: Request, slug: str, order: int, db: Session = Depends(get_db)):
-    quiz = db.query(db_models.Quiz).filter(db_models.Quiz.slug == slug).first()
+async def show_question(request: Request, slug: str, order: int, db: AsyncSession = Depends(get_async_db)):
+    quiz = await get_compiled_quiz(db, slug)
     if not quiz:
         return HTMLResponse("Quiz not found", status_code=404)
     
-    question = db.query(db_models.QuizQuestion).filter(
-        db_models.QuizQuestion.quiz_id == quiz.id,
-        db_models.QuizQuestion.question_order == order
-    ).first()
+    question = quiz.question_at(order)
     
     if not question:
         # If no question found at this order, assume quiz is done -> go to lead form
         return RedirectResponse(url=f"/quiz/{slug}/lead-form", status_code=303)
     
-    # Calculate progress
-    total_questions = db.query(db_models.QuizQuestion).filter(db_models.QuizQuestion.quiz_id == quiz.id).count()
-    progress = ((order - 1) / total_questions) * 100 if total_questions > 0 else 0
-    
-    return templates.TemplateResponse("quiz/question.html", {
-        "request": request, 
-        "quiz": quiz, 
-        "question": question, 
-        "title": quiz.name,
-        "show_progress": True,
-        "progress_percentage": progress
-    })
+    return await render_funnel_page(
+        request, db, quiz, order, "quiz/question.html",
+        lambda view, config: {
+            "quiz": view, 
+            "question": question, 
+            "title": view.name,
+            "show_progress": config.general.show_progress_bar,
+            "progress_percentage": question.progress_percentage
+        },
+    )
 
 @app.post("/quiz/{slug}/question/{order}")
-async def submit_answer(slug: str, order: int, answer: str = Form(...)):
-    # In a real app, save answer to session/db
-    print(f"Quiz: {slug}, Question: {order}, Answer: {answer}")
+async def submit_answer(
+    request: Request,
+    slug: str,
+    order: int,
+    answer: str = Form(...),
+    db: AsyncSession = Depends(get_async_db)
+):
+    quiz = await get_compiled_quiz(db, slug)
+    if not quiz:
+        return HTMLResponse("Quiz not found", status_code=404)
+    
+    token = read_session(request, quiz.id)
+    is_new_session = token is None
+    if is_new_session:
+        # Deep link or expired cookie: open a session so the answer is not lost
+        token = await start_session(db, quiz.id, request)
+        interaction_buffer.record(quiz.id, token.session_id, models.PageType.HOME.value)
+    
+    # Buffered; written to quiz_interactions in batches by the background flusher
+    question = quiz.question_at(order)
+    interaction_buffer.record(
+        quiz.id,
+        token.session_id,
+        models.PageType.QUIZ.value,
+        question_id=question.id if question else None,
+        answer_value=answer,
+    )
+    if question:
+        # Any worker may serve the lead form; it scores from the session row, not this buffer
+        await record_answer(db, token.session_id, question.id, answer)
     
     # Go to next question
-    return RedirectResponse(url=f"/quiz/{slug}/question/{order + 1}", status_code=303)
+    response = RedirectResponse(url=f"/quiz/{slug}/question/{order + 1}", status_code=303)
+    if is_new_session:
+        set_session_cookie(response, token)
+    return response
 
 @app.get("/quiz/{slug}/lead-form", response_class=HTMLResponse)
-async def show_lead_form(request: Request, slug: str, db: Session = Depends(get_db)):
-    quiz = db.query(db_models.Quiz).filter(db_models.Quiz.slug == slug).first()
+async def show_lead_form(request: Request, slug: str, db: AsyncSession = Depends(get_async_db)):
+    quiz = await get_compiled_quiz(db, slug)
     if not quiz:
         return HTMLResponse("Quiz not found", status_code=404)
-    return templates.TemplateResponse("quiz/lead_form.html", {"request": request, "quiz": quiz, "title": "Get Your Results"})
+    config = await quiz_settings.resolve(db, quiz.id)
+    return templates.TemplateResponse("quiz/lead_form.html", {
+        "request": request, "quiz": quiz, "title": "Get Your Results", "settings": config, "form": config.contact_form,
+    })
+
+async def save_lead(
+    db: AsyncSession,
+    quiz,
+    session_id: Optional[str],
+    answers: Dict[str, Any],
+    email: str,
+    first_name: Optional[str],
+    last_name: Optional[str],
+) -> Dict[str, Any]:
+    """Score the answers, store the lead and complete the session in one transaction; returns the result."""
+    result = await scoring.evaluate(db, quiz, answers)
+    # Captured at /start, already dictionary-encoded
+    hidden_data = await db.scalar(
+        select(db_models.QuizSession.hidden_data).where(db_models.QuizSession.session_id == session_id)
+    ) if session_id else None
+    
+    general = await quiz_settings.general_settings(db, quiz.id)
+    key = dedupe.dedupe_key(dedupe.criteria_for(general), {"email": email, "first_name": first_name, "last_name": last_name})
+    is_duplicate = key is not None and await dedupe.is_duplicate(db, quiz.id, key)
+    
+    new_lead = db_models.Lead(
+        quiz_id=quiz.id,
+        session_id=session_id,
+        email=email,
+        first_name=first_name,
+        last_name=last_name,
+        quiz_answers=answers,
+        quiz_score=result["score"],
+        quiz_outcome_headline=result["headline"],
+        hidden_data=hidden_data or []
+    )
+    if not is_duplicate:
+        db.add(new_lead)
+        await db.flush()
+        if key is not None and not await dedupe.claim(db, quiz.id, key, new_lead.id):
+            # Another worker stored the same lead after our filter was warmed
+            await db.rollback()
+            is_duplicate = True
+    
+    if not is_duplicate:
+        await rollups.record_lead(db, quiz.id)
+        # Third-party deliveries are queued in this transaction and sent by the outbox dispatcher
+        await integrations.enqueue_lead(db, quiz.id, new_lead, {
+            "quiz_slug": quiz.slug,
+            "quiz_name": quiz.name,
+            "quiz_score": result["score"],
+            "quiz_outcome_headline": result["headline"],
+            "quiz_answers": answers,
+        })
+    
+    if session_id:
+        now = datetime.utcnow()
+        await db.execute(
+            update(db_models.QuizSession)
+            .where(db_models.QuizSession.session_id == session_id)
+            .values(
+                email=email,
+                first_name=first_name,
+                last_name=last_name,
+                quiz_answers=answers,
+                quiz_result=result,
+                form_completed_at=now,
+                completed_at=func.coalesce(db_models.QuizSession.completed_at, now),
+            )
+        )
+        interaction_buffer.record(quiz.id, session_id, models.PageType.FORM.value)
+    await db.commit()
+    if key is not None and not is_duplicate:
+        dedupe.remember(quiz.id, key)
+    return result
 
 @app.post("/quiz/{slug}/lead-form")
 async def submit_lead_form(
+    request: Request,
     slug: str, 
     email: str = Form(...), 
     first_name: str = Form(None), 
     last_name: str = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    quiz = db.query(db_models.Quiz).filter(db_models.Quiz.slug == slug).first()
+    quiz = await get_compiled_quiz(db, slug)
     if not quiz:
         return HTMLResponse("Quiz not found", status_code=404)
     
-    new_lead = db_models.Lead(
-        quiz_id=quiz.id,
-        email=email,
-        first_name=first_name,
-        last_name=last_name
-    )
-    db.add(new_lead)
-    db.commit()
+    token = read_session(request, quiz.id)
+    answers = await collect_answers(db, token.session_id) if token else {}
+    await save_lead(db, quiz, token.session_id if token else None, answers, email, first_name, last_name)
     
     return RedirectResponse(url=f"/quiz/{slug}/results", status_code=303)
 
 @app.get("/quiz/{slug}/results", response_class=HTMLResponse)
-async def show_results(request: Request, slug: str, db: Session = Depends(get_db)):
-    quiz = db.query(db_models.Quiz).filter(db_models.Quiz.slug == slug).first()
+async def show_results(request: Request, slug: str, db: AsyncSession = Depends(get_async_db)):
+    quiz = await get_compiled_quiz(db, slug)
     if not quiz:
         return HTMLResponse("Quiz not found", status_code=404)
-    return templates.TemplateResponse("quiz/results.html", {"request": request, "quiz": quiz, "title": "Your Results"})
+    
+    result = None
+    token = read_session(request, quiz.id)
+    if token:
+        result = await db.scalar(
+            select(db_models.QuizSession.quiz_result).where(db_models.QuizSession.session_id == token.session_id)
+        )
+    rule_index = await scoring.get_rule_index(db, quiz.id)
+    page = rule_index.default_page
+    if result and result.get("thank_you_page_id"):
+        page = next((p for p in rule_index.pages if p and p.id == result["thank_you_page_id"]), page)
+    return templates.TemplateResponse("quiz/results.html", {"request": request, "quiz": quiz, "result": result, "page": page, "title": "Your Results"})
+
+@app.get("/api/quiz/{slug}")
+async def api_get_quiz(request: Request, slug: str, db: AsyncSession = Depends(get_async_db)):
+    """The whole funnel in one cacheable payload: quiz, active questions and public settings."""
+    quiz = await get_compiled_quiz(db, slug)
+    if not quiz:
+        return JSONResponse({"detail": "Quiz not found"}, status_code=404)
+    config = await quiz_settings.resolve(db, quiz.id)
+    design = dict(config.design.design_config) if config.design else {}
+    tests = await ab_testing.running_tests(db, quiz.id)
+    visitor, new_visitor = ab_testing.visitor_id(request)
+    assignments = ab_testing.assign_all(tests, visitor)
+    quiz_overrides, variant_design = ab_testing.variant_overrides(tests, assignments)
+    view = replace(quiz, **{k: v for k, v in quiz_overrides.items() if k in ("name", "description")})
+    
+    def render():
+        return json.dumps({
+            "quiz": {
+                "id": view.id,
+                "slug": view.slug,
+                "name": view.name,
+                "description": view.description,
+                "version": view.version,
+                "questions": [
+                    {
+                        "id": q.id,
+                        "question_text": q.question_text,
+                        "question_type": q.question_type,
+                        "question_order": q.question_order,
+                        "answers": [dict(a) for a in q.answers],
+                        "progress_percentage": q.progress_percentage,
+                    }
+                    for q in view.questions
+                ],
+            },
+            "settings": quiz_settings.public_settings(config),
+            "design": {**design, **variant_design},
+            "ab_test_assignments": assignments,
+        }, separators=(",", ":"), default=str)
+    
+    page = page_cache.get_page(
+        (quiz.slug, quiz.version, config.version, "api", tuple(sorted(assignments.items()))), render
+    )
+    response = page_cache.page_response(
+        request, page,
+        # Variant payloads depend on the visitor cookie, so shared caches must not store them
+        cache_control=f"private, max-age={page_cache.PAGE_MAX_AGE}, must-revalidate" if tests else None,
+        media_type="application/json",
+    )
+    if tests and new_visitor:
+        ab_testing.set_visitor_cookie(response, visitor)
+    return response
+
+@app.post("/api/quiz/{slug}/submit")
+async def api_submit_quiz(
+    request: Request,
+    slug: str,
+    submission: models.QuizSubmission,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Start, answer and submit the lead form in one request; returns the result and its thank-you page."""
+    quiz = await get_compiled_quiz(db, slug)
+    if not quiz:
+        return JSONResponse({"detail": "Quiz not found"}, status_code=404)
+    questions = {str(q.id): q for q in quiz.questions}
+    unknown = sorted(set(submission.answers) - set(questions))
+    if unknown:
+        return JSONResponse({"detail": f"Unknown question ids: {', '.join(unknown)}"}, status_code=422)
+    
+    tests = await ab_testing.running_tests(db, quiz.id)
+    visitor, new_visitor = ab_testing.visitor_id(request)
+    assignments = ab_testing.assign_all(tests, visitor)
+    config = await quiz_settings.resolve(db, quiz.id)
+    hidden_data = await attribution.encode(db, attribution.capture(request, config))
+    token = await start_session(db, quiz.id, request, ab_test_assignments=assignments, hidden_data=hidden_data)
+    
+    # The same interaction stream the page funnel produces, so analytics and rollups see no difference
+    interaction_buffer.record(quiz.id, token.session_id, models.PageType.HOME.value)
+    for test_key, variant in assignments.items():
+        interaction_buffer.record(
+            quiz.id, token.session_id, models.PageType.AB_EXPOSURE.value,
+            answer_value={"test_key": test_key, "variant": variant},
+        )
+    for question_id, answer in sorted(submission.answers.items(), key=lambda item: questions[item[0]].question_order):
+        interaction_buffer.record(
+            quiz.id, token.session_id, models.PageType.QUIZ.value, question_id=int(question_id), answer_value=answer
+        )
+    result = await save_lead(
+        db, quiz, token.session_id, dict(submission.answers),
+        submission.email, submission.first_name, submission.last_name,
+    )
+    
+    rule_index = await scoring.get_rule_index(db, quiz.id)
+    page = rule_index.default_page
+    if result.get("thank_you_page_id"):
+        page = next((p for p in rule_index.pages if p and p.id == result["thank_you_page_id"]), page)
+    response = JSONResponse({
+        "session_id": token.session_id,
+        "result": result,
+        "thank_you_page": {**vars(page), "cta_buttons": [dict(b) for b in page.cta_buttons]} if page else None,
+    })
+    # Lets the client fall back to the HTML results page for this session
+    set_session_cookie(response, token)
+    if tests and new_visitor:
+        ab_testing.set_visitor_cookie(response, visitor)
+    return response
+
+@app.get("/metrics")
+async def metrics():
+    if not observability.METRICS_ENABLED:
+        return PlainTextResponse("Metrics disabled", status_code=404)
+    return PlainTextResponse(observability.render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.get("/health")
 async def health_check():
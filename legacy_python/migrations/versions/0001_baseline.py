@@ -0,0 +1,67 @@
+"""Baseline schema: quizzes, questions and leads
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+Databases created by the old ``create_all`` call at import already have these
+tables, so everything here is guarded and the revision is a no-op on them.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "quizzes",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("slug", sa.String(), nullable=True),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_quizzes_id", "quizzes", ["id"], if_not_exists=True)
+    op.create_index("ix_quizzes_slug", "quizzes", ["slug"], unique=True, if_not_exists=True)
+
+    op.create_table(
+        "quiz_questions",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("quiz_id", sa.Integer(), sa.ForeignKey("quizzes.id"), nullable=True),
+        sa.Column("question_text", sa.String(), nullable=True),
+        sa.Column("question_type", sa.String(), nullable=True),
+        sa.Column("question_order", sa.Integer(), nullable=True),
+        sa.Column("answers", sa.JSON(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_quiz_questions_id", "quiz_questions", ["id"], if_not_exists=True)
+
+    op.create_table(
+        "leads",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("quiz_id", sa.Integer(), sa.ForeignKey("quizzes.id"), nullable=True),
+        sa.Column("email", sa.String(), nullable=True),
+        sa.Column("first_name", sa.String(), nullable=True),
+        sa.Column("last_name", sa.String(), nullable=True),
+        sa.Column("submission_date", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_leads_id", "leads", ["id"], if_not_exists=True)
+    op.create_index("ix_leads_email", "leads", ["email"], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_table("leads")
+    op.drop_table("quiz_questions")
+    op.drop_table("quizzes")
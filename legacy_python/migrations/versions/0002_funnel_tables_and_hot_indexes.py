@@ -0,0 +1,263 @@
+"""Sessions, interactions, rollups, settings and integration tables; hot-path indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+
+Covers every table and column added since the baseline. Development databases
+may already have some of them from ``create_all``/``add_missing_columns``, so
+each step checks the live schema first.
+"""
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+LEAD_COLUMNS = [
+    sa.Column("session_id", sa.String(), nullable=True),
+    sa.Column("quiz_answers", sa.JSON(), nullable=True),
+    sa.Column("quiz_score", sa.Float(), nullable=True),
+    sa.Column("quiz_outcome_headline", sa.String(), nullable=True),
+    sa.Column("hidden_data", sa.JSON(), nullable=True),
+]
+
+
+def _add_missing_columns(table_name, columns):
+    if context.is_offline_mode():
+        present = set()
+    else:
+        present = {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table_name)}
+    for column in columns:
+        if column.name not in present:
+            op.add_column(table_name, column)
+
+
+def upgrade():
+    _add_missing_columns("leads", LEAD_COLUMNS)
+
+    # Hot paths: question lookup by (quiz, order) on every funnel page, and
+    # per-quiz lead listings/exports ordered by submission date.
+    op.create_index("ix_quiz_questions_quiz_id_order", "quiz_questions", ["quiz_id", "question_order"], if_not_exists=True)
+    op.create_index("ix_leads_quiz_id_email", "leads", ["quiz_id", "email"], if_not_exists=True)
+    op.create_index("ix_leads_quiz_id_submission_date", "leads", ["quiz_id", "submission_date"], if_not_exists=True)
+
+    op.create_table(
+        "quiz_sessions",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("session_id", sa.String(), nullable=True),
+        sa.Column("quiz_id", sa.Integer(), sa.ForeignKey("quizzes.id"), nullable=True),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("completed_at", sa.DateTime(), nullable=True),
+        sa.Column("form_completed_at", sa.DateTime(), nullable=True),
+        sa.Column("quiz_answers", sa.JSON(), nullable=True),
+        sa.Column("quiz_result", sa.JSON(), nullable=True),
+        sa.Column("email", sa.String(), nullable=True),
+        sa.Column("first_name", sa.String(), nullable=True),
+        sa.Column("last_name", sa.String(), nullable=True),
+        sa.Column("company_name", sa.String(), nullable=True),
+        sa.Column("phone_number", sa.String(), nullable=True),
+        sa.Column("ab_test_assignments", sa.JSON(), nullable=True),
+        sa.Column("hidden_data", sa.JSON(), nullable=True),
+        sa.Column("user_agent", sa.String(), nullable=True),
+        sa.Column("ip_address", sa.String(), nullable=True),
+        sa.Column("referrer", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_quiz_sessions_id", "quiz_sessions", ["id"], if_not_exists=True)
+    op.create_index("ix_quiz_sessions_session_id", "quiz_sessions", ["session_id"], unique=True, if_not_exists=True)
+    op.create_index("ix_quiz_sessions_quiz_id", "quiz_sessions", ["quiz_id"], if_not_exists=True)
+
+    op.create_table(
+        "quiz_interactions",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("quiz_id", sa.Integer(), sa.ForeignKey("quizzes.id"), nullable=True),
+        sa.Column("session_id", sa.String(), nullable=True),
+        sa.Column("page_type", sa.String(), nullable=True),
+        sa.Column("question_id", sa.Integer(), nullable=True),
+        sa.Column(
+            "answer_value",
+            sa.JSON(none_as_null=True).with_variant(postgresql.JSONB(none_as_null=True), "postgresql"),
+            nullable=True,
+        ),
+        sa.Column("timestamp", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_quiz_interactions_id", "quiz_interactions", ["id"], if_not_exists=True)
+    op.create_index("ix_quiz_interactions_quiz_id", "quiz_interactions", ["quiz_id"], if_not_exists=True)
+    op.create_index("ix_quiz_interactions_session_id", "quiz_interactions", ["session_id"], if_not_exists=True)
+
+    op.create_table(
+        "daily_quiz_stats",
+        sa.Column("quiz_id", sa.Integer(), sa.ForeignKey("quizzes.id"), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("leads", sa.Integer(), nullable=False),
+        sa.Column("starts", sa.Integer(), nullable=False),
+        sa.Column("completions", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("quiz_id", "day"),
+        if_not_exists=True,
+    )
+
+    op.create_table(
+        "answer_counts",
+        sa.Column("quiz_id", sa.Integer(), sa.ForeignKey("quizzes.id"), nullable=False),
+        sa.Column("question_id", sa.Integer(), nullable=False),
+        sa.Column("answer_value", sa.String(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("quiz_id", "question_id", "answer_value"),
+        if_not_exists=True,
+    )
+
+    op.create_table(
+        "sync_state",
+        sa.Column("entity_type", sa.String(), nullable=False),
+        sa.Column("last_synced_id", sa.Integer(), nullable=False),
+        sa.Column("last_synced_date", sa.DateTime(), nullable=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("last_run_message", sa.String(), nullable=True),
+        sa.Column("last_run_timestamp", sa.DateTime(), nullable=True),
+        sa.Column("records_synced", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("entity_type"),
+        if_not_exists=True,
+    )
+
+    op.create_table(
+        "ab_tests",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("quiz_id", sa.Integer(), sa.ForeignKey("quizzes.id"), nullable=True),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("test_key", sa.String(), nullable=True),
+        sa.Column("variants", sa.JSON(), nullable=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_ab_tests_id", "ab_tests", ["id"], if_not_exists=True)
+    op.create_index("ix_ab_tests_quiz_id", "ab_tests", ["quiz_id"], if_not_exists=True)
+    op.create_index("ix_ab_tests_test_key", "ab_tests", ["test_key"], unique=True, if_not_exists=True)
+
+    op.create_table(
+        "thank_you_pages",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("quiz_id", sa.Integer(), sa.ForeignKey("quizzes.id"), nullable=True),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("headline", sa.String(), nullable=True),
+        sa.Column("body_content", sa.String(), nullable=True),
+        sa.Column("header_visual", sa.String(), nullable=True),
+        sa.Column("cta_section_title", sa.String(), nullable=True),
+        sa.Column("cta_section_content_type", sa.String(), nullable=True),
+        sa.Column("cta_section_text", sa.String(), nullable=True),
+        sa.Column("cta_section_image_url", sa.String(), nullable=True),
+        sa.Column("cta_section_video_url", sa.String(), nullable=True),
+        sa.Column("cta_buttons", sa.JSON(), nullable=True),
+        sa.Column("case_studies", sa.JSON(), nullable=True),
+        sa.Column("testimonials", sa.JSON(), nullable=True),
+        sa.Column("monetary_value", sa.Float(), nullable=True),
+        sa.Column("is_default", sa.Boolean(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_thank_you_pages_id", "thank_you_pages", ["id"], if_not_exists=True)
+    op.create_index("ix_thank_you_pages_quiz_id", "thank_you_pages", ["quiz_id"], if_not_exists=True)
+
+    op.create_table(
+        "result_rules",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("quiz_id", sa.Integer(), sa.ForeignKey("quizzes.id"), nullable=True),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("min_score", sa.Float(), nullable=True),
+        sa.Column("max_score", sa.Float(), nullable=True),
+        sa.Column("thank_you_page_id", sa.Integer(), sa.ForeignKey("thank_you_pages.id"), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_result_rules_id", "result_rules", ["id"], if_not_exists=True)
+    op.create_index("ix_result_rules_quiz_id", "result_rules", ["quiz_id"], if_not_exists=True)
+
+    op.create_table(
+        "quiz_settings",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("quiz_id", sa.Integer(), sa.ForeignKey("quizzes.id"), nullable=True),
+        sa.Column("kind", sa.String(), nullable=True),
+        sa.Column("config", sa.JSON(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_quiz_settings_id", "quiz_settings", ["id"], if_not_exists=True)
+    op.create_index("ix_quiz_settings_quiz_id", "quiz_settings", ["quiz_id"], if_not_exists=True)
+
+    op.create_table(
+        "integration_outbox",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("quiz_id", sa.Integer(), sa.ForeignKey("quizzes.id"), nullable=True),
+        sa.Column("lead_id", sa.Integer(), sa.ForeignKey("leads.id"), nullable=True),
+        sa.Column("setting_id", sa.Integer(), sa.ForeignKey("quiz_settings.id"), nullable=True),
+        sa.Column("integration", sa.String(), nullable=True),
+        sa.Column("payload", sa.JSON(), nullable=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("next_attempt_at", sa.DateTime(), nullable=True),
+        sa.Column("claim_token", sa.String(), nullable=True),
+        sa.Column("claimed_at", sa.DateTime(), nullable=True),
+        sa.Column("last_error", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("sent_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_integration_outbox_id", "integration_outbox", ["id"], if_not_exists=True)
+    op.create_index("ix_integration_outbox_claim_token", "integration_outbox", ["claim_token"], if_not_exists=True)
+    # The dispatcher's claim query filters on both; the single-column indexes
+    # that create_all used to build are superseded by the composite one.
+    op.drop_index("ix_integration_outbox_status", "integration_outbox", if_exists=True)
+    op.drop_index("ix_integration_outbox_next_attempt_at", "integration_outbox", if_exists=True)
+    op.create_index(
+        "ix_integration_outbox_status_next_attempt",
+        "integration_outbox",
+        ["status", "next_attempt_at"],
+        if_not_exists=True,
+    )
+
+    op.create_table(
+        "lead_dedupe_keys",
+        sa.Column("quiz_id", sa.Integer(), sa.ForeignKey("quizzes.id"), nullable=False),
+        sa.Column("dedupe_key", sa.String(), nullable=False),
+        sa.Column("lead_id", sa.Integer(), sa.ForeignKey("leads.id"), nullable=True),
+        sa.PrimaryKeyConstraint("quiz_id", "dedupe_key"),
+        if_not_exists=True,
+    )
+
+
+def downgrade():
+    for table in (
+        "lead_dedupe_keys",
+        "integration_outbox",
+        "quiz_settings",
+        "result_rules",
+        "thank_you_pages",
+        "ab_tests",
+        "sync_state",
+        "answer_counts",
+        "daily_quiz_stats",
+        "quiz_interactions",
+        "quiz_sessions",
+    ):
+        op.drop_table(table)
+    op.drop_index("ix_leads_quiz_id_submission_date", "leads")
+    op.drop_index("ix_leads_quiz_id_email", "leads")
+    op.drop_index("ix_quiz_questions_quiz_id_order", "quiz_questions")
+    with op.batch_alter_table("leads") as batch:
+        for column in reversed(LEAD_COLUMNS):
+            batch.drop_column(column.name)
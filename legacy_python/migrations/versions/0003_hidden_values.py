@@ -0,0 +1,31 @@
+"""Dictionary table for captured hidden-field and UTM values
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "hidden_values",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("field_name", sa.String(), nullable=False),
+        sa.Column("value", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        if_not_exists=True,
+    )
+    op.create_index("ix_hidden_values_field_value", "hidden_values", ["field_name", "value"], unique=True, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_table("hidden_values")
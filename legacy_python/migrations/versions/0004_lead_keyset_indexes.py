@@ -0,0 +1,31 @@
+"""Keyset indexes for the admin lead browser
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+
+The lead list pages on (submission_date, id). The (quiz_id, submission_date)
+index is widened with id so the tie-breaker is in the index on every
+backend; its prefix still serves the per-quiz date filters of the exports.
+"""
+from alembic import op
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_leads_quiz_id_submission_date_id", "leads", ["quiz_id", "submission_date", "id"], if_not_exists=True
+    )
+    op.create_index("ix_leads_submission_date_id", "leads", ["submission_date", "id"], if_not_exists=True)
+    op.drop_index("ix_leads_quiz_id_submission_date", "leads", if_exists=True)
+
+
+def downgrade():
+    op.create_index("ix_leads_quiz_id_submission_date", "leads", ["quiz_id", "submission_date"], if_not_exists=True)
+    op.drop_index("ix_leads_submission_date_id", "leads")
+    op.drop_index("ix_leads_quiz_id_submission_date_id", "leads")
@@ -0,0 +1,31 @@
+"""Change tracking for quiz_sessions in the warehouse sync
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+
+Sessions change after they are created (lead form, rescoring). ``updated_at``
+lets ``app.sync`` re-export them, from the time kept in
+``sync_state.last_synced_updated_at``. Existing rows keep a NULL
+``updated_at`` until they next change.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("quiz_sessions", sa.Column("updated_at", sa.DateTime(), nullable=True))
+    op.create_index("ix_quiz_sessions_updated_at", "quiz_sessions", ["updated_at"], if_not_exists=True)
+    op.add_column("sync_state", sa.Column("last_synced_updated_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("sync_state", "last_synced_updated_at")
+    op.drop_index("ix_quiz_sessions_updated_at", "quiz_sessions")
+    op.drop_column("quiz_sessions", "updated_at")
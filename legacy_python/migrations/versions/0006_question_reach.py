@@ -0,0 +1,38 @@
+"""Distinct-session reach per question for the analytics funnel
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+
+``answer_counts`` counts every answer, so a session that goes back and
+answers again is counted twice. ``question_reach`` counts each session once
+per question. It is backfilled from the interactions still stored.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "question_reach",
+        sa.Column("quiz_id", sa.Integer(), sa.ForeignKey("quizzes.id"), nullable=False),
+        sa.Column("question_id", sa.Integer(), nullable=False),
+        sa.Column("sessions", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("quiz_id", "question_id"),
+        if_not_exists=True,
+    )
+    op.execute(
+        "INSERT INTO question_reach (quiz_id, question_id, sessions) "
+        "SELECT quiz_id, question_id, COUNT(DISTINCT session_id) FROM quiz_interactions "
+        "WHERE page_type = 'quiz' AND question_id IS NOT NULL GROUP BY quiz_id, question_id"
+    )
+
+
+def downgrade():
+    op.drop_table("question_reach")
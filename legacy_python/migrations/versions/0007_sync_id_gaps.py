@@ -0,0 +1,22 @@
+"""Id ranges the warehouse sync skipped, to look up again
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("sync_state", sa.Column("id_gaps", sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("sync_state", "id_gaps")
@@ -0,0 +1,31 @@
+"""Secrets shared by every worker, such as the session cookie key
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17
+
+Filled by ``app.bootstrap``, not here, so the value never appears in
+offline-generated SQL.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "app_secrets",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("value", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+        if_not_exists=True,
+    )
+
+
+def downgrade():
+    op.drop_table("app_secrets")
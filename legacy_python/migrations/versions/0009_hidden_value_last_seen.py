@@ -0,0 +1,27 @@
+"""Last lookup time of interned hidden values
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17
+
+``app.retention`` only prunes ``hidden_values`` rows that
+``attribution.encode`` has not handed out for a while. Existing rows start
+from their ``created_at``.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("hidden_values", sa.Column("last_seen_at", sa.DateTime(), nullable=True))
+    op.execute("UPDATE hidden_values SET last_seen_at = created_at")
+
+
+def downgrade():
+    op.drop_column("hidden_values", "last_seen_at")
@@ -0,0 +1,45 @@
+"""Test configuration: every test session runs against its own SQLite file.
+
+Engines are configured from the environment at import, so the variables are
+set here before anything under ``app`` is imported.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP = tempfile.mkdtemp(prefix="quiz_tests_")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(TMP, 'test.db')}",
+    "INTERACTION_SPOOL_PATH": os.path.join(TMP, "interactions.spool"),
+    "INVALIDATION_BUS_URL": "memory://",
+    "OUTBOX_DISPATCH_IN_PROCESS": "0",
+    "BOOTSTRAP_ON_STARTUP": "0",
+    "RATE_LIMIT_ENABLED": "0",
+    "SESSION_SECRET": "test-secret",
+})
+sys.path.insert(0, ROOT)
+# main.py mounts static/ and templates/ relative to the working directory
+os.chdir(ROOT)
+
+import pytest  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+
+from app import attribution, db_models, dedupe, migrate  # noqa: E402
+from app.database import engine  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    migrate.upgrade()
+
+
+@pytest.fixture(autouse=True)
+def clean_tables():
+    yield
+    with engine.begin() as conn:
+        for table in reversed(db_models.Base.metadata.sorted_tables):
+            conn.execute(delete(table))
+    # Ids are reused once the tables are empty; drop in-process state keyed by them
+    dedupe.forget()
+    attribution.forget_interned()
@@ -0,0 +1,61 @@
+from collections import Counter
+
+from fastapi.testclient import TestClient
+
+import main
+from app import ab_testing, db_models, quiz_cache
+from app.database import SessionLocal
+from app.models import ABTestStatus
+
+
+def make_test(variants, test_key="headline"):
+    return db_models.ABTest(quiz_id=1, test_key=test_key, variants=variants, status=ABTestStatus.RUNNING.value)
+
+
+def test_assignment_is_sticky_and_follows_the_weights():
+    test = ab_testing.compile_test(make_test([
+        {"key": "a", "weight": 70}, {"key": "b", "weight": 30}, {"key": "off", "weight": 0},
+    ]))
+    assert test.variant_keys == ("a", "b")
+
+    counts = Counter(test.assign(f"visitor-{n}") for n in range(10000))
+    assert 6700 < counts["a"] < 7300
+    assert all(test.assign(f"visitor-{n}") == test.assign(f"visitor-{n}") for n in range(100))
+
+    # Each test splits visitors independently of the others
+    other = ab_testing.compile_test(make_test([{"key": "a", "weight": 70}, {"key": "b", "weight": 30}], "cta"))
+    assert any(test.assign(f"visitor-{n}") != other.assign(f"visitor-{n}") for n in range(100))
+
+
+def test_no_weighted_variant_means_no_test():
+    assert ab_testing.compile_test(make_test([{"key": "a", "weight": 0}])) is None
+    assert ab_testing.compile_test(make_test(None)) is None
+
+
+def test_api_serves_the_assigned_variant_and_keeps_it():
+    with SessionLocal() as db:
+        quiz = db_models.Quiz(slug="split", name="Control", is_active=True)
+        db.add(quiz)
+        db.flush()
+        db.add(db_models.ABTest(
+            quiz_id=quiz.id, test_key="split-name", status=ABTestStatus.RUNNING.value, is_active=True,
+            variants=[{"key": "renamed", "weight": 1, "quiz": {"name": "Variant"}, "design": {"primary-color": "#16a34a"}}],
+        ))
+        db.commit()
+    quiz_cache.invalidate_quiz("split")
+    ab_testing.invalidate_ab_tests()
+
+    with TestClient(main.app) as client:
+        first = client.get("/api/quiz/split")
+        assert first.cookies[ab_testing.VISITOR_COOKIE_NAME]
+        again = client.get("/api/quiz/split")
+    ab_testing.invalidate_ab_tests()
+
+    body = first.json()
+    assert body["ab_test_assignments"] == {"split-name": "renamed"}
+    assert body["quiz"]["name"] == "Variant"
+    assert body["design"]["primary-color"] == "#16a34a"
+    assert first.headers["Cache-Control"].startswith("private")
+    # The cookie sent back keeps the visitor and is not re-issued
+    assert ab_testing.VISITOR_COOKIE_NAME not in again.cookies
+    assert again.json() == body
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import analytics, db_models
+from app.database import AsyncSessionLocal, SessionLocal
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    analytics.clear_cache()
+    yield
+    analytics.clear_cache()
+
+
+def make_stats():
+    today = datetime.utcnow().date()
+    with SessionLocal() as db:
+        quizzes = [db_models.Quiz(slug=f"q{n}", name=f"Quiz {n}", is_active=True) for n in range(3)]
+        db.add_all(quizzes)
+        db.flush()
+        busy, quiet, _empty = (q.id for q in quizzes)
+        db.add_all([
+            db_models.DailyQuizStats(quiz_id=busy, day=today, leads=4, starts=10, completions=4),
+            db_models.DailyQuizStats(quiz_id=busy, day=today - timedelta(days=2), leads=3, starts=5, completions=3),
+            db_models.DailyQuizStats(quiz_id=busy, day=today - timedelta(days=30), leads=50, starts=90, completions=50),
+            db_models.DailyQuizStats(quiz_id=quiet, day=today, leads=1, starts=2, completions=1),
+            db_models.AnswerCount(quiz_id=busy, question_id=7, answer_value="yes", count=6),
+            db_models.AnswerCount(quiz_id=busy, question_id=7, answer_value="no", count=2),
+        ])
+        db.commit()
+        return busy, quiet, today
+
+
+def run(query, *args, **kwargs):
+    async def go():
+        async with AsyncSessionLocal() as db:
+            return await query(db, *args, **kwargs)
+
+    return asyncio.run(go())
+
+
+def test_top_quizzes_rank_by_all_time_leads_and_include_quizzes_without_any():
+    busy, quiet, _ = make_stats()
+    ranked = run(analytics.top_quizzes, limit=3)
+    assert [(q["id"], q["lead_count"]) for q in ranked][:2] == [(busy, 57), (quiet, 1)]
+    assert ranked[2]["lead_count"] == 0
+
+
+def test_leads_per_day_fills_empty_days():
+    busy, _, today = make_stats()
+    days = run(analytics.leads_per_day, busy, days=3)
+    assert days == [
+        {"day": (today - timedelta(days=2)).isoformat(), "leads": 3},
+        {"day": (today - timedelta(days=1)).isoformat(), "leads": 0},
+        {"day": today.isoformat(), "leads": 4},
+    ]
+    assert run(analytics.leads_per_day, days=1) == [{"day": today.isoformat(), "leads": 5}]
+
+
+def test_results_are_cached_for_the_ttl():
+    busy, _, _ = make_stats()
+    assert run(analytics.answer_distribution, busy) == {7: {"yes": 6, "no": 2}}
+    with SessionLocal() as db:
+        db.query(db_models.AnswerCount).delete()
+        db.commit()
+    assert run(analytics.answer_distribution, busy) == {7: {"yes": 6, "no": 2}}
+
+    analytics.clear_cache()
+    assert run(analytics.answer_distribution, busy) == {}
@@ -0,0 +1,79 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+import main
+from app import db_models, quiz_cache, scoring, sessions
+from app.database import SessionLocal
+from app.interaction_log import interaction_buffer
+
+
+def make_quiz():
+    with SessionLocal() as db:
+        quiz = db_models.Quiz(slug="api", name="API", is_active=True)
+        db.add(quiz)
+        db.flush()
+        questions = [
+            db_models.QuizQuestion(
+                quiz_id=quiz.id, question_text=f"Q{order}", question_type="multiple_choice", question_order=order,
+                answers=[{"value": "yes", "label": "Yes", "score": 5}, {"value": "no", "label": "No", "score": 0}],
+                is_active=True,
+            )
+            for order in (1, 2)
+        ]
+        page = db_models.ThankYouPage(quiz_id=quiz.id, name="Hot", headline="Great fit", body_content="...")
+        db.add_all([*questions, page])
+        db.flush()
+        db.add(db_models.ResultRule(
+            quiz_id=quiz.id, name="Hot", min_score=10, max_score=100, thank_you_page_id=page.id, is_active=True,
+        ))
+        db.commit()
+        ids = [str(q.id) for q in questions]
+    quiz_cache.invalidate_quiz("api")
+    scoring.invalidate_rules()
+    return ids
+
+
+def test_quiz_payload_is_cacheable_and_revalidates():
+    ids = make_quiz()
+    with TestClient(main.app) as client:
+        response = client.get("/api/quiz/api")
+        body = response.json()
+        assert [str(q["id"]) for q in body["quiz"]["questions"]] == ids
+        assert body["quiz"]["questions"][1]["progress_percentage"] == 50
+        assert response.headers["Cache-Control"].startswith("public")
+
+        again = client.get("/api/quiz/api", headers={"If-None-Match": response.headers["ETag"]})
+        assert again.status_code == 304
+        assert client.get("/api/quiz/missing").status_code == 404
+
+
+def test_submit_scores_stores_the_lead_and_records_the_funnel():
+    ids = make_quiz()
+    with TestClient(main.app) as client:
+        response = client.post("/api/quiz/api/submit", json={
+            "answers": {ids[1]: "yes", ids[0]: "yes"}, "email": "a@example.com", "first_name": "Ada",
+        })
+        session_id = response.json()["session_id"]
+        recorded = [(row["page_type"], row["question_id"]) for row in interaction_buffer.pending_for(session_id)]
+
+    body = response.json()
+    assert body["result"]["score"] == 10
+    assert body["thank_you_page"]["headline"] == "Great fit"
+    assert sessions.SESSION_COOKIE_NAME in response.cookies
+    # Intro view, answers in question order, then the lead form
+    assert recorded == [("home", None), ("quiz", int(ids[0])), ("quiz", int(ids[1])), ("form", None)]
+    with SessionLocal() as db:
+        lead = db.scalars(select(db_models.Lead)).one()
+        assert (lead.email, lead.session_id, lead.quiz_score) == ("a@example.com", session_id, 10)
+        assert db.scalars(select(db_models.QuizSession.session_id)).all() == [session_id]
+
+
+def test_submit_rejects_unknown_questions():
+    make_quiz()
+    with TestClient(main.app) as client:
+        response = client.post("/api/quiz/api/submit", json={"answers": {"999999": "yes"}, "email": "a@example.com"})
+
+    assert response.status_code == 422
+    assert "999999" in response.json()["detail"]
+    with SessionLocal() as db:
+        assert db.scalars(select(db_models.Lead)).all() == []
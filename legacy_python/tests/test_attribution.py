@@ -0,0 +1,87 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app import attribution, db_models, retention
+from app.database import AsyncSessionLocal, SessionLocal, async_engine
+
+
+async def encode_and_decode(values):
+    async with AsyncSessionLocal() as db:
+        encoded = await attribution.encode(db, values)
+        await db.commit()
+        attribution.forget_interned()
+        [decoded] = await attribution.decode_many(db, [encoded])
+        return encoded, decoded
+
+
+def test_click_ids_are_stored_inline():
+    values = {"utm_source": "newsletter", "gclid": "Cj0KCQjw-unique"}
+    encoded, decoded = asyncio.run(encode_and_decode(values))
+
+    assert decoded == values
+    assert encoded[1:] == [["gclid", "Cj0KCQjw-unique"]]
+    with SessionLocal() as db:
+        assert db.scalars(select(db_models.HiddenValue.field_name)).all() == ["utm_source"]
+
+
+async def prune(now):
+    async with async_engine.connect() as conn:
+        return await retention.prune_hidden_values(conn, now)
+
+
+def test_prune_deletes_only_old_unreferenced_values():
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        quiz = db_models.Quiz(slug="attribution", name="Attribution", is_active=True)
+        kept, orphan, fresh = (
+            db_models.HiddenValue(field_name="utm_source", value=value, last_seen_at=last_seen_at)
+            for value, last_seen_at in (("kept", now - timedelta(days=30)), ("orphan", now - timedelta(days=30)), ("fresh", now))
+        )
+        db.add_all([quiz, kept, orphan, fresh])
+        db.flush()
+        db.add(db_models.Lead(quiz_id=quiz.id, email="a@example.com", hidden_data=[kept.id, ["gclid", "x"]]))
+        db.commit()
+
+    assert asyncio.run(prune(now)) == 1
+    with SessionLocal() as db:
+        assert sorted(db.scalars(select(db_models.HiddenValue.value))) == ["fresh", "kept"]
+
+
+def test_prune_keeps_a_value_encoded_while_it_runs():
+    with SessionLocal() as db:
+        value = db_models.HiddenValue(field_name="utm_source", value="returning", last_seen_at=datetime(2020, 1, 1))
+        db.add(value)
+        db.commit()
+        value_id = value.id
+    encoded = []
+
+    def encode_elsewhere():
+        # Another worker with a cold cache, between the reference scan and the DELETE
+        async def run():
+            engine = create_async_engine(async_engine.url)
+            async with AsyncSession(engine) as db:
+                encoded.append(await attribution.encode(db, {"utm_source": "returning"}))
+                await db.commit()
+            await engine.dispose()
+
+        attribution.forget_interned()
+        asyncio.run(run())
+
+    def before_delete(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("DELETE FROM hidden_values") and not encoded:
+            worker = threading.Thread(target=encode_elsewhere)
+            worker.start()
+            worker.join()
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_delete)
+    try:
+        assert asyncio.run(prune(datetime.utcnow())) == 0
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", before_delete)
+    assert encoded == [[value_id]]
+    with SessionLocal() as db:
+        assert db.get(db_models.HiddenValue, value_id) is not None
@@ -0,0 +1,39 @@
+import importlib.util
+import os
+
+# benchmarks/ is a directory of scripts, not a package
+spec = importlib.util.spec_from_file_location("bench_funnel", os.path.join("benchmarks", "bench_funnel.py"))
+bench_funnel = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bench_funnel)
+
+
+def test_summary_of_request_samples():
+    # (latency ms, status, queries, db ms)
+    samples = [(float(ms), 200, 2, 1.0) for ms in range(1, 101)] + [(500.0, 500, 0, 0.0)]
+    summary = bench_funnel.summarize(samples, elapsed=2.0)
+
+    assert summary["requests"] == 101
+    assert summary["errors"] == 1
+    assert summary["throughput_rps"] == 50.5
+    assert (summary["p50_ms"], summary["p95_ms"], summary["p99_ms"]) == (51.0, 96.0, 100.0)
+    assert summary["queries_per_request"] == round(200 / 101, 2)
+    assert bench_funnel.percentile([], 99) == 0.0
+
+
+def test_baseline_comparison_flags_slower_and_chattier_routes():
+    baseline = {"routes": {
+        "quiz_intro": {"p95_ms": 10.0, "queries_per_request": 1.0},
+        "start_quiz": {"p95_ms": 10.0, "queries_per_request": 2.0},
+        "submit": {"p95_ms": 10.0, "queries_per_request": 4.0},
+    }}
+    result = {"routes": {
+        "quiz_intro": {"p95_ms": 10.9, "queries_per_request": 1.04},
+        "start_quiz": {"p95_ms": 12.0, "queries_per_request": 2.0},
+        "submit": {"p95_ms": 9.0, "queries_per_request": 5.0},
+        "new_route": {"p95_ms": 100.0, "queries_per_request": 9.0},
+    }}
+
+    assert bench_funnel.compare(result, baseline, tolerance=0.1) == [
+        "start_quiz: p95 10.0 -> 12.0 ms",
+        "submit: queries/request 4.0 -> 5.0",
+    ]
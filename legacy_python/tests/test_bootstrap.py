@@ -0,0 +1,32 @@
+import multiprocessing
+
+from sqlalchemy import create_engine, func, select
+
+from app import bootstrap, db_models
+
+
+def _bootstrap(url, start, results):
+    engine = create_engine(url)
+    start.wait()
+    results.put(bootstrap.ensure_ready(bind=engine, seed=True)["seeded_quizzes"])
+    engine.dispose()
+
+
+def test_workers_starting_together_migrate_and_seed_once(tmp_path):
+    url = f"sqlite:///{tmp_path / 'bootstrap.db'}"
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_bootstrap, args=(url, start, results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    start.set()
+    for worker in workers:
+        worker.join(60)
+
+    seeded = sorted(results.get(timeout=5) for _ in workers)
+    assert seeded[:3] == [0, 0, 0] and seeded[3] > 0
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(db_models.Quiz)) == seeded[3]
+        assert conn.scalar(select(func.count()).select_from(db_models.AppSecret)) == 1
+    engine.dispose()
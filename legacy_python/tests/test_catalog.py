@@ -0,0 +1,47 @@
+from fastapi.testclient import TestClient
+
+import main
+
+
+def question(text, order, is_active=True, **fields):
+    return {
+        "question_text": text, "question_type": "multiple_choice", "question_order": order,
+        "answers": [{"value": "yes", "label": "Yes"}], "is_active": is_active, **fields,
+    }
+
+
+def import_quiz(client, questions):
+    catalog = {"quizzes": [{"name": "Catalog", "slug": "catalog", "questions": questions}]}
+    response = client.post("/admin/quizzes/import", json=catalog)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_inactive_questions_do_not_end_the_funnel():
+    with TestClient(main.app) as client:
+        import_quiz(client, [question("A?", 1), question("B?", 2, is_active=False), question("C?", 3)])
+
+        page = client.get("/quiz/catalog/question/2", follow_redirects=False)
+        assert page.status_code == 200
+        assert "C?" in page.text
+        assert client.get("/quiz/catalog/question/3", follow_redirects=False).headers["location"].endswith("/lead-form")
+
+        exported = client.get("/admin/quizzes/export", params={"slug": "catalog"}).json()
+    assert [(q["question_text"], q["question_order"]) for q in exported["quizzes"][0]["questions"]] == [("A?", 1), ("C?", 2)]
+
+
+def test_reimport_reorders_existing_questions():
+    with TestClient(main.app) as client:
+        import_quiz(client, [question("A?", 1), question("B?", 2), question("C?", 3)])
+        exported = client.get("/admin/quizzes/export", params={"slug": "catalog"}).json()
+        questions = exported["quizzes"][0]["questions"]
+        for q, order in zip(questions, (3, 1, 2)):
+            q["question_order"] = order
+
+        [result] = import_quiz(client, questions)["results"]
+        assert (result["questions_inserted"], result["questions_updated"]) == (0, 3)
+        assert "B?" in client.get("/quiz/catalog/question/1").text
+        assert "A?" in client.get("/quiz/catalog/question/3").text
+
+        reexported = client.get("/admin/quizzes/export", params={"slug": "catalog"}).json()
+    assert [q["question_text"] for q in reexported["quizzes"][0]["questions"]] == ["B?", "C?", "A?"]
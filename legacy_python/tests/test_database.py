@@ -0,0 +1,40 @@
+import asyncio
+
+from sqlalchemy import text
+
+from app import database
+from app.database import async_engine
+
+
+def test_async_url_picks_the_asyncio_driver():
+    assert database.to_async_url("sqlite:///./quiz.db") == "sqlite+aiosqlite:///./quiz.db"
+    assert database.to_async_url("postgresql://quiz@db/quiz") == "postgresql+asyncpg://quiz@db/quiz"
+    assert database.to_async_url("postgresql+psycopg2://quiz@db/quiz") == "postgresql+asyncpg://quiz@db/quiz"
+    assert database.to_async_url("mysql://quiz@db/quiz") == "mysql://quiz@db/quiz"
+
+
+def test_async_connections_get_the_sqlite_pragmas():
+    async def pragmas():
+        async with async_engine.connect() as conn:
+            values = [
+                (await conn.execute(text(f"PRAGMA {name}"))).scalar()
+                for name in ("journal_mode", "busy_timeout", "synchronous")
+            ]
+        await async_engine.dispose()
+        return values
+
+    # synchronous=NORMAL reads back as 1
+    assert asyncio.run(pragmas()) == ["wal", database.SQLITE_BUSY_TIMEOUT_MS, 1]
+
+
+def test_pooled_connections_serve_concurrent_queries():
+    async def run():
+        async def query(n):
+            async with database.AsyncSessionLocal() as db:
+                return (await db.execute(text("SELECT :n"), {"n": n})).scalar()
+
+        results = await asyncio.gather(*(query(n) for n in range(database.DB_POOL_SIZE * 2)))
+        await async_engine.dispose()
+        return results
+
+    assert asyncio.run(run()) == list(range(database.DB_POOL_SIZE * 2))
@@ -0,0 +1,44 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import main
+from app import db_models, dedupe
+from app.database import AsyncSessionLocal, SessionLocal
+
+
+def make_quiz(keys=0):
+    with SessionLocal() as db:
+        quiz = db_models.Quiz(slug="dedupe", name="Dedupe", is_active=True)
+        db.add(quiz)
+        db.flush()
+        db.add_all([db_models.LeadDedupeKey(quiz_id=quiz.id, dedupe_key=f"k{i}", lead_id=i) for i in range(keys)])
+        db.commit()
+        return quiz.id
+
+
+async def load_filter(quiz_id):
+    async with AsyncSessionLocal() as db:
+        return await dedupe._load_filter(db, quiz_id)
+
+
+def test_filter_is_sized_from_stored_keys_and_reloaded_when_full():
+    quiz_id = make_quiz(keys=3000)
+    bloom = asyncio.run(load_filter(quiz_id))
+    assert bloom.capacity == 3000 * dedupe.DEDUPE_BLOOM_HEADROOM
+    assert all(f"k{i}" in bloom for i in range(3000))
+
+    for i in range(3000, bloom.capacity):
+        dedupe.remember(quiz_id, f"k{i}")
+    assert dedupe._filters[quiz_id] is bloom
+    dedupe.remember(quiz_id, "one-too-many")
+    assert quiz_id not in dedupe._filters
+
+
+def test_criteria_the_lead_form_does_not_collect_are_rejected():
+    make_quiz()
+    with TestClient(main.app) as client:
+        url = "/admin/quizzes/dedupe/settings/general"
+        config = {"enable_duplicate_check": True}
+        assert client.post(url, json={**config, "duplicate_check_criteria": ["phone_number"]}).status_code == 422
+        assert client.post(url, json={**config, "duplicate_check_criteria": ["email"]}).status_code == 200
@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app import db_models, exports, quiz_cache
+from app.database import SessionLocal
+
+
+@pytest.fixture
+def quiz_with_leads(monkeypatch):
+    # Several partitions for a handful of rows
+    monkeypatch.setattr(exports, "EXPORT_CHUNK_SIZE", 2)
+    with SessionLocal() as db:
+        quiz = db_models.Quiz(slug="export", name="Export", is_active=True)
+        db.add(quiz)
+        db.flush()
+        source = db_models.HiddenValue(field_name="utm_source", value="newsletter")
+        db.add(source)
+        db.flush()
+        db.add_all([
+            db_models.Lead(
+                quiz_id=quiz.id, email=f"lead{n}@example.com", first_name="Ada", submission_date=datetime(2026, 1, n + 1),
+                quiz_answers={"1": "a"}, hidden_data=[source.id, ["gclid", f"click{n}"]],
+            )
+            for n in range(5)
+        ])
+        db.commit()
+    quiz_cache.invalidate_quiz("export")
+    with TestClient(main.app) as client:
+        yield client
+
+
+def test_csv_export_streams_every_lead_with_decoded_hidden_data(quiz_with_leads):
+    response = quiz_with_leads.get("/admin/quizzes/export/leads/export?format=csv")
+
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'filename="export-leads.csv"' in response.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["email"] for row in rows] == [f"lead{n}@example.com" for n in range(5)]
+    assert json.loads(rows[0]["hidden_data"]) == {"utm_source": "newsletter", "gclid": "click0"}
+    assert json.loads(rows[0]["quiz_answers"]) == {"1": "a"}
+
+
+def test_ndjson_export_filters_by_date_and_resumes_after_an_id(quiz_with_leads):
+    response = quiz_with_leads.get(
+        "/admin/quizzes/export/leads/export", params={"format": "ndjson", "since": "2026-01-02", "until": "2026-01-05"}
+    )
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["email"] for r in records] == ["lead1@example.com", "lead2@example.com", "lead3@example.com"]
+
+    resumed = quiz_with_leads.get(
+        "/admin/quizzes/export/leads/export", params={"format": "ndjson", "after_id": records[-1]["id"]}
+    )
+    assert [json.loads(line)["email"] for line in resumed.text.splitlines()] == ["lead4@example.com"]
+
+
+def test_unknown_format_is_rejected(quiz_with_leads):
+    assert quiz_with_leads.get("/admin/quizzes/export/leads/export?format=xlsx").status_code == 400
+
+
+def test_parquet_export_round_trips(quiz_with_leads):
+    pq = pytest.importorskip("pyarrow.parquet")
+    response = quiz_with_leads.get("/admin/quizzes/export/leads/export?format=parquet")
+
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.column("email").to_pylist() == [f"lead{n}@example.com" for n in range(5)]
+    assert json.loads(table.column("hidden_data")[4].as_py()) == {"utm_source": "newsletter", "gclid": "click4"}
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import smtplib
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sqlalchemy import select, update
+
+from app import db_models, integrations, quiz_settings
+from app.database import AsyncSessionLocal, SessionLocal, async_engine
+
+
+class StubServer:
+    """HubSpot stand-in that records every submission and answers with ``status``."""
+
+    def __init__(self):
+        self.status = 200
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                stub.requests.append((self.path, json.loads(body)))
+                self.send_response(stub.status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def emails(self):
+        return sorted(
+            field["value"] for _, body in self.requests for field in body["fields"] if field["name"] == "email"
+        )
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = StubServer()
+    monkeypatch.setattr(integrations, "HUBSPOT_FORMS_URL", server.url)
+    yield server
+    server.server.shutdown()
+
+
+def enqueue_leads(count):
+    with SessionLocal() as db:
+        quiz = db_models.Quiz(slug="outbox", name="Outbox", is_active=True)
+        db.add(quiz)
+        db.flush()
+        db.add(db_models.QuizSetting(quiz_id=quiz.id, kind="hubspot", is_active=True, config={
+            "portal_id": "123", "form_guid": "abc", "is_enabled": True, "property_mappings": {},
+        }))
+        db.commit()
+        quiz_id = quiz.id
+    quiz_settings.invalidate_settings()
+
+    async def enqueue():
+        async with AsyncSessionLocal() as db:
+            for n in range(count):
+                lead = db_models.Lead(quiz_id=quiz_id, email=f"lead{n}@example.com", submission_date=datetime.utcnow())
+                db.add(lead)
+                await db.flush()
+                await integrations.enqueue_lead(db, quiz_id, lead, {})
+            await db.commit()
+
+    asyncio.run(enqueue())
+
+
+def outbox_rows():
+    with SessionLocal() as db:
+        return db.scalars(select(db_models.IntegrationOutbox).order_by(db_models.IntegrationOutbox.id)).all()
+
+
+def dispatch(*dispatchers):
+    async def run():
+        try:
+            return await asyncio.gather(*(d.dispatch_once() for d in dispatchers))
+        finally:
+            for d in dispatchers:
+                await d.stop()
+            await async_engine.dispose()
+
+    return asyncio.run(run())
+
+
+def test_delivers_and_marks_sent(stub):
+    enqueue_leads(3)
+
+    assert dispatch(integrations.OutboxDispatcher(async_engine)) == [3]
+
+    assert stub.emails() == ["lead0@example.com", "lead1@example.com", "lead2@example.com"]
+    assert {path for path, _ in stub.requests} == {"/123/abc"}
+    rows = outbox_rows()
+    assert [r.status for r in rows] == ["sent"] * 3
+    assert all(r.sent_at is not None and r.claim_token is None for r in rows)
+
+
+def test_failed_delivery_backs_off_then_dies(stub, monkeypatch):
+    monkeypatch.setattr(integrations, "OUTBOX_MAX_ATTEMPTS", 2)
+    stub.status = 500
+    enqueue_leads(1)
+
+    dispatch(integrations.OutboxDispatcher(async_engine))
+    (row,) = outbox_rows()
+    assert (row.status, row.attempts) == ("pending", 1)
+    assert row.next_attempt_at > datetime.utcnow()
+    assert "500" in row.last_error
+
+    # Not due yet: nothing is claimed
+    assert dispatch(integrations.OutboxDispatcher(async_engine)) == [0]
+
+    with SessionLocal() as db:
+        db.execute(update(db_models.IntegrationOutbox).values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.commit()
+    dispatch(integrations.OutboxDispatcher(async_engine))
+    (row,) = outbox_rows()
+    assert (row.status, row.attempts) == ("dead", 2)
+    assert len(stub.requests) == 2
+
+
+def test_retry_succeeds_after_transient_failure(stub):
+    stub.status = 503
+    enqueue_leads(1)
+    dispatch(integrations.OutboxDispatcher(async_engine))
+
+    stub.status = 200
+    with SessionLocal() as db:
+        db.execute(update(db_models.IntegrationOutbox).values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.commit()
+    dispatch(integrations.OutboxDispatcher(async_engine))
+
+    (row,) = outbox_rows()
+    assert (row.status, row.attempts, row.last_error) == ("sent", 1, None)
+    assert stub.emails() == ["lead0@example.com", "lead0@example.com"]
+
+
+def test_concurrent_dispatchers_deliver_each_lead_once(stub, monkeypatch):
+    monkeypatch.setattr(integrations, "OUTBOX_CLAIM_SIZE", 5)
+    enqueue_leads(20)
+
+    dispatchers = [integrations.OutboxDispatcher(async_engine) for _ in range(4)]
+    for _ in range(5):
+        dispatch(*dispatchers)
+
+    assert stub.emails() == sorted(f"lead{n}@example.com" for n in range(20))
+    assert {r.status for r in outbox_rows()} == {"sent"}
+
+
+def test_expired_claim_is_retaken_and_late_result_ignored(stub):
+    enqueue_leads(1)
+    with SessionLocal() as db:
+        db.execute(update(db_models.IntegrationOutbox).values(
+            status="sending", claim_token="dead-worker",
+            claimed_at=datetime.utcnow() - timedelta(seconds=integrations.OUTBOX_CLAIM_LEASE + 1),
+        ))
+        db.commit()
+
+    dispatch(integrations.OutboxDispatcher(async_engine))
+    (row,) = outbox_rows()
+    assert row.status == "sent"
+
+    # The worker that lost its lease finishing late must not touch the row
+    stale = db_models.IntegrationOutbox(id=row.id, integration="hubspot", attempts=0, claim_token="dead-worker")
+
+    async def late_failure():
+        await integrations.OutboxDispatcher(async_engine)._mark_failed([stale], RuntimeError("late"))
+        await async_engine.dispose()
+
+    asyncio.run(late_failure())
+    (row,) = outbox_rows()
+    assert (row.status, row.last_error) == ("sent", None)
+
+
+def test_email_batch_failure_retries_only_undelivered_rows(monkeypatch):
+    delivered = []
+
+    class FlakySMTP:
+        """Accepts two messages per connection, then drops it."""
+
+        def __init__(self, host, port, timeout):
+            self.accepted = 0
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def send_message(self, message):
+            if self.accepted == 2:
+                raise smtplib.SMTPServerDisconnected("connection lost")
+            self.accepted += 1
+            delivered.append(message["Subject"])
+
+    monkeypatch.setattr(integrations.smtplib, "SMTP", FlakySMTP)
+    with SessionLocal() as db:
+        quiz = db_models.Quiz(slug="mail", name="Mail", is_active=True)
+        db.add(quiz)
+        db.flush()
+        setting = db_models.QuizSetting(quiz_id=quiz.id, kind="email_notification", is_active=True, config={
+            "name": "Sales", "is_enabled": True, "recipient_emails": ["sales@example.com"], "sender_name": "Quiz",
+            "subject_template": "{email}", "body_template": "New lead {email}",
+        })
+        db.add(setting)
+        for n in range(3):
+            lead = db_models.Lead(quiz_id=quiz.id, email=f"lead{n}@example.com")
+            db.add(lead)
+            db.flush()
+            db.add(db_models.IntegrationOutbox(
+                quiz_id=quiz.id, lead_id=lead.id, setting_id=setting.id, integration="email_notification",
+                payload={"email": lead.email},
+                status="pending", attempts=0, next_attempt_at=datetime.utcnow(),
+            ))
+        db.commit()
+
+    dispatch(integrations.OutboxDispatcher(async_engine))
+    assert [(r.status, r.attempts) for r in outbox_rows()] == [("sent", 0), ("sent", 0), ("pending", 1)]
+    assert "connection lost" in outbox_rows()[2].last_error
+
+    with SessionLocal() as db:
+        db.execute(update(db_models.IntegrationOutbox).values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.commit()
+    dispatch(integrations.OutboxDispatcher(async_engine))
+    assert {r.status for r in outbox_rows()} == {"sent"}
+    assert delivered == ["lead0@example.com", "lead1@example.com", "lead2@example.com"]
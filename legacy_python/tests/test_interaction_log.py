@@ -0,0 +1,92 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import threading
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from app import db_models
+from app.database import SessionLocal, async_engine
+from app.interaction_log import InteractionBuffer
+
+
+def _replay(spool_path, start):
+    start.wait()
+
+    async def run():
+        buffer = InteractionBuffer(async_engine, spool_path=spool_path)
+        await buffer._replay_spool()
+        await async_engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_workers_starting_together_replay_the_spool_once(tmp_path):
+    spool_path = str(tmp_path / "interactions.spool")
+    with open(spool_path, "w") as fh:
+        for n in range(300):
+            fh.write(json.dumps({
+                "quiz_id": None, "session_id": f"s{n}", "page_type": "home", "question_id": None,
+                "answer_value": None, "timestamp": datetime.utcnow().isoformat(),
+            }) + "\n")
+    start = multiprocessing.Event()
+    workers = [multiprocessing.Process(target=_replay, args=(spool_path, start)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    start.set()
+    for worker in workers:
+        worker.join(30)
+
+    with SessionLocal() as db:
+        assert db.scalar(select(func.count()).select_from(db_models.QuizInteraction)) == 300
+    assert [name for name in os.listdir(tmp_path) if "replaying" in name] == []
+    assert not os.path.exists(spool_path)
+
+
+def test_rows_being_flushed_stay_visible_until_committed(tmp_path):
+    seen_during_flush = []
+
+    async def run():
+        buffer = InteractionBuffer(async_engine, spool_path=str(tmp_path / "spool"))
+
+        async def observe(conn, rows):
+            seen_during_flush.extend(buffer.pending_for("visitor"))
+
+        buffer.flush_hooks.append(observe)
+        buffer.record(None, "visitor", "quiz", question_id=1, answer_value="a")
+        await buffer.flush()
+        after = buffer.pending_for("visitor")
+        await async_engine.dispose()
+        return after
+
+    assert asyncio.run(run()) == []
+    assert [row["answer_value"] for row in seen_during_flush] == ["a"]
+
+
+def test_overflow_is_spooled_off_the_event_loop(tmp_path):
+    spool_path = str(tmp_path / "spool")
+    spooled_on = []
+
+    async def run():
+        buffer = InteractionBuffer(async_engine, spool_path=spool_path, batch_size=2, max_pending=4)
+        spool = buffer._spool
+
+        def record_thread(rows):
+            spooled_on.append(threading.current_thread() is threading.main_thread())
+            spool(rows)
+
+        buffer._spool = record_thread
+        for n in range(5):
+            buffer.record(None, f"s{n}", "home")
+        # Nothing touched the file inside record(); the rows wait for the spooling task
+        assert spooled_on == [] and buffer.pending_for("s0")
+        await buffer._spool_task
+        assert buffer.pending == 2
+        await async_engine.dispose()
+
+    asyncio.run(run())
+    assert spooled_on == [False]
+    with open(spool_path) as fh:
+        assert [json.loads(line)["session_id"] for line in fh] == ["s0", "s1", "s2"]
@@ -0,0 +1,16 @@
+import tempfile
+
+from app import invalidation
+
+
+def test_default_bus_sits_next_to_a_sqlite_database(monkeypatch):
+    monkeypatch.setattr(invalidation, "SQLALCHEMY_DATABASE_URL", "sqlite:////srv/quiz/data/app.db")
+    assert invalidation._default_bus_url() == "sqlite:////srv/quiz/data/invalidation_bus.db"
+
+
+def test_default_bus_of_a_server_database_is_in_the_temp_dir(monkeypatch):
+    monkeypatch.setattr(invalidation, "SQLALCHEMY_DATABASE_URL", "postgresql://quiz@db/quiz")
+    first = invalidation._default_bus_url()
+    monkeypatch.setattr(invalidation, "SQLALCHEMY_DATABASE_URL", "postgresql://quiz@db/other")
+    assert first.startswith(f"sqlite:///{tempfile.gettempdir()}/")
+    assert invalidation._default_bus_url() != first
@@ -0,0 +1,30 @@
+from fastapi.testclient import TestClient
+
+import main
+from app import db_models
+from app.database import SessionLocal
+from app.listing import encode_cursor
+
+
+def test_cursors_with_wrong_types_are_rejected():
+    with TestClient(main.app) as client:
+        for cursor in (encode_cursor("1 OR 1=1"), encode_cursor(True), "not base64 json"):
+            assert client.get("/admin/quizzes", params={"format": "json", "cursor": cursor}).status_code == 400
+        for cursor in (encode_cursor("2026-10-17T00:00:00", "7"), encode_cursor(1, 7), encode_cursor("yesterday", 7)):
+            assert client.get("/admin/leads", params={"format": "json", "cursor": cursor}).status_code == 400
+        assert client.get("/admin/leads", params={
+            "format": "json", "cursor": encode_cursor("2026-10-17T00:00:00", 7),
+        }).status_code == 200
+
+
+def test_quiz_total_counts_rows_after_deletes():
+    with SessionLocal() as db:
+        quizzes = [db_models.Quiz(slug=f"q{i}", name=f"Quiz {i}", is_active=True) for i in range(3)]
+        db.add_all(quizzes)
+        db.flush()
+        db.delete(quizzes[0])
+        db.commit()
+
+    with TestClient(main.app) as client:
+        page = client.get("/admin/quizzes", params={"format": "json"}).json()
+    assert (page["total"], page["total_is_estimate"]) == (2, False)
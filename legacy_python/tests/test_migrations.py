@@ -0,0 +1,22 @@
+from alembic import command
+from sqlalchemy import create_engine, inspect
+
+from app import db_models, migrate
+
+
+def test_fresh_database_upgrades_downgrades_and_upgrades_again(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    migrate.upgrade(bind=engine)
+    tables = set(inspect(engine).get_table_names())
+    assert set(db_models.Base.metadata.tables) <= tables
+
+    with engine.begin() as connection:
+        command.downgrade(migrate.alembic_config(connection), "base")
+    assert set(inspect(engine).get_table_names()) <= {"alembic_version"}
+
+    migrate.upgrade(bind=engine)
+    # Every model column exists in the migrated schema
+    schema = inspect(engine)
+    for name, table in db_models.Base.metadata.tables.items():
+        assert {c.name for c in table.columns} <= {c["name"] for c in schema.get_columns(name)}, name
+    engine.dispose()
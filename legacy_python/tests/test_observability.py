@@ -0,0 +1,62 @@
+import re
+
+from fastapi.testclient import TestClient
+
+import main
+from app import db_models, observability
+from app.database import SessionLocal
+
+
+def series(text, name, **labels):
+    """Value of one sample in a /metrics body, 0 when absent."""
+    wanted = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    match = re.search(rf"^{re.escape(name)}\{{{re.escape(wanted)}\}} (\S+)$", text, re.M)
+    return float(match.group(1)) if match else 0
+
+
+def test_requests_report_their_queries_and_feed_the_histograms():
+    with SessionLocal() as db:
+        db.add(db_models.Quiz(slug="observed", name="Observed", is_active=True))
+        db.commit()
+
+    with TestClient(main.app) as client:
+        before = client.get("/metrics").text
+        response = client.get("/admin/quizzes")
+        timing = response.headers["Server-Timing"]
+        after = client.get("/metrics").text
+
+    queries = int(re.search(r'desc="(\d+) queries"', timing).group(1))
+    assert queries > 0
+    assert re.search(r"render;dur=[\d.]+, app;dur=[\d.]+$", timing)
+
+    labels = {"method": "GET", "route": "/admin/quizzes"}
+    assert series(after, "http_request_db_queries_count", **labels) == series(before, "http_request_db_queries_count", **labels) + 1
+    assert series(after, "http_request_db_queries_sum", **labels) == series(before, "http_request_db_queries_sum", **labels) + queries
+    status_labels = {**labels, "status": "200"}
+    assert (
+        series(after, "http_request_duration_seconds_count", **status_labels)
+        == series(before, "http_request_duration_seconds_count", **status_labels) + 1
+    )
+    # Scrapes are not counted
+    assert "/metrics" not in after
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = observability.Histogram("demo_queries", "Demo.", ("route",), (1, 5))
+    for value in (0, 1, 3, 9):
+        histogram.observe(("/x",), value)
+
+    assert histogram.render().splitlines()[2:] == [
+        'demo_queries_bucket{route="/x",le="1.0"} 2',
+        'demo_queries_bucket{route="/x",le="5.0"} 3',
+        'demo_queries_bucket{route="/x",le="+Inf"} 4',
+        'demo_queries_sum{route="/x"} 13.0',
+        'demo_queries_count{route="/x"} 4',
+    ]
+
+
+def test_counter_escapes_label_values():
+    counter = observability.Counter("demo_total", "Demo.", ("rule",))
+    counter.inc(('say "hi"',))
+    counter.inc(('say "hi"',), 2)
+    assert counter.render().splitlines()[2:] == ['demo_total{rule="say \\"hi\\""} 3']
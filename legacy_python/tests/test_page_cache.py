@@ -0,0 +1,62 @@
+from fastapi.testclient import TestClient
+
+import main
+from app import db_models, page_cache, quiz_cache
+from app.database import SessionLocal
+
+
+def make_quiz():
+    with SessionLocal() as db:
+        db.add(db_models.Quiz(slug="pages", name="Pages", description="Long " * 300, is_active=True))
+        db.commit()
+    quiz_cache.invalidate_quiz("pages")
+
+
+def test_page_is_rendered_once_per_key():
+    renders = []
+
+    def render():
+        renders.append(1)
+        return "<p>page</p>"
+
+    first = page_cache.get_page(("render-once", "v1"), render)
+    assert page_cache.get_page(("render-once", "v1"), render) is first
+    page_cache.get_page(("render-once", "v2"), render)
+    assert len(renders) == 2
+    page_cache.invalidate_pages("render-once")
+    page_cache.get_page(("render-once", "v1"), render)
+    assert len(renders) == 3
+
+
+def test_revalidation_returns_304_until_the_quiz_changes():
+    make_quiz()
+    with TestClient(main.app) as client:
+        plain = client.get("/quiz/pages", headers={"Accept-Encoding": "identity"})
+        assert plain.status_code == 200
+        etag = plain.headers["ETag"]
+        assert plain.headers["Vary"] == "Accept-Encoding"
+
+        again = client.get("/quiz/pages", headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+        assert (again.status_code, again.content, again.headers["ETag"]) == (304, b"", etag)
+
+        client.post("/admin/quizzes/pages/edit", data={"name": "Renamed", "is_active": "true"})
+        changed = client.get("/quiz/pages", headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+        assert "Renamed" in changed.text
+
+
+def test_gzip_is_a_separate_representation():
+    make_quiz()
+    with TestClient(main.app) as client:
+        plain = client.get("/quiz/pages", headers={"Accept-Encoding": "identity"})
+        zipped = client.get("/quiz/pages", headers={"Accept-Encoding": "gzip"})
+        assert zipped.headers["Content-Encoding"] == "gzip"
+        assert zipped.headers["ETag"] != plain.headers["ETag"]
+        assert zipped.content == plain.content
+
+        # A validator for one encoding does not revalidate the other
+        cross = client.get("/quiz/pages", headers={"Accept-Encoding": "gzip", "If-None-Match": plain.headers["ETag"]})
+        assert cross.status_code == 200
+        same = client.get("/quiz/pages", headers={"Accept-Encoding": "gzip", "If-None-Match": zipped.headers["ETag"]})
+        assert same.status_code == 304
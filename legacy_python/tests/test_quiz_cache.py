@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app import db_models, quiz_cache
+from app.database import AsyncSessionLocal, SessionLocal
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    quiz_cache.invalidate_quiz()
+    yield
+    quiz_cache.invalidate_quiz()
+
+
+def make_quiz(slug="cached"):
+    with SessionLocal() as db:
+        quiz = db_models.Quiz(slug=slug, name="Cached", is_active=True)
+        db.add(quiz)
+        db.flush()
+        db.add_all([
+            db_models.QuizQuestion(
+                quiz_id=quiz.id, question_text=f"Q{order}", question_type="multiple_choice", question_order=order,
+                answers=[{"value": "a", "label": "A"}], is_active=True,
+            )
+            for order in (2, 1)
+        ])
+        db.add(db_models.QuizQuestion(
+            quiz_id=quiz.id, question_text="Retired", question_type="multiple_choice", question_order=None,
+            answers=[], is_active=False,
+        ))
+        db.commit()
+        return quiz.id
+
+
+async def get(slug):
+    async with AsyncSessionLocal() as db:
+        return await quiz_cache.get_compiled_quiz(db, slug)
+
+
+def rename(quiz_id, name):
+    with SessionLocal() as db:
+        db.get(db_models.Quiz, quiz_id).name = name
+        db.commit()
+
+
+def test_snapshot_holds_active_questions_in_order():
+    make_quiz()
+    quiz = asyncio.run(get("cached"))
+
+    assert [q.question_text for q in quiz.questions] == ["Q1", "Q2"]
+    assert quiz.total_questions == 2
+    assert quiz.question_at(2).progress_percentage == 50
+    assert quiz.question_at(3) is None
+    with pytest.raises(TypeError):
+        quiz.question_at(1).answers[0]["label"] = "changed"
+
+
+def test_cached_until_invalidated_and_version_follows_content():
+    quiz_id = make_quiz()
+    first = asyncio.run(get("cached"))
+
+    rename(quiz_id, "Renamed")
+    assert asyncio.run(get("cached")) is first
+
+    quiz_cache.invalidate_quiz("cached")
+    renamed = asyncio.run(get("cached"))
+    assert renamed.name == "Renamed"
+    assert renamed.version != first.version
+
+
+def test_unknown_slug_is_not_cached():
+    assert asyncio.run(get("cached")) is None
+    make_quiz()
+    assert asyncio.run(get("cached")).slug == "cached"
+
+
+def test_admin_edit_is_visible_on_the_next_request():
+    make_quiz()
+    with TestClient(main.app) as client:
+        assert client.get("/api/quiz/cached").json()["quiz"]["name"] == "Cached"
+        client.post("/admin/quizzes/cached/edit", data={"name": "Edited", "is_active": "true"})
+        assert client.get("/api/quiz/cached").json()["quiz"]["name"] == "Edited"
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+
+from app import db_models, quiz_settings
+from app.database import AsyncSessionLocal, SessionLocal
+
+
+def add_settings(*rows):
+    with SessionLocal() as db:
+        quiz = db_models.Quiz(slug="settings", name="Settings", is_active=True)
+        db.add(quiz)
+        db.flush()
+        db.add_all([db_models.QuizSetting(quiz_id=quiz.id, kind=kind, is_active=active, config=config) for kind, config, active in rows])
+        db.commit()
+        return quiz.id
+
+
+async def load(quiz_id):
+    async with AsyncSessionLocal() as db:
+        return await quiz_settings.load_config(db, quiz_id)
+
+
+GTM = {"gtm_id": "GTM-1", "is_enabled": True, "name": "Tags"}
+HUBSPOT = {"portal_id": "1", "form_guid": "f", "is_enabled": True, "property_mappings": {}}
+
+
+def test_snapshot_resolves_every_kind_from_one_query():
+    quiz_id = add_settings(
+        ("general", {"show_branding": True}, True),
+        ("general", {"show_branding": False, "footer_text": "Newest"}, True),
+        ("general", {"footer_text": "Inactive"}, False),
+        ("google_tag_manager", GTM, True),
+        ("google_tag_manager", {**GTM, "gtm_id": "GTM-2", "is_enabled": False}, True),
+        ("hubspot", HUBSPOT, True),
+        ("hubspot", {"portal_id": "missing form_guid"}, True),
+    )
+    config = asyncio.run(load(quiz_id))
+
+    # The newest active row of a single-valued kind wins
+    assert (config.general.footer_text, config.general.show_branding) == ("Newest", False)
+    assert [t.gtm_id for t in config.tracking] == ["GTM-1"]
+    # The invalid HubSpot row is skipped instead of failing the whole quiz
+    assert [(kind, s.portal_id) for _, kind, s in config.integrations] == [("hubspot", "1")]
+    assert config.design is None
+    with pytest.raises(ValidationError):
+        config.general.footer_text = "mutated"
+
+    public = quiz_settings.public_settings(config)
+    assert public["tracking"] == {"google_tag_manager": [GTM]}
+    assert "integrations" not in public and "quiz_id" not in public["general"]
+
+
+def test_defaults_without_rows_and_version_follows_content():
+    quiz_id = add_settings()
+    empty = asyncio.run(load(quiz_id))
+    assert empty.general.model_dump() == quiz_settings.validate_config("general", quiz_id, {}).model_dump()
+    assert (empty.tracking, empty.integrations) == ((), ())
+
+    with SessionLocal() as db:
+        db.add(db_models.QuizSetting(quiz_id=quiz_id, kind="general", is_active=True, config={"footer_text": "x"}))
+        db.commit()
+    assert asyncio.run(load(quiz_id)).version != empty.version
+
+
+def test_resolve_is_cached_until_invalidated():
+    quiz_id = add_settings(("general", {"footer_text": "Before"}, True))
+
+    async def resolve():
+        async with AsyncSessionLocal() as db:
+            return await quiz_settings.resolve(db, quiz_id)
+
+    quiz_settings.invalidate_settings(quiz_id)
+    first = asyncio.run(resolve())
+    with SessionLocal() as db:
+        db.query(db_models.QuizSetting).update({"config": {"footer_text": "After"}})
+        db.commit()
+    assert asyncio.run(resolve()) is first
+
+    quiz_settings.invalidate_settings(quiz_id)
+    assert asyncio.run(resolve()).general.footer_text == "After"
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import observability, rate_limit, sessions
+
+RULES = (
+    rate_limit._rule("answer", r"^POST /quiz/[^/]+/question/\d+$", "0.001", "2", by_session=True),
+    rate_limit._rule("lead", r"^POST /quiz/[^/]+/lead-form$", "0.001", "2"),
+    rate_limit._rule("writes", r"^POST /quiz/", "0.001", "3"),
+)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_TRUST_FORWARDED", True)
+    handled = []
+    app = FastAPI()
+
+    @app.post("/quiz/{slug}/{step:path}")
+    async def write(slug: str, step: str):
+        handled.append(step)
+        return {"ok": True}
+
+    @app.get("/quiz/{slug}")
+    async def read(slug: str):
+        return {"ok": True}
+
+    app.add_middleware(rate_limit.RateLimitMiddleware, limiter=rate_limit.MemoryLimiter(), rules=RULES)
+    with TestClient(app) as test_client:
+        test_client.handled = handled
+        yield test_client
+
+
+def shed(rule, reason):
+    return observability.REQUESTS_SHED._series.get((rule, reason), 0)
+
+
+def post(client, path, ip="10.0.0.1", **kwargs):
+    return client.post(path, headers={"X-Forwarded-For": ip, **kwargs.pop("headers", {})}, **kwargs)
+
+
+def test_over_limit_requests_get_429_before_routing(client):
+    before = shed("lead", "rate")
+    assert [post(client, "/quiz/q/lead-form").status_code for _ in range(3)] == [200, 200, 429]
+
+    rejected = post(client, "/quiz/q/lead-form")
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) > 0
+    assert client.handled == ["lead-form", "lead-form"]
+    assert shed("lead", "rate") == before + 2
+
+    # Other addresses and unmatched routes keep their own budget
+    assert post(client, "/quiz/q/lead-form", ip="10.0.0.2").status_code == 200
+    assert client.get("/quiz/q", headers={"X-Forwarded-For": "10.0.0.1"}).status_code == 200
+
+
+def test_answers_are_limited_per_session_and_capped_per_ip(client):
+    cookies = [
+        sessions.encode_token(sessions.SessionToken(session_id=f"s{n}", quiz_id=1)) for n in range(2)
+    ]
+
+    def answer(cookie):
+        client.cookies.set(sessions.SESSION_COOKIE_NAME, cookie)
+        return post(client, "/quiz/q/question/1").status_code
+
+    assert [answer(cookies[0]) for _ in range(3)] == [200, 200, 429]
+    # A fresh session has its own answer bucket, until the per-IP writes rule runs dry
+    assert [answer(cookies[1]) for _ in range(2)] == [200, 429]
+    assert client.handled == ["question/1"] * 3
+
+
+def test_posts_without_user_agent_are_shed_as_bots(client):
+    before = shed("lead", "bot")
+    response = post(client, "/quiz/q/lead-form", headers={"User-Agent": ""})
+    assert response.status_code == 403
+    assert client.handled == []
+    assert shed("lead", "bot") == before + 1
+
+
+def test_memory_buckets_refill_and_evict(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    limiter = rate_limit.MemoryLimiter(max_buckets=2)
+
+    async def take(key):
+        return await limiter.acquire(key, rate=0.5, burst=1)
+
+    assert asyncio.run(take("a")) == 0
+    assert asyncio.run(take("a")) == pytest.approx(2.0)
+    now[0] += 2
+    assert asyncio.run(take("a")) == 0
+
+    asyncio.run(take("b"))
+    asyncio.run(take("c"))
+    # "a" was least recently used and starts over with a full bucket
+    assert list(limiter._buckets) == ["b", "c"]
+    assert asyncio.run(take("a")) == 0
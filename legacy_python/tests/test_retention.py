@@ -0,0 +1,51 @@
+import asyncio
+import glob
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+from app import db_models, retention
+from app.database import SessionLocal, async_engine
+
+INTERACTIONS = next(target for target in retention.TARGETS if target.name == "interactions")
+
+
+def make_interactions(count):
+    old = datetime.utcnow() - timedelta(days=365)
+    with SessionLocal() as db:
+        quiz = db_models.Quiz(slug="retention", name="Retention", is_active=True)
+        db.add(quiz)
+        db.flush()
+        db.add_all([
+            db_models.QuizInteraction(quiz_id=quiz.id, session_id=f"s{i}", page_type="home", timestamp=old)
+            for i in range(count)
+        ])
+        db.commit()
+        rows = [{"id": i.id, "quiz_id": quiz.id} for i in db.query(db_models.QuizInteraction).order_by("id")]
+        return quiz.id, rows
+
+
+async def archive(quiz_id):
+    async with async_engine.connect() as conn:
+        return await retention.archive_quiz(conn, INTERACTIONS, quiz_id, datetime.utcnow() - timedelta(days=1))
+
+
+def archived_ids(directory):
+    ids = []
+    for path in glob.glob(os.path.join(directory, "*.ndjson.gz")):
+        with gzip.open(path, "rt") as fh:
+            ids.extend(json.loads(line)["id"] for line in fh)
+    return sorted(ids)
+
+
+def test_rerun_after_a_crash_archives_each_row_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(retention, "RETENTION_ARCHIVE_DIR", str(tmp_path))
+    quiz_id, rows = make_interactions(10)
+    directory = os.path.join(tmp_path, "interactions", f"quiz_{quiz_id}")
+    # A run that wrote its first batch and died before deleting it
+    retention.write_archive(directory, rows[:6])
+
+    monkeypatch.setattr(retention, "RETENTION_BATCH_SIZE", 4)
+    assert asyncio.run(archive(quiz_id)) == 10
+    assert archived_ids(directory) == [row["id"] for row in rows]
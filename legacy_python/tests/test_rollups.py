@@ -0,0 +1,63 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+import main
+from app import analytics, db_models
+from app.database import AsyncSessionLocal, SessionLocal
+from app.interaction_log import interaction_buffer
+
+
+def make_quiz():
+    with SessionLocal() as db:
+        quiz = db_models.Quiz(slug="rollups", name="Rollups", is_active=True)
+        db.add(quiz)
+        db.flush()
+        question = db_models.QuizQuestion(
+            quiz_id=quiz.id, question_text="Goal?", question_type="multiple_choice", question_order=1,
+            answers=[{"value": "leads", "label": "Leads"}], is_active=True,
+        )
+        db.add(question)
+        db.commit()
+        return quiz.id, question.id
+
+
+async def funnel(quiz_id):
+    async with AsyncSessionLocal() as db:
+        return await analytics.funnel(db, quiz_id)
+
+
+def test_restarted_app_counts_each_answer_once():
+    quiz_id, question_id = make_quiz()
+    with TestClient(main.app):
+        pass
+    with TestClient(main.app) as client:
+        client.get("/quiz/rollups/start")
+        client.post("/quiz/rollups/question/1", data={"answer": "leads"})
+
+    assert interaction_buffer.flush_hooks.count(main.rollups.apply_interactions) == 1
+    with SessionLocal() as db:
+        count = db.scalar(select(db_models.AnswerCount.count).where(
+            db_models.AnswerCount.quiz_id == quiz_id, db_models.AnswerCount.question_id == question_id,
+        ))
+    assert count == 1
+
+
+def test_funnel_counts_each_session_once_per_question():
+    quiz_id, question_id = make_quiz()
+    with TestClient(main.app) as client:
+        client.get("/quiz/rollups/start")
+        client.post("/quiz/rollups/question/1", data={"answer": "leads"})
+        client.post("/quiz/rollups/question/1", data={"answer": "leads"})
+        returning = dict(client.cookies)
+        client.cookies.clear()
+        client.get("/quiz/rollups/start")
+        client.post("/quiz/rollups/question/1", data={"answer": "leads"})
+    # A later batch holding another answer of the same session
+    with TestClient(main.app, cookies=returning) as client:
+        client.post("/quiz/rollups/question/1", data={"answer": "leads"})
+
+    analytics.clear_cache()
+    [step] = asyncio.run(funnel(quiz_id))["steps"]
+    assert (step["sessions"], step["answers"], step["drop_off"]) == (2, 4, 0)
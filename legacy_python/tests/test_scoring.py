@@ -0,0 +1,111 @@
+import asyncio
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+import main
+from app import db_models
+from app.database import AsyncSessionLocal, SessionLocal
+from app.quiz_cache import compile_quiz
+from app.scoring import build_rule_index, rescore_sessions
+
+
+def make_quiz():
+    with SessionLocal() as db:
+        quiz = db_models.Quiz(slug="scoring", name="Scoring", is_active=True)
+        db.add(quiz)
+        db.flush()
+        question = db_models.QuizQuestion(
+            quiz_id=quiz.id, question_text="Budget?", question_type="multiple_choice", question_order=1,
+            answers=[{"value": "low", "label": "Low", "score": 1}, {"value": "high", "label": "High", "score": 10}],
+            is_active=True,
+        )
+        low = db_models.ThankYouPage(quiz_id=quiz.id, name="Low", headline="Starter", body_content="", is_active=True)
+        high = db_models.ThankYouPage(quiz_id=quiz.id, name="High", headline="Premium", body_content="", is_active=True)
+        db.add_all([question, low, high])
+        db.flush()
+        db.add(db_models.ResultRule(
+            quiz_id=quiz.id, name="Everyone", min_score=0, max_score=100, thank_you_page_id=low.id, is_active=True,
+        ))
+        answers = {str(question.id): "high"}
+        db.add_all([
+            db_models.QuizSession(session_id="done", quiz_id=quiz.id, quiz_answers=answers, completed_at=datetime.utcnow()),
+            db_models.QuizSession(session_id="abandoned", quiz_id=quiz.id, quiz_answers=answers),
+            db_models.Lead(quiz_id=quiz.id, session_id="done", email="a@example.com", quiz_answers=answers),
+            db_models.Lead(quiz_id=quiz.id, session_id="archived", email="b@example.com", quiz_answers=answers),
+        ])
+        db.commit()
+        return quiz.id, high.id
+
+
+async def compiled_quiz():
+    async with AsyncSessionLocal() as db:
+        return await compile_quiz(db, "scoring")
+
+
+def test_rescore_updates_completed_sessions_and_their_leads():
+    quiz_id, high_page_id = make_quiz()
+    with SessionLocal() as db:
+        db.add(db_models.ResultRule(
+            quiz_id=quiz_id, name="Big budget", min_score=10, max_score=100,
+            thank_you_page_id=high_page_id, is_active=True,
+        ))
+        db.query(db_models.ResultRule).filter_by(name="Everyone").update({"max_score": 9})
+        db.commit()
+
+    with SessionLocal() as db:
+        totals = rescore_sessions(db, asyncio.run(compiled_quiz()))
+    assert totals == {"sessions": 1, "leads": 2}
+
+    with SessionLocal() as db:
+        results = {s.session_id: s.quiz_result for s in db.query(db_models.QuizSession)}
+        leads = {l.email: (l.quiz_score, l.quiz_outcome_headline) for l in db.query(db_models.Lead)}
+    assert results["done"]["headline"] == "Premium"
+    assert results["abandoned"] is None
+    assert leads == {"a@example.com": (10.0, "Premium"), "b@example.com": (10.0, "Premium")}
+
+
+def test_result_rule_rejects_bad_input():
+    quiz_id, high_page_id = make_quiz()
+    with SessionLocal() as db:
+        other = db_models.Quiz(slug="other", name="Other", is_active=True)
+        db.add(other)
+        db.flush()
+        foreign = db_models.ThankYouPage(quiz_id=other.id, name="X", headline="X", body_content="", is_active=True)
+        db.add(foreign)
+        db.commit()
+        foreign_id = foreign.id
+
+    rule = {"name": "R", "min_score": 101, "max_score": 105, "is_active": True}
+    with TestClient(main.app) as client:
+        url = "/admin/quizzes/scoring/result-rules"
+        assert client.post(url, json={**rule, "thank_you_page_id": "abc"}).status_code == 400
+        assert client.post(url, json={**rule, "thank_you_page_id": str(foreign_id)}).status_code == 404
+        assert client.post(url, json={**rule, "min_score": 109, "thank_you_page_id": str(high_page_id)}).status_code == 400
+        assert client.post(url, json={**rule, "thank_you_page_id": str(high_page_id)}).status_code == 200
+
+
+def test_overlapping_rules_resolve_to_the_enclosing_rule():
+    quiz_id, high_page_id = make_quiz()
+    with SessionLocal() as db:
+        # Rows from before the API rejected overlaps: Everyone [0, 100] encloses Narrow [5, 8]
+        db.add(db_models.ResultRule(
+            quiz_id=quiz_id, name="Narrow", min_score=5, max_score=8, thank_you_page_id=high_page_id, is_active=True,
+        ))
+        db.commit()
+        rules = db.query(db_models.ResultRule).all()
+        pages = db.query(db_models.ThankYouPage).all()
+        everyone = next(r.id for r in rules if r.name == "Everyone")
+
+    index = build_rule_index(rules, pages)
+    assert index.resolve(10)[0] == everyone
+    assert index.resolve(3)[0] == everyone
+    with SessionLocal() as db:
+        rescore_sessions(db, asyncio.run(compiled_quiz()))
+        result = db.query(db_models.QuizSession).filter_by(session_id="done").one().quiz_result
+    assert (result["score"], result["rule_id"], result["headline"]) == (10.0, everyone, "Starter")
+
+    rule = {"name": "Inner", "min_score": 40, "max_score": 60, "is_active": True, "thank_you_page_id": str(high_page_id)}
+    with TestClient(main.app) as client:
+        assert client.post("/admin/quizzes/scoring/result-rules", json=rule).status_code == 400
+        assert client.post("/admin/quizzes/scoring/result-rules", json={**rule, "min_score": 101, "max_score": 120}).status_code == 200
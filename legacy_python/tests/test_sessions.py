@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app import bootstrap, db_models, sessions
+from app.database import AsyncSessionLocal, SessionLocal
+from app.interaction_log import interaction_buffer
+
+
+async def load():
+    async with AsyncSessionLocal() as db:
+        await sessions.load_session_secret(db)
+    return sessions.SESSION_SECRET
+
+
+def test_workers_share_the_secret_bootstrap_stored(monkeypatch):
+    monkeypatch.delenv("SESSION_SECRET")
+    monkeypatch.setattr(sessions, "SESSION_SECRET", None)
+    with pytest.raises(RuntimeError):
+        asyncio.run(load())
+
+    bootstrap.ensure_ready(seed=False)
+    bootstrap.ensure_ready(seed=False)
+    first = asyncio.run(load())
+    cookie = sessions.encode_token(sessions.SessionToken(session_id="abc", quiz_id=1))
+
+    # Another worker, or this one after a restart
+    monkeypatch.setattr(sessions, "SESSION_SECRET", None)
+    assert asyncio.run(load()) == first
+    assert sessions.decode_token(cookie) == sessions.SessionToken(session_id="abc", quiz_id=1)
+
+
+def test_lead_form_sees_answers_buffered_by_another_worker():
+    with SessionLocal() as db:
+        quiz = db_models.Quiz(slug="sessions", name="Sessions", is_active=True)
+        db.add(quiz)
+        db.flush()
+        question = db_models.QuizQuestion(
+            quiz_id=quiz.id, question_text="Budget?", question_type="multiple_choice", question_order=1,
+            answers=[{"value": "high", "label": "High", "score": 10}], is_active=True,
+        )
+        db.add(question)
+        db.commit()
+        question_id = question.id
+
+    with TestClient(main.app) as client:
+        client.get("/quiz/sessions/start")
+        client.post("/quiz/sessions/question/1", data={"answer": "high"})
+        # The answer's interaction row is still in the buffer of the worker that took it
+        interaction_buffer._pending.clear()
+        client.post("/quiz/sessions/lead-form", data={"email": "a@example.com"})
+
+    with SessionLocal() as db:
+        lead = db.query(db_models.Lead).one()
+    assert (lead.quiz_answers, lead.quiz_score) == ({str(question_id): "high"}, 10.0)
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+from sqlalchemy import update
+
+from app import db_models, sync
+from app.database import SessionLocal
+
+
+class ListSink:
+    def __init__(self):
+        self.rows = {}
+
+    def write(self, entity_type, rows):
+        self.rows.setdefault(entity_type, []).extend(rows)
+
+    def ids(self, entity_type):
+        return [row["id"] for row in self.rows.pop(entity_type, [])]
+
+
+def make_quiz():
+    with SessionLocal() as db:
+        quiz = db_models.Quiz(slug="sync", name="Sync", is_active=True)
+        db.add(quiz)
+        db.commit()
+        return quiz.id
+
+
+def test_rows_committed_below_the_watermark_are_synced():
+    quiz_id = make_quiz()
+    sink = ListSink()
+    with SessionLocal() as db:
+        db.add_all([db_models.Lead(id=i, quiz_id=quiz_id, email=f"{i}@example.com") for i in (1, 2, 5)])
+        db.commit()
+        assert sync.sync_entity(db, sink, "leads") == 3
+        assert sink.ids("leads") == [1, 2, 5]
+
+        # ids 3 and 4 were assigned before id 5; only 3 has committed since
+        db.add(db_models.Lead(id=3, quiz_id=quiz_id, email="3@example.com"))
+        db.commit()
+        assert sync.sync_entity(db, sink, "leads") == 1
+        assert sink.ids("leads") == [3]
+
+        state = db.get(db_models.SyncState, "leads")
+        assert (state.last_synced_id, state.records_synced) == (5, 4)
+        assert [gap[:2] for gap in state.id_gaps] == [[4, 4]]
+
+
+def test_idle_runs_send_nothing_and_old_gaps_expire(monkeypatch):
+    quiz_id = make_quiz()
+    sink = ListSink()
+    with SessionLocal() as db:
+        db.add_all([db_models.Lead(id=i, quiz_id=quiz_id, email=f"{i}@example.com") for i in (1, 3)])
+        db.commit()
+        sync.sync_entity(db, sink, "leads")
+        sink.rows.clear()
+
+        assert sync.sync_entity(db, sink, "leads") == 0
+        assert sink.rows == {}
+        monkeypatch.setattr(sync, "SYNC_GAP_TIMEOUT_SECONDS", -1)
+        sync.sync_entity(db, sink, "leads")
+        state = db.get(db_models.SyncState, "leads")
+        assert (state.id_gaps, state.records_synced) == ([], 2)
+
+
+def test_changed_sessions_are_synced_again():
+    quiz_id = make_quiz()
+    sink = ListSink()
+    with SessionLocal() as db:
+        db.add(db_models.QuizSession(session_id="s1", quiz_id=quiz_id))
+        db.commit()
+        sync.sync_entity(db, sink, "sessions")
+        [exported] = sink.rows.pop("sessions")
+        assert exported["completed_at"] is None
+
+        db.execute(update(db_models.QuizSession).values(completed_at=datetime.utcnow()))
+        db.commit()
+        sync.sync_entity(db, sink, "sessions")
+        assert sink.rows["sessions"][-1]["completed_at"] is not None